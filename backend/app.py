@@ -1,11 +1,25 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
 import os
 from flask import Flask
 from flask_cors import CORS
 
-from crop_tracker.model import init_db
+from crop_tracker import startup
+from crop_tracker.model import ensure_schema
+from crop_tracker.scheduler import start_scheduler
 from crop_tracker.crops import auth_routes, crop_routes
 from crop_tracker.harvest import harvest_routes
 from crop_tracker.prediction import prediction_routes
+from crop_tracker.sync import sync_routes
+from crop_tracker.reports import report_routes
+from crop_tracker.admin import admin_routes
+from crop_tracker.orgs import org_routes
+from crop_tracker.profiling import init_profiling
+from crop_tracker.admission import init_admission
+
+startup.start(STARTUP_T0)
+startup.mark("imports")
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "MYSECRET_KEY")
@@ -23,14 +37,34 @@ CORS(
     supports_credentials=True,
 )
 
-# Initialize DB (SQLite local or whatever you use)
-init_db()
+# Load shedding first: a rejected request should cost as little as possible
+init_admission(app)
+
+# Per-request profiling (PROFILING_ENABLED=1 + "X-Profile: 1" header)
+init_profiling(app)
+
+# Initialize DB lazily: schema is checked on the first request, and the
+# DDL is skipped entirely when the stored schema version is current.
+# Background jobs (scheduler.py) start with it, once per process.
+@app.before_request
+def schema_check():
+    ensure_schema()
+    startup.mark("schema_ready")
+    start_scheduler()
+
+startup.init_startup_report(app)
 
 # Register Blueprints
 app.register_blueprint(auth_routes)
 app.register_blueprint(crop_routes)
 app.register_blueprint(harvest_routes)
 app.register_blueprint(prediction_routes)
+app.register_blueprint(sync_routes)
+app.register_blueprint(report_routes)
+app.register_blueprint(admin_routes)
+app.register_blueprint(org_routes)
+
+startup.mark("app_ready")
 
 @app.route("/")
 def index():
@@ -0,0 +1,197 @@
+# bench_analytics.py — crop-year filter / top-crops-yearly: one statement vs three
+#
+#   SQLITE_PATH=/tmp/bench.db python -m benchmarks.bench_analytics --harvests-per-user 500000
+#   python -m benchmarks.bench_analytics --skip-generate --user-id 1
+#
+# "legacy" is the original three-queries-per-endpoint implementation, kept
+# here for timing and to check that both return identical results (floats
+# compared to 1e-6: SUM order follows the query plan in either version).
+import json
+import time
+import argparse
+
+from benchmarks.datagen import generate, CROP_MIX
+from crop_tracker.model import get_db
+from crop_tracker.croptypes import lookup_crop_type
+from crop_tracker.harvest import (
+    is_postgres, ph, row_to_dict, rows_to_list, crop_year_stats, top_crops_by_year,
+)
+
+
+# -------------------------------
+# Legacy: three queries per endpoint
+# -------------------------------
+def legacy_crop_year_stats(conn, cur, user_id, crop_type_id, year):
+    p = ph(conn)
+    if is_postgres(conn):
+        year_expr, month_expr = "EXTRACT(YEAR FROM h.date)::INT", "EXTRACT(MONTH FROM h.date)::INT"
+        planted_year_expr = "EXTRACT(YEAR FROM planting_date)::INT"
+    else:
+        year_expr, month_expr = "CAST(strftime('%Y', h.date) AS INTEGER)", "CAST(strftime('%m', h.date) AS INTEGER)"
+        planted_year_expr = "CAST(strftime('%Y', planting_date) AS INTEGER)"
+
+    cur.execute(f"""
+        SELECT COUNT(*) AS planted_count
+        FROM crops
+        WHERE user_id = {p} AND crop_type_id = {p} AND {planted_year_expr} = {p}
+    """, (user_id, crop_type_id, year))
+    planted_row = row_to_dict(cur.fetchone())
+
+    cur.execute(f"""
+        SELECT COUNT(h.id) AS harvest_events,
+               COALESCE(SUM(h.yield_amount), 0) AS total_yield,
+               COALESCE(AVG(h.yield_amount), 0) AS avg_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p} AND c.crop_type_id = {p} AND {year_expr} = {p}
+    """, (user_id, crop_type_id, year))
+    harvest_row = row_to_dict(cur.fetchone())
+
+    cur.execute(f"""
+        SELECT {month_expr} AS month,
+               COALESCE(SUM(h.yield_amount), 0) AS total_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p} AND c.crop_type_id = {p} AND {year_expr} = {p}
+        GROUP BY month
+        ORDER BY month
+    """, (user_id, crop_type_id, year))
+    monthly_rows = rows_to_list(cur.fetchall())
+
+    return {
+        "planted_count": int(planted_row.get("planted_count") or 0),
+        "harvest_events": int(harvest_row.get("harvest_events") or 0),
+        "total_yield": float(harvest_row.get("total_yield") or 0),
+        "avg_yield": float(harvest_row.get("avg_yield") or 0),
+        "monthly": [{"month": int(r["month"]), "total_yield": float(r.get("total_yield") or 0)} for r in monthly_rows],
+    }
+
+def legacy_top_crops_by_year(conn, cur, user_id, year_from, year_to, top_n):
+    p = ph(conn)
+    if is_postgres(conn):
+        year_expr = "EXTRACT(YEAR FROM h.date)::INT"
+    else:
+        year_expr = "CAST(strftime('%Y', h.date) AS INTEGER)"
+
+    cur.execute(f"""
+        SELECT t.id AS crop_type_id, t.name AS crop_name, SUM(h.yield_amount) AS total_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        JOIN crop_types t ON t.id = c.crop_type_id
+        WHERE c.user_id = {p} AND {year_expr} BETWEEN {p} AND {p}
+        GROUP BY t.id, t.name
+        ORDER BY total_yield DESC
+        LIMIT {int(top_n)}
+    """, (user_id, year_from, year_to))
+    top_rows = rows_to_list(cur.fetchall())
+    top_names = [r["crop_name"] for r in top_rows]
+    top_ids = [int(r["crop_type_id"]) for r in top_rows]
+
+    cur.execute(f"""
+        SELECT {year_expr} AS year, SUM(h.yield_amount) AS total_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p} AND {year_expr} BETWEEN {p} AND {p}
+        GROUP BY year
+    """, (user_id, year_from, year_to))
+    all_total_by_year = {int(r["year"]): float(r.get("total_yield") or 0) for r in rows_to_list(cur.fetchall())}
+
+    top_year_crop = []
+    if top_ids:
+        cur.execute(f"""
+            SELECT {year_expr} AS year, t.name AS crop_name, SUM(h.yield_amount) AS total_yield
+            FROM harvests h
+            JOIN crops c ON h.crop_id = c.id
+            JOIN crop_types t ON t.id = c.crop_type_id
+            WHERE c.user_id = {p} AND {year_expr} BETWEEN {p} AND {p}
+              AND c.crop_type_id IN ({",".join([p] * len(top_ids))})
+            GROUP BY year, t.id, t.name
+        """, (user_id, year_from, year_to, *top_ids))
+        top_year_crop = rows_to_list(cur.fetchall())
+
+    years = list(range(year_from, year_to + 1))
+    year_map = {y: {"year": str(y)} for y in years}
+    for r in top_year_crop:
+        year_map[int(r["year"])][r["crop_name"]] = float(r.get("total_yield") or 0)
+    for y in years:
+        for name in top_names:
+            year_map[y].setdefault(name, 0.0)
+        top_sum = sum(year_map[y][name] for name in top_names)
+        year_map[y]["Others"] = max(0.0, all_total_by_year.get(y, 0.0) - top_sum)
+    return top_names, [year_map[y] for y in years]
+
+
+# -------------------------------
+# Runner
+# -------------------------------
+def timed(fn, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0, out
+
+def same_result(a, b, tol=1e-6):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_result(a[k], b[k], tol) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_result(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(float(a) - float(b)) <= tol * max(1.0, abs(float(a)))
+    return a == b
+
+def user_years(conn, cur, user_id):
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT MIN(h.date) AS first_date, MAX(h.date) AS last_date
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p}
+    """, (user_id,))
+    row = row_to_dict(cur.fetchone())
+    return int(str(row["first_date"])[:4]), int(str(row["last_date"])[:4])
+
+def bench(user_id, repeat=3, top_n=5):
+    conn = get_db()
+    cur = conn.cursor()
+    year_from, year_to = user_years(conn, cur, user_id)
+    results = {"user_id": user_id, "years": [year_from, year_to], "routes": {}}
+
+    legacy_ms, legacy = timed(lambda: legacy_top_crops_by_year(conn, cur, user_id, year_from, year_to, top_n), repeat)
+    single_ms, single = timed(lambda: top_crops_by_year(conn, cur, user_id, year_from, year_to, top_n), repeat)
+    results["routes"]["top_crops_yearly"] = {
+        "legacy_ms": round(legacy_ms, 2), "single_ms": round(single_ms, 2), "identical": same_result(legacy, single),
+    }
+
+    crop_type_id = lookup_crop_type(cur, is_postgres(conn), next(iter(CROP_MIX)))
+    year = (year_from + year_to) // 2
+    legacy_ms, legacy = timed(lambda: legacy_crop_year_stats(conn, cur, user_id, crop_type_id, year), repeat)
+    single_ms, single = timed(lambda: crop_year_stats(conn, cur, user_id, crop_type_id, year), repeat)
+    results["routes"]["crop_year_filter"] = {
+        "legacy_ms": round(legacy_ms, 2), "single_ms": round(single_ms, 2), "identical": same_result(legacy, single),
+    }
+    conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-statement analytics benchmark")
+    parser.add_argument("--harvests-per-user", type=int, default=500_000)
+    parser.add_argument("--crops", type=int, default=50, help="plantings per season")
+    parser.add_argument("--seasons", type=int, default=20)
+    parser.add_argument("--skip-generate", action="store_true", help="reuse the existing dataset")
+    parser.add_argument("--user-id", type=int, help="user to benchmark (with --skip-generate)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.skip_generate:
+        user_id = args.user_id
+    else:
+        per_planting = max(1, args.harvests_per_user // (args.crops * args.seasons))
+        user_id = generate(1, args.crops, args.seasons, per_planting, args.seed)[0]
+
+    result = bench(user_id, args.repeat)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,121 @@
+# bench_partitions.py — year-range analytics: one harvests table vs year partitions
+#
+#   SQLITE_PATH=/tmp/bench.db HARVEST_PARTITION_DIR=/tmp/bench_parts \
+#       python -m benchmarks.bench_partitions --harvests 10000000
+#
+# Generates the dataset into one table, times top-crops-yearly, seasonality
+# and distribution over a narrow (one year) and a wide (all years) range,
+# partitions (see crop_tracker/partitions.py), times again and checks both
+# layouts return the same results. --compact-before additionally archives
+# the older years and times the rollup-backed queries.
+import json
+import time
+import argparse
+from datetime import date
+
+from benchmarks.datagen import generate
+from crop_tracker.model import get_db
+from crop_tracker.harvest import top_crops_by_year, seasonality_by_month, yield_distribution
+from crop_tracker.partitions import (
+    is_postgres, partition_files, pg_partition, sqlite_partition, compact,
+)
+
+ROUTES = {
+    "top_crops_yearly": lambda conn, cur, u, a, b: top_crops_by_year(conn, cur, u, a, b, 5),
+    "seasonality": seasonality_by_month,
+    "distribution": yield_distribution,
+}
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0, out
+
+def same_result(a, b, tol=1e-6):
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_result(a[k], b[k], tol) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_result(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(float(a) - float(b)) <= tol * max(1.0, abs(float(a)))
+    return a == b
+
+def run_queries(user_ids, ranges, repeat):
+    """{route/range: ms summed over users}, {route/range: results}"""
+    conn = get_db()
+    cur = conn.cursor()
+    times, results = {}, {}
+    for label, (year_from, year_to) in ranges.items():
+        for name, fn in ROUTES.items():
+            key = f"{name}/{label}"
+            times[key], results[key] = 0.0, []
+            for u in user_ids:
+                ms, out = timed(lambda: fn(conn, cur, u, year_from, year_to), repeat)
+                times[key] += ms
+                results[key].append(out)
+            times[key] = round(times[key], 2)
+    conn.close()
+    return times, results
+
+def bench(user_ids, first_year, last_year, repeat=3, compact_before=None):
+    narrow = last_year - 1
+    # harvests run into the year after the last planting season
+    ranges = {"narrow": (narrow, narrow), "wide": (first_year, last_year + 1)}
+    out = {"users": len(user_ids), "ranges": ranges, "layouts": {}}
+
+    times, baseline = run_queries(user_ids, ranges, repeat)
+    out["layouts"]["single_table"] = times
+
+    conn = get_db(role="schema")
+    cur = conn.cursor()
+    t0 = time.perf_counter()
+    pg_partition(conn, cur) if is_postgres(conn) else sqlite_partition(conn, cur, last_year)
+    out["partition_s"] = round(time.perf_counter() - t0, 2)
+    conn.close()
+
+    times, results = run_queries(user_ids, ranges, repeat)
+    out["layouts"]["partitioned"] = dict(times, identical=same_result(baseline, results))
+
+    if compact_before:
+        conn = get_db(role="schema")
+        cur = conn.cursor()
+        t0 = time.perf_counter()
+        compact(conn, cur, compact_before)
+        out["compact_s"] = round(time.perf_counter() - t0, 2)
+        conn.close()
+        times, results = run_queries(user_ids, ranges, repeat)
+        out["layouts"]["compacted"] = dict(times, identical=same_result(baseline, results))
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Year-partition benchmark")
+    parser.add_argument("--harvests", type=int, default=10_000_000, help="total harvest rows")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--crops", type=int, default=2000, help="plantings per user per season")
+    parser.add_argument("--seasons", type=int, default=18, help="2 per year; SQLite attaches at most 10 year files")
+    parser.add_argument("--bench-users", type=int, default=5, help="users whose queries are timed")
+    parser.add_argument("--compact-before", type=int, help="also archive years before this one")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if partition_files():
+        raise SystemExit("HARVEST_PARTITION_DIR already holds year files: point it at an empty directory")
+
+    last_year = date.today().year
+    per_planting = max(1, args.harvests // (args.users * args.crops * args.seasons))
+    t0 = time.perf_counter()
+    user_ids = generate(args.users, args.crops, args.seasons, per_planting, args.seed, last_year=last_year)
+    generate_s = round(time.perf_counter() - t0, 1)
+
+    first_year = last_year - (args.seasons - 1) // 2
+    result = bench(user_ids[:args.bench_users], first_year, last_year, args.repeat, args.compact_before)
+    result["rows"] = args.users * args.crops * args.seasons * per_planting
+    result["generate_s"] = generate_s
+    print(json.dumps(result, indent=2))
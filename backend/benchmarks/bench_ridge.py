@@ -0,0 +1,107 @@
+# bench_ridge.py — Fit / incremental update / predict cost of the ridge engine
+#
+#   python -m benchmarks.bench_ridge --rows 100,1000,10000,100000 --features 1,2,4
+#
+# k = number of features (plus intercept). "legacy" is the original pure-Python
+# 2x2 month solver, timed for comparison at k=1.
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+from crop_tracker.ridge import RidgeModel, FEATURES
+
+FEATURE_ORDER = ["month", "area", "year", "lag"]
+
+
+def legacy_month_fit(samples, lam=0.5):
+    xtx00 = xtx01 = xtx11 = xty0 = xty1 = 0.0
+    for m, y in samples:
+        x1 = float(m)
+        xtx00 += 1.0
+        xtx01 += x1
+        xtx11 += x1 * x1
+        xty0 += y
+        xty1 += x1 * y
+    xtx00 += lam
+    xtx11 += lam
+    det = xtx00 * xtx11 - xtx01 * xtx01
+    return ((xtx11 * xty0 - xtx01 * xty1) / det, (-xtx01 * xty0 + xtx00 * xty1) / det)
+
+def make_samples(n, rng):
+    out = []
+    for _ in range(n):
+        s = {
+            "month": rng.randint(1, 12),
+            "area": rng.uniform(0.5, 6.0),
+            "year": rng.randint(2015, 2025),
+            "lag_days": rng.randint(80, 200),
+        }
+        out.append((s, 600 + 20 * s["month"] + rng.gauss(0, 80)))
+    return out
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+def bench(rows_list, k_list, seed=1):
+    rng = random.Random(seed)
+    results = []
+    for n in rows_list:
+        samples = make_samples(n, rng)
+        for k in k_list:
+            features = tuple(FEATURE_ORDER[:k])
+            model = RidgeModel(features)
+            X = np.vstack([model.row(s) for s, _ in samples])
+            y = np.array([t for _, t in samples])
+
+            fit_ms = timed(lambda: RidgeModel(features).fit_arrays(X, y).solve())
+            build_ms = timed(lambda: RidgeModel(features).fit([s for s, _ in samples], y))
+
+            inc = RidgeModel(features)
+            m = min(n, 10000)
+            t0 = time.perf_counter()
+            for i in range(m):
+                inc.add(X[i], y[i])
+            add_us = (time.perf_counter() - t0) * 1e6 / m
+            t0 = time.perf_counter()
+            for i in range(m):
+                inc.remove(X[i], y[i])
+            remove_us = (time.perf_counter() - t0) * 1e6 / m
+
+            solved = RidgeModel(features).fit_arrays(X, y)
+            predict_ms = timed(lambda: solved.predict_arrays(X))
+
+            row = {
+                "rows": n,
+                "k": k,
+                "fit_arrays_ms": round(fit_ms, 3),
+                "fit_from_samples_ms": round(build_ms, 3),
+                "add_row_us": round(add_us, 3),
+                "remove_row_us": round(remove_us, 3),
+                "predict_all_ms": round(predict_ms, 3),
+            }
+            if k == 1:
+                pairs = [(s["month"], t) for s, t in samples]
+                row["legacy_fit_ms"] = round(timed(lambda: legacy_month_fit(pairs)), 3)
+            results.append(row)
+            print(row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ridge engine benchmark")
+    parser.add_argument("--rows", default="100,1000,10000,100000")
+    parser.add_argument("--features", default="1,2,3,4", help=f"k values, up to {len(FEATURES)}")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    res = bench([int(x) for x in args.rows.split(",")], [int(x) for x in args.features.split(",")])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,164 @@
+# bench_shards.py — Harvest write throughput: one database.db vs shard files
+#
+#   python -m benchmarks.bench_shards --farmers 1,4,16,64 --seconds 5
+#
+# For every layout (single file, SHARD_MODE=hash with --shard-count files,
+# SHARD_MODE=tenant) and farmer count, a child process builds a fresh
+# database in a scratch directory, registers the farmers through the app,
+# gives each a crop, then spreads them over --processes worker processes
+# (one thread per farmer, Flask test client) posting harvests for --seconds.
+# Reports harvests/s, p50/p95 latency and failed writes ("database is
+# locked" after the busy timeout).
+# Admission control and the prediction refresh worker are off in the
+# children so only the write path is measured.
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+# -------------------------------
+# Child: one layout, one farmer count
+# -------------------------------
+def run_workers(app, plots, seconds, seed, queue):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    start = threading.Barrier(len(plots) + 1)
+    stop_at = [0.0]
+
+    def farmer(user_id, crop_id, rng):
+        client = app.test_client()
+        mine, failed = [], 0
+        start.wait()
+        while time.perf_counter() < stop_at[0]:
+            body = {"date": f"2024-{rng.randint(6, 9):02d}-{rng.randint(1, 28):02d}",
+                    "yield_amount": round(rng.uniform(50, 3000), 1)}
+            t0 = time.perf_counter()
+            resp = client.post(f"/api/harvest/{crop_id}/{user_id}", json=body)
+            if resp.status_code == 201:
+                mine.append(time.perf_counter() - t0)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=farmer, args=(u, c, random.Random(seed * 1000 + i)))
+               for i, (u, c) in enumerate(plots)]
+    for t in threads:
+        t.start()
+    stop_at[0] = time.perf_counter() + seconds
+    start.wait()
+    for t in threads:
+        t.join()
+    queue.put((latencies, sum(errors)))
+
+def run_child(farmers, seconds, seed, processes):
+    from app import app
+
+    setup = app.test_client()
+    plots = []
+    for i in range(farmers):
+        resp = setup.post("/api/register", json={
+            "email": f"farmer{i}@example.com", "username": f"farmer{i}", "password": "bench123",
+        })
+        user_id = resp.get_json()["userId"]
+        setup.post(f"/api/crop/{user_id}", json={"name": "Maize", "area": 2.0, "planting_date": "2024-03-15"})
+        crop_id = setup.get(f"/api/crop/{user_id}").get_json()["data"][0]["id"]
+        plots.append((user_id, crop_id))
+
+    # farmers are spread over worker processes (like gunicorn workers), one thread each
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=run_workers, args=(app, plots[i::processes], seconds, seed + i, queue))
+             for i in range(processes)]
+    for proc in procs:
+        proc.start()
+    latencies, failed = [], 0
+    for _ in procs:
+        mine, n_failed = queue.get()
+        latencies.extend(mine)
+        failed += n_failed
+    for proc in procs:
+        proc.join()
+
+    latencies.sort()
+    return {
+        "farmers": farmers,
+        "harvests": len(latencies),
+        "harvests_per_s": round(len(latencies) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "failed": failed,
+    }
+
+
+# -------------------------------
+# Parent: one child process per (layout, farmers)
+# -------------------------------
+def layouts(shard_count):
+    return {
+        "single_file": {},
+        f"hash_{shard_count}": {"SHARD_MODE": "hash", "SHARD_COUNT": str(shard_count)},
+        "tenant": {"SHARD_MODE": "tenant"},
+    }
+
+def run_layout(name, extra_env, farmers, seconds, seed, processes):
+    scratch = tempfile.mkdtemp(prefix=f"bench_shards_{name}_")
+    env = dict(os.environ, **extra_env)
+    env.pop("DATABASE_URL", None)
+    env.update({
+        "SQLITE_PATH": os.path.join(scratch, "database.db"),
+        "SHARD_DIR": os.path.join(scratch, "shards"),
+        "HARVEST_PARTITION_DIR": os.path.join(scratch, "partitions"),
+        "ADMISSION_ENABLED": "0",
+        "PREDICTION_WORKER": "0",
+        "SCHEDULER_ENABLED": "0",
+    })
+    try:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_shards", "--child",
+             "--farmers", str(farmers), "--seconds", str(seconds), "--seed", str(seed),
+             "--processes", str(processes)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write throughput: single SQLite file vs shard files")
+    parser.add_argument("--farmers", default="1,4,16,64", help="comma-separated concurrent farmer counts")
+    parser.add_argument("--seconds", type=float, default=5.0, help="write phase per run")
+    parser.add_argument("--shard-count", type=int, default=8, help="files for the hash layout")
+    parser.add_argument("--processes", type=int, default=4, help="worker processes the farmers are spread over")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(int(args.farmers), args.seconds, args.seed, args.processes)))
+        sys.exit(0)
+
+    results = {}
+    for name, extra_env in layouts(args.shard_count).items():
+        results[name] = []
+        for farmers in [int(n) for n in args.farmers.split(",") if n.strip()]:
+            r = run_layout(name, extra_env, farmers, args.seconds, args.seed, min(args.processes, farmers))
+            results[name].append(r)
+            print(f"{name:>12}  farmers={farmers:<4} {r['harvests_per_s']:>8} harvests/s  "
+                  f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms failed={r['failed']}")
+    print(json.dumps(results, indent=2))
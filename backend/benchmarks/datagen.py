@@ -0,0 +1,178 @@
+# datagen.py — Synthetic users/crops/harvests in the CROP_PROFILES mix
+#
+#   python -m benchmarks.datagen --users 200 --crops 4 --seasons 6 --harvests 3
+#
+# Writes to SQLITE_PATH (SQLite) or DATABASE_URL (Postgres), like the app.
+# Rows are bulk-inserted, bypassing the write-path hooks, so afterwards each
+# generated user's data version is bumped and the crop priors are rebuilt;
+# yield sketches and stored predictions are recomputed lazily on first read.
+import random
+import argparse
+from datetime import date, timedelta
+from werkzeug.security import generate_password_hash
+
+from crop_tracker.model import get_db, init_db
+from crop_tracker.prediction import CROP_PROFILES, season_factor
+from crop_tracker.croptypes import resolve_crop_type
+from crop_tracker.partitions import writable_harvests, attached_years
+from crop_tracker.dataversion import bump_data_version
+from crop_tracker.priors import rebuild_crop_priors
+
+# Relative share of each crop among generated plantings
+CROP_MIX = {
+    "Maize": 0.40,
+    "Beans": 0.20,
+    "Rice": 0.15,
+    "Cassava": 0.15,
+    "Sorghum": 0.10,
+}
+
+# Planting month windows for the two rainy seasons
+SEASON_MONTHS = [(3, 5), (10, 12)]
+
+BENCH_PASSWORD = "bench123"
+
+# Everything derived from users/crops/harvests, children before parents:
+# clear=True empties these too so no table describes deleted rows.
+DERIVED_TABLES = [
+    "predictions", "user_data_versions", "yield_sketches", "sync_tombstones",
+    "org_rollups", "org_invites", "org_members", "organizations",
+    "report_jobs", "harvest_rollups", "harvest_archive", "crop_prior_hist", "shard_map",
+]
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def insert_returning_id(conn, cur, sql, params):
+    if is_postgres(conn):
+        cur.execute(sql + " RETURNING id", params)
+        row = cur.fetchone()
+        return int(row["id"] if isinstance(row, dict) else row[0])
+    cur.execute(sql, params)
+    return cur.lastrowid
+
+def clear_tables(conn, cur):
+    for table in DERIVED_TABLES:
+        cur.execute(f"DELETE FROM {table}")
+    # SQLite: older years live in attached partition files (partitions.py)
+    harvest_tables = [f"p{year}.harvests" for year in attached_years(conn)] if not is_postgres(conn) else []
+    for table in harvest_tables + [writable_harvests(conn), "crops", "reset_tokens", "users"]:
+        cur.execute(f"DELETE FROM {table}")
+    conn.commit()
+
+def season_starts(seasons, last_year):
+    # Newest season last: seasons=4 -> two years of long + short rains
+    out = []
+    year = last_year
+    while len(out) < seasons:
+        for lo, hi in reversed(SEASON_MONTHS):
+            out.append((year, lo, hi))
+            if len(out) == seasons:
+                break
+        year -= 1
+    return list(reversed(out))
+
+
+# -------------------------------
+# Generator
+# -------------------------------
+def generate(users=50, crops=4, seasons=6, harvests=3, seed=42, last_year=None, clear=True):
+    """
+    users x seasons x crops plantings, each with `harvests` harvest events.
+    Yields follow the crop's baseline kg/acre, the planting-season factor and
+    lognormal noise, so per-acre figures land in CROP_PROFILES ranges.
+    Returns the generated user ids.
+    """
+    rng = random.Random(seed)
+    last_year = last_year or date.today().year
+    names = list(CROP_MIX)
+    weights = [CROP_MIX[n] for n in names]
+    password = generate_password_hash(BENCH_PASSWORD)
+
+    init_db(force=True)
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+
+    if clear:
+        clear_tables(conn, cur)
+
+    type_ids = {name: resolve_crop_type(cur, is_postgres(conn), name) for name in CROP_MIX}
+    user_ids = []
+    harvest_rows = []
+    for u in range(users):
+        user_id = insert_returning_id(
+            conn, cur,
+            f"INSERT INTO users (email, username, password) VALUES ({p}, {p}, {p})",
+            (f"bench{u}_{seed}@example.com", f"bench{u}_{seed}", password),
+        )
+        user_ids.append(user_id)
+
+        for year, lo, hi in season_starts(seasons, last_year):
+            for _ in range(crops):
+                name = rng.choices(names, weights)[0]
+                profile = CROP_PROFILES[name]
+                area = round(rng.uniform(0.5, 6.0), 2)
+                planted = date(year, rng.randint(lo, hi), rng.randint(1, 28))
+
+                crop_id = insert_returning_id(
+                    conn, cur,
+                    f"INSERT INTO crops (user_id, name, area, planting_date, crop_type_id) VALUES ({p}, {p}, {p}, {p}, {p})",
+                    (user_id, name, area, planted.isoformat(), type_ids[name]),
+                )
+
+                kg_per_acre = profile["baseline"] * season_factor(planted.month) * rng.lognormvariate(0.0, 0.25)
+                kg_per_acre = max(profile["min"], min(profile["max"], kg_per_acre))
+                total_kg = kg_per_acre * area
+                first = planted + timedelta(days=rng.randint(90, 150))
+                for k in range(harvests):
+                    harvest_date = first + timedelta(days=14 * k)
+                    share = total_kg / harvests * rng.uniform(0.8, 1.2)
+                    harvest_rows.append((crop_id, harvest_date.isoformat(), round(share, 1)))
+
+        if len(harvest_rows) >= 5000:
+            cur.executemany(
+                f"INSERT INTO {writable_harvests(conn)} (crop_id, date, yield_amount) VALUES ({p}, {p}, {p})",
+                harvest_rows,
+            )
+            harvest_rows = []
+            conn.commit()
+
+    if harvest_rows:
+        cur.executemany(
+            f"INSERT INTO {writable_harvests(conn)} (crop_id, date, yield_amount) VALUES ({p}, {p}, {p})",
+            harvest_rows,
+        )
+    # what the write path would have done per row: stale any cached/stored
+    # derived data for these users, then recount the priors
+    for user_id in user_ids:
+        bump_data_version(conn, cur, user_id)
+    conn.commit()
+    conn.close()
+    rebuild_crop_priors()
+    return user_ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic crop/harvest dataset")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--crops", type=int, default=4, help="plantings per user per season")
+    parser.add_argument("--seasons", type=int, default=6)
+    parser.add_argument("--harvests", type=int, default=3, help="harvest events per planting")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ids = generate(args.users, args.crops, args.seasons, args.harvests, args.seed)
+    total_crops = len(ids) * args.crops * args.seasons
+    print(f"Generated {len(ids)} users, {total_crops} crops, {total_crops * args.harvests} harvests")
@@ -0,0 +1,348 @@
+# load.py — Concurrent end-to-end load benchmark over every blueprint route
+#
+#   SQLITE_PATH=/tmp/bench.db python -m benchmarks.load --users 200 --concurrency 8 --requests 4000
+#   python -m benchmarks.load --skip-generate --url http://localhost:8000 ...
+#   python -m benchmarks.load --compare benchmarks/results/<old>.json
+#
+# Results are written as JSON under benchmarks/results/ (one file per run) so
+# runs from different commits can be diffed with --compare.
+#
+# Before the timed run, the generated farmers are grouped into organizations
+# (created, invited and accepted through the API) so the org routes have data.
+# Reports are only enqueued and polled: computing them is the separate worker
+# pool's job (crop_tracker/reports.py), which this benchmark does not start.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.datagen import generate, BENCH_PASSWORD
+from crop_tracker.model import get_db
+from crop_tracker.shards import fan_out
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ORG_SIZE = 20   # farmers per generated organization
+
+
+# -------------------------------
+# Clients: in-process Flask test client or a live server
+# -------------------------------
+class LocalClient:
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        resp = self.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, path, body=None):
+        resp = self.session.request(method, self.base_url + path, json=body)
+        try:
+            data = resp.json()
+        except ValueError:
+            data = None
+        return resp.status_code, data
+
+
+# -------------------------------
+# Route scenarios
+# -------------------------------
+def all_crops(conn, cur):
+    cur.execute("SELECT id, user_id, name, planting_date FROM crops")
+    return [dict(r) for r in cur.fetchall()]
+
+def load_context(user_ids):
+    crops_by_user = {}
+    years = set()
+    # every shard file too when SHARD_MODE is set
+    for _, rows in fan_out(all_crops):
+        for r in rows:
+            crops_by_user.setdefault(r["user_id"], []).append((r["id"], r["name"]))
+            years.add(int(str(r["planting_date"])[:4]))
+
+    return {
+        "user_ids": [u for u in user_ids if u in crops_by_user],
+        "crops_by_user": crops_by_user,
+        "year_from": min(years) if years else date.today().year,
+        "year_to": max(years) if years else date.today().year,
+    }
+
+def setup_orgs(client, ctx, run_id):
+    """Groups ctx's users into orgs of ORG_SIZE (first one manages); [(org_id, manager, members)]."""
+    orgs = []
+    users = ctx["user_ids"]
+    for i in range(0, len(users), ORG_SIZE):
+        manager, members = users[i], users[i + 1:i + ORG_SIZE]
+        status, data = client.request("POST", "/api/orgs", {"user_id": manager, "name": f"Load Coop {run_id}-{i // ORG_SIZE}"})
+        if status != 201:
+            continue
+        org_id = data["org_id"]
+        for member in members:
+            client.request("POST", f"/api/orgs/{org_id}/members", {"user_id": manager, "member_id": member})
+            client.request("POST", f"/api/orgs/{org_id}/invites/accept", {"user_id": member})
+        orgs.append((org_id, manager, members))
+    return orgs
+
+def pick(ctx, rng):
+    user_id = rng.choice(ctx["user_ids"])
+    crop_id, crop_name = rng.choice(ctx["crops_by_user"][user_id])
+    year = rng.randint(ctx["year_from"], ctx["year_to"])
+    return user_id, crop_id, crop_name, year
+
+def scenario_reads(ctx, rng):
+    user_id, crop_id, crop_name, year = pick(ctx, rng)
+    y0, y1 = ctx["year_from"], ctx["year_to"]
+    return [
+        ("get_crops", "GET", f"/api/crop/{user_id}?page=1&limit=5", None),
+        ("get_harvests", "GET", f"/api/harvests?user_id={user_id}", None),
+        ("harvest_stats", "GET", f"/api/harvests/stats?user_id={user_id}", None),
+        ("summary_yearly", "GET", f"/api/harvests/summary/yearly?user_id={user_id}", None),
+        ("top_crops_yearly", "GET", f"/api/harvests/summary/top-crops-yearly?user_id={user_id}&from={y0}&to={y1}&top=5", None),
+        ("crop_year_filter", "GET", f"/api/harvests/filter/crop-year?user_id={user_id}&crop={crop_name}&year={year}", None),
+        ("compare_years", "GET", f"/api/harvests/compare?user_id={user_id}&crop={crop_name}&years={y0},{year},{y1}", None),
+        ("seasonality", "GET", f"/api/harvests/seasonality?user_id={user_id}&from={y0}&to={y1}", None),
+        ("distribution", "GET", f"/api/harvests/distribution?user_id={user_id}&from={y0}&to={y1}", None),
+        ("timeseries", "GET", f"/api/harvests/timeseries?user_id={user_id}&interval=week&max_points=200", None),
+        ("predict_yield", "GET", f"/api/predict/{crop_id}?user_id={user_id}", None),
+        ("forecast_calendar", "GET", f"/api/forecast/calendar?user_id={user_id}&months=12", None),
+        ("sync_full", "GET", f"/api/sync?user_id={user_id}&since=0", None),
+        ("predict_scenarios", "POST", f"/api/predict/scenarios?user_id={user_id}",
+         {"crop_name": crop_name, "areas": {"min": 1, "max": 5, "step": 1},
+          "planting_dates": {"from": f"{y1}-01-01", "to": f"{y1}-12-31", "step_days": 14}, "top": 10}),
+    ] + org_reads(ctx, rng)
+
+def org_reads(ctx, rng):
+    if not ctx.get("orgs"):
+        return []
+    org_id, manager, _ = rng.choice(ctx["orgs"])
+    y0, y1 = ctx["year_from"], ctx["year_to"]
+    return [
+        ("org_stats", "GET", f"/api/orgs/{org_id}/stats?user_id={manager}", None),
+        ("org_summary_yearly", "GET", f"/api/orgs/{org_id}/summary/yearly?user_id={manager}", None),
+        ("org_top_crops_yearly", "GET",
+         f"/api/orgs/{org_id}/summary/top-crops-yearly?user_id={manager}&from={y0}&to={y1}&top=5", None),
+        ("org_seasonality", "GET", f"/api/orgs/{org_id}/seasonality?user_id={manager}&from={y0}&to={y1}", None),
+        ("org_members", "GET", f"/api/orgs/{org_id}/members?user_id={manager}", None),
+    ]
+
+def scenario_writes(ctx, rng):
+    user_id, crop_id, crop_name, year = pick(ctx, rng)
+    day = f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    return [
+        ("add_harvest", "POST", f"/api/harvest/{crop_id}/{user_id}",
+         {"date": day, "yield_amount": round(rng.uniform(50, 3000), 1)}),
+        ("add_crop", "POST", f"/api/crop/{user_id}",
+         {"name": crop_name, "area": round(rng.uniform(0.5, 6.0), 2), "planting_date": day}),
+    ]
+
+def run_crop_lifecycle(client, ctx, rng, record):
+    # update + delete on a crop created for the purpose, so the dataset stays intact
+    user_id, _, crop_name, year = pick(ctx, rng)
+    day = f"{year}-04-01"
+    # add_crop does not return the id: tag the row with an unlikely area instead
+    area = round(rng.uniform(1.0, 2.0), 6)
+    client.request("POST", f"/api/crop/{user_id}", {"name": crop_name, "area": area, "planting_date": day})
+    status, data = client.request("GET", f"/api/crop/{user_id}?page=1&limit=20")
+    if status != 200 or not data:
+        return
+    mine = [c["id"] for c in data.get("data") or [] if abs(float(c["area"]) - area) < 1e-9]
+    if not mine:
+        return
+    new_id = mine[0]
+    record("update_crop", "PUT", f"/api/crop/{new_id}/{user_id}",
+           {"name": crop_name, "area": 2.0, "planting_date": day})
+    record("delete_crop", "DELETE", f"/api/crop/{new_id}/{user_id}", None)
+
+def run_report(client, ctx, rng, record):
+    # enqueue (usually deduplicated: few distinct specs) + one status poll
+    if not ctx.get("orgs"):
+        return
+    _, manager, members = rng.choice(ctx["orgs"])
+    y1 = ctx["year_to"]
+    data = record("create_report", "POST", "/api/reports",
+                  {"user_id": manager, "user_ids": [manager] + members[:rng.randint(0, 4)], "from": y1 - 1, "to": y1})
+    if data and data.get("id"):
+        record("report_status", "GET", f"/api/reports/{data['id']}?user_id={manager}", None)
+
+def run_auth(client, ctx, rng, record):
+    n = rng.randint(0, 10 ** 9)
+    email = f"load{n}@example.com"
+    record("register", "POST", "/api/register",
+           {"email": email, "username": f"load{n % 10 ** 8}", "password": BENCH_PASSWORD})
+    record("login", "POST", "/api/login", {"email": email, "password": BENCH_PASSWORD})
+    data = record("request_password_reset", "POST", "/api/reset-password", {"email": email})
+    if data and data.get("token"):
+        record("reset_password", "POST", f"/api/reset-password/{data['token']}", {"password": BENCH_PASSWORD})
+
+
+# -------------------------------
+# Runner
+# -------------------------------
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(q / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+def run_load(make_client, ctx, concurrency, total_requests, write_ratio, seed):
+    timings = {}
+    errors = {}
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker(worker_id):
+        client = make_client()
+        rng = random.Random(seed * 1000 + worker_id)
+
+        def record(label, method, path, body):
+            t0 = time.perf_counter()
+            try:
+                status, data = client.request(method, path, body)
+            except Exception:
+                status, data = 599, None
+            ms = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                timings.setdefault(label, []).append(ms)
+                if status >= 400:
+                    errors[label] = errors.get(label, 0) + 1
+                remaining[0] -= 1
+            return data
+
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+            roll = rng.random()
+            if roll < 0.01:
+                run_auth(client, ctx, rng, record)
+            elif roll < 0.015:
+                run_report(client, ctx, rng, record)
+            elif roll < 0.03:
+                run_crop_lifecycle(client, ctx, rng, record)
+            elif roll < write_ratio:
+                for call in scenario_writes(ctx, rng):
+                    record(*call)
+            else:
+                record(*rng.choice(scenario_reads(ctx, rng)))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall_s = time.perf_counter() - t0
+
+    routes = {}
+    for label, vals in sorted(timings.items()):
+        vals.sort()
+        routes[label] = {
+            "count": len(vals),
+            "errors": errors.get(label, 0),
+            "throughput_rps": round(len(vals) / wall_s, 2),
+            "mean_ms": round(sum(vals) / len(vals), 3),
+            "p50_ms": round(percentile(vals, 50), 3),
+            "p95_ms": round(percentile(vals, 95), 3),
+            "p99_ms": round(percentile(vals, 99), 3),
+        }
+
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "wall_s": round(wall_s, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / wall_s, 2) if wall_s > 0 else 0.0,
+        "routes": routes,
+    }
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(old, new):
+    print(f"{'route':<24}{'p50 old':>10}{'p50 new':>10}{'p95 old':>10}{'p95 new':>10}{'p95 Δ%':>9}")
+    for label in sorted(set(old["routes"]) | set(new["routes"])):
+        o = old["routes"].get(label)
+        n = new["routes"].get(label)
+        if not o or not n:
+            print(f"{label:<24}{'(only in ' + ('new' if n else 'old') + ')':>40}")
+            continue
+        delta = (n["p95_ms"] - o["p95_ms"]) / o["p95_ms"] * 100.0 if o["p95_ms"] else 0.0
+        print(f"{label:<24}{o['p50_ms']:>10.2f}{n['p50_ms']:>10.2f}{o['p95_ms']:>10.2f}{n['p95_ms']:>10.2f}{delta:>8.1f}%")
+
+def print_report(result):
+    print(f"{result['total_requests']} requests in {result['wall_s']}s -> {result['throughput_rps']} req/s")
+    print(f"{'route':<24}{'count':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, r in result["routes"].items():
+        print(f"{label:<24}{r['count']:>7}{r['errors']:>5}{r['throughput_rps']:>9.1f}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--crops", type=int, default=4)
+    parser.add_argument("--seasons", type=int, default=6)
+    parser.add_argument("--harvests", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-generate", action="store_true", help="reuse the existing dataset")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.10)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="previous result JSON to diff against")
+    args = parser.parse_args()
+
+    if args.skip_generate:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users")
+        user_ids = [dict(r)["id"] for r in cur.fetchall()]
+        conn.close()
+    else:
+        user_ids = generate(args.users, args.crops, args.seasons, args.harvests, args.seed)
+
+    ctx = load_context(user_ids)
+    if not ctx["user_ids"]:
+        sys.exit("No users with crops in the dataset")
+
+    make_client = (lambda: HttpClient(args.url)) if args.url else LocalClient
+    ctx["orgs"] = setup_orgs(make_client(), ctx, f"{args.seed}-{int(time.time())}")
+    result = run_load(make_client, ctx, args.concurrency, args.requests, args.write_ratio, args.seed)
+    result["meta"] = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": "postgres" if os.environ.get("DATABASE_URL") else "sqlite",
+        "target": args.url or "in-process",
+        "dataset": {"users": len(user_ids), "crops": args.crops, "seasons": args.seasons, "harvests": args.harvests,
+                    "orgs": len(ctx["orgs"])},
+        "concurrency": args.concurrency,
+        "write_ratio": args.write_ratio,
+    }
+    print_report(result)
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit'] or 'nogit'}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
@@ -0,0 +1,156 @@
+# admin.py — Operator-only endpoints (guarded by ADMIN_TOKEN)
+import os
+import hmac
+from functools import wraps
+from flask import Blueprint, request, jsonify, Response
+
+from crop_tracker.querylog import top_statements, reset_stats
+from crop_tracker import startup, metrics
+from crop_tracker.admission import admission_state
+from crop_tracker.replicas import replica_state
+from crop_tracker.shards import shard_report
+from crop_tracker.scheduler import scheduler_state
+from crop_tracker.profiling import (
+    list_profiles, get_profile, collapsed_samples, reset_samples,
+)
+
+admin_routes = Blueprint("admin_routes", __name__, url_prefix="/api/admin")
+
+
+# -------------------------------
+# Guard
+# -------------------------------
+def require_admin(fn):
+    """
+    Admin API is disabled unless ADMIN_TOKEN is set; callers must send it
+    back in the X-Admin-Token header.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        expected = os.environ.get("ADMIN_TOKEN")
+        if not expected:
+            return jsonify({"error": "Admin API disabled"}), 403
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), expected.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# =====================================================
+# GET /api/admin/slow-queries?top=20&order=total_ms
+# =====================================================
+@admin_routes.route("/slow-queries", methods=["GET"])
+@require_admin
+def slow_queries():
+    top_n = request.args.get("top", default=20, type=int)
+    order_by = request.args.get("order", default="total_ms")
+    top_n = max(1, min(top_n, 200))
+
+    return jsonify({
+        "order": order_by,
+        "statements": top_statements(top_n, order_by),
+    }), 200
+
+
+# =====================================================
+# DELETE /api/admin/slow-queries
+# =====================================================
+@admin_routes.route("/slow-queries", methods=["DELETE"])
+@require_admin
+def clear_slow_queries():
+    reset_stats()
+    return jsonify({"message": "Statement stats cleared"}), 200
+
+
+# =====================================================
+# GET /api/admin/profiles
+# =====================================================
+@admin_routes.route("/profiles", methods=["GET"])
+@require_admin
+def profiles():
+    return jsonify({"profiles": list_profiles()}), 200
+
+
+# =====================================================
+# GET /api/admin/profiles/<id>?format=collapsed
+# =====================================================
+@admin_routes.route("/profiles/<profile_id>", methods=["GET"])
+@require_admin
+def profile_detail(profile_id):
+    entry = get_profile(profile_id)
+    if not entry:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get("format") == "collapsed":
+        return Response(entry["collapsed"], mimetype="text/plain")
+    return jsonify(entry), 200
+
+
+# =====================================================
+# GET /api/admin/profile/flamegraph  (aggregated samples)
+# =====================================================
+@admin_routes.route("/profile/flamegraph", methods=["GET"])
+@require_admin
+def flamegraph_samples():
+    return Response(collapsed_samples(), mimetype="text/plain")
+
+
+@admin_routes.route("/profile/flamegraph", methods=["DELETE"])
+@require_admin
+def clear_flamegraph_samples():
+    reset_samples()
+    return jsonify({"message": "Samples cleared"}), 200
+
+
+# =====================================================
+# GET /api/admin/startup
+# =====================================================
+@admin_routes.route("/startup", methods=["GET"])
+@require_admin
+def startup_report():
+    return jsonify(startup.report()), 200
+
+
+# =====================================================
+# GET /api/admin/metrics
+# =====================================================
+@admin_routes.route("/metrics", methods=["GET"])
+@require_admin
+def metrics_snapshot():
+    return jsonify(metrics.snapshot()), 200
+
+
+# =====================================================
+# GET /api/admin/admission
+# =====================================================
+@admin_routes.route("/admission", methods=["GET"])
+@require_admin
+def admission_snapshot():
+    return jsonify({"classes": admission_state()}), 200
+
+
+# =====================================================
+# GET /api/admin/replicas
+# =====================================================
+@admin_routes.route("/replicas", methods=["GET"])
+@require_admin
+def replicas_snapshot():
+    return jsonify({"replicas": replica_state()}), 200
+
+
+# =====================================================
+# GET /api/admin/shards  (fans out over every shard file)
+# =====================================================
+@admin_routes.route("/shards", methods=["GET"])
+@require_admin
+def shards_snapshot():
+    return jsonify(shard_report()), 200
+
+
+# =====================================================
+# GET /api/admin/scheduler
+# =====================================================
+@admin_routes.route("/scheduler", methods=["GET"])
+@require_admin
+def scheduler_snapshot():
+    return jsonify(scheduler_state()), 200
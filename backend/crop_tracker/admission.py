@@ -0,0 +1,154 @@
+# admission.py — Per-route-class concurrency limits with bounded queues
+#
+# Each request is classified (analytics / writes / auth); a class admits up
+# to `limit` requests at once and queues up to `queue` more for at most
+# ADMISSION_QUEUE_TIMEOUT_S. Beyond that the request is shed: 429 when the
+# queue is full, 503 when it timed out waiting; both carry Retry-After.
+# Writes and auth have their own (reserved) slots, so a burst of dashboard
+# reads cannot starve logins or harvest entry.
+import os
+import math
+import time
+import threading
+from flask import request, jsonify, g
+
+from crop_tracker import metrics
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+# class=limit:queue
+ADMISSION_LIMITS = os.environ.get("ADMISSION_LIMITS", "analytics=16:64,writes=8:64,auth=4:32")
+ADMISSION_QUEUE_TIMEOUT_S = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_S", "2"))
+
+READ_BLUEPRINTS = ("crop_routes", "harvest_routes", "prediction_routes", "sync_routes", "report_routes", "org_routes")
+WRITE_BLUEPRINTS = ("crop_routes", "harvest_routes", "org_routes")
+# every other registered blueprint must be listed here (tests check it)
+EXEMPT_BLUEPRINTS = ("admin_routes",)
+
+
+def parse_limits(spec):
+    out = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, sizes = part.partition("=")
+        limit, _, queue = sizes.partition(":")
+        out[name.strip()] = (max(1, int(limit)), max(0, int(queue or 0)))
+    return out
+
+
+class RouteClass:
+    def __init__(self, name, limit, queue):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.hold_s = 0.05   # EWMA of time a slot is held, for Retry-After
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """None when admitted, else the rejection reason."""
+        with self.cond:
+            if self.active < self.limit and self.waiting == 0:
+                self.active += 1
+                return None
+            if self.waiting >= self.queue:
+                self.rejected["queue_full"] += 1
+                return "queue_full"
+            self.waiting += 1
+            try:
+                ok = self.cond.wait_for(lambda: self.active < self.limit, timeout)
+            finally:
+                self.waiting -= 1
+            if not ok:
+                self.rejected["queue_timeout"] += 1
+                return "queue_timeout"
+            self.active += 1
+            return None
+
+    def release(self, held_s):
+        with self.cond:
+            self.active -= 1
+            self.hold_s = 0.9 * self.hold_s + 0.1 * held_s
+            self.cond.notify()
+
+    def retry_after(self):
+        # time for the current queue to drain through the slots
+        with self.cond:
+            backlog = self.waiting + 1
+            return max(1, int(math.ceil(self.hold_s * backlog / self.limit)))
+
+    def state(self):
+        with self.cond:
+            return {
+                "limit": self.limit,
+                "queue": self.queue,
+                "active": self.active,
+                "queued": self.waiting,
+                "rejected": dict(self.rejected),
+                "avg_hold_ms": round(self.hold_s * 1000.0, 2),
+            }
+
+
+_classes = {name: RouteClass(name, limit, queue) for name, (limit, queue) in parse_limits(ADMISSION_LIMITS).items()}
+
+
+# -------------------------------
+# Classification
+# -------------------------------
+def route_class():
+    if request.method == "OPTIONS":
+        return None   # CORS preflight
+    bp = request.blueprint
+    if bp == "auth_routes":
+        return "auth"
+    if request.method in ("POST", "PUT", "DELETE") and bp in WRITE_BLUEPRINTS:
+        return "writes"
+    if bp in READ_BLUEPRINTS:
+        return "analytics"
+    return None   # EXEMPT_BLUEPRINTS, index: not limited
+
+def admission_state():
+    return {name: rc.state() for name, rc in _classes.items()}
+
+
+# -------------------------------
+# Flask hooks
+# -------------------------------
+def before_request():
+    rc = _classes.get(route_class() or "")
+    if rc is None:
+        return None
+
+    t0 = time.perf_counter()
+    reason = rc.acquire(ADMISSION_QUEUE_TIMEOUT_S)
+    metrics.observe(f"admission.{rc.name}.queue_wait_s", time.perf_counter() - t0)
+    metrics.set_gauge(f"admission.{rc.name}.queued", rc.waiting)
+
+    if reason is not None:
+        metrics.inc(f"admission.{rc.name}.rejected.{reason}")
+        status = 429 if reason == "queue_full" else 503
+        resp = jsonify({"error": "Server busy, retry later"})
+        resp.status_code = status
+        resp.headers["Retry-After"] = str(rc.retry_after())
+        return resp
+
+    metrics.inc(f"admission.{rc.name}.admitted")
+    metrics.set_gauge(f"admission.{rc.name}.active", rc.active)
+    g.admission = (rc, time.perf_counter())
+    return None
+
+def teardown_request(exc):
+    admitted = g.pop("admission", None)
+    if admitted is None:
+        return
+    rc, t0 = admitted
+    rc.release(time.perf_counter() - t0)
+    metrics.set_gauge(f"admission.{rc.name}.active", rc.active)
+
+def init_admission(app):
+    if not ADMISSION_ENABLED:
+        return
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
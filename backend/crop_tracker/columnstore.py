@@ -0,0 +1,271 @@
+# columnstore.py — Optional per-user in-memory harvest columns for analytics
+#
+# A user's harvests are loaded once into typed numpy arrays (crop type id,
+# date ordinal, year, month, yield, plus event count so archived rollups
+# fit in as weighted rows) and their crops' (type id, planting year);
+# summary/seasonality/crop-year are computed
+# with vectorized group-bys instead of SQL. Snapshots are stamped with the user's
+# data version: add_harvest appends in place, any other write makes the
+# next read reload. Least recently used snapshots are evicted to stay under
+# HARVEST_STORE_BUDGET_MB.
+import os
+import threading
+from collections import OrderedDict
+from datetime import date as date_cls
+
+from crop_tracker.dataversion import get_data_version
+from crop_tracker import metrics
+
+HARVEST_STORE_ENABLED = os.environ.get("HARVEST_STORE_ENABLED", "0") == "1"
+HARVEST_STORE_BUDGET_MB = float(os.environ.get("HARVEST_STORE_BUDGET_MB", "64"))
+# also run the SQL path and compare (logs + counts mismatches, serves SQL)
+HARVEST_STORE_VERIFY = os.environ.get("HARVEST_STORE_VERIFY", "0") == "1"
+
+_snapshots = OrderedDict()   # user_id -> HarvestColumns (LRU order)
+_bytes = 0
+_lock = threading.Lock()
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def to_date(value):
+    if hasattr(value, "toordinal"):
+        return value if isinstance(value, date_cls) else value.date()
+    s = str(value)[:10]
+    return date_cls(int(s[:4]), int(s[5:7]), int(s[8:10]))
+
+
+# -------------------------------
+# Snapshot
+# -------------------------------
+class HarvestColumns:
+    def __init__(self, version, harvests, plantings):
+        """
+        harvests: [(crop_type_id, date, yield, events)] where archived
+        rollups (partitions.py) are rows with events > 1 dated on the 1st of
+        their month; plantings: [(crop_type_id, planting date)]
+        """
+        import numpy as np
+        self.version = version
+        n = len(harvests)
+        self.crop_type = np.fromiter((h[0] for h in harvests), dtype=np.int32, count=n)
+        dates = [h[1] for h in harvests]
+        self.ordinal = np.fromiter((d.toordinal() for d in dates), dtype=np.int32, count=n)
+        self.year = np.fromiter((d.year for d in dates), dtype=np.int16, count=n)
+        self.month = np.fromiter((d.month for d in dates), dtype=np.int8, count=n)
+        self.yield_kg = np.fromiter((h[2] for h in harvests), dtype=np.float64, count=n)
+        self.events = np.fromiter((h[3] for h in harvests), dtype=np.int32, count=n)
+        self.n = n
+        self.planted_type = np.array([p[0] for p in plantings], dtype=np.int32)
+        self.planted_year = np.array([p[1].year for p in plantings], dtype=np.int16)
+
+    def nbytes(self):
+        arrays = (self.crop_type, self.ordinal, self.year, self.month, self.yield_kg,
+                  self.events, self.planted_type, self.planted_year)
+        return sum(a.nbytes for a in arrays)
+
+    def append(self, crop_type_id, day, yield_kg):
+        import numpy as np
+        # capacity doubling: views over the first n slots stay valid
+        if self.n == len(self.yield_kg):
+            cap = max(16, self.n * 2)
+            for name in ("crop_type", "ordinal", "year", "month", "yield_kg", "events"):
+                old = getattr(self, name)
+                grown = np.zeros(cap, dtype=old.dtype)
+                grown[:self.n] = old[:self.n]
+                setattr(self, name, grown)
+        i = self.n
+        self.crop_type[i] = crop_type_id
+        self.ordinal[i] = day.toordinal()
+        self.year[i] = day.year
+        self.month[i] = day.month
+        self.yield_kg[i] = yield_kg
+        self.events[i] = 1
+        self.n += 1
+
+    def cols(self):
+        n = self.n
+        return self.crop_type[:n], self.year[:n], self.month[:n], self.yield_kg[:n]
+
+    def weights(self):
+        return self.events[:self.n]
+
+    # ---------- vectorized group-bys ----------
+    def yearly_totals(self):
+        import numpy as np
+        _, year, _, y = self.cols()
+        if not len(y):
+            return []
+        years, inv = np.unique(year, return_inverse=True)
+        sums = np.bincount(inv, weights=y)
+        return [{"year": str(int(yr)), "total_yield": float(s)} for yr, s in zip(years, sums)]
+
+    def monthly_totals(self, year_from, year_to):
+        import numpy as np
+        _, year, month, y = self.cols()
+        m = (year >= year_from) & (year <= year_to)
+        counts = np.bincount(month[m], minlength=13)
+        sums = np.bincount(month[m], weights=y[m], minlength=13)
+        return [{"month": int(k), "total_yield": float(sums[k])} for k in np.nonzero(counts)[0]]
+
+    def crop_year(self, crop_type_id, year_sel):
+        import numpy as np
+        if crop_type_id is None:
+            crop_type_id = -1   # unknown name: matches nothing, like the SQL path
+        crop_type, year, month, y = self.cols()
+        events = self.weights()
+        planted = int(np.count_nonzero((self.planted_type == crop_type_id) & (self.planted_year == year_sel)))
+        m = (crop_type == crop_type_id) & (year == year_sel)
+        ym = y[m]
+        counts = np.bincount(month[m], minlength=13)
+        sums = np.bincount(month[m], weights=ym, minlength=13)
+        n_events = int(events[m].sum())
+        total = float(ym.sum()) if n_events else 0.0
+        return {
+            "planted_count": planted,
+            "harvest_events": n_events,
+            "total_yield": total,
+            "avg_yield": total / n_events if n_events else 0.0,
+            "monthly": [{"month": int(k), "total_yield": float(sums[k])} for k in np.nonzero(counts)[0]],
+        }
+
+
+# -------------------------------
+# Store
+# -------------------------------
+def load_columns(conn, cur, user_id, version):
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT c.crop_type_id, h.date, h.yield_amount
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p}
+        ORDER BY h.id
+    """, (user_id,))
+    harvests = []
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        harvests.append((r["crop_type_id"] or 0, to_date(r["date"]), float(r["yield_amount"]), 1))
+
+    # archived years (partitions.py): one weighted row per rollup
+    cur.execute(f"""
+        SELECT c.crop_type_id, r.year, r.month, r.events, r.total_yield
+        FROM harvest_rollups r
+        JOIN crops c ON r.crop_id = c.id
+        WHERE c.user_id = {p}
+    """, (user_id,))
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        harvests.append((r["crop_type_id"] or 0, date_cls(int(r["year"]), int(r["month"]), 1),
+                         float(r["total_yield"]), int(r["events"])))
+
+    cur.execute(f"SELECT crop_type_id, planting_date FROM crops WHERE user_id = {p}", (user_id,))
+    plantings = []
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        plantings.append((r["crop_type_id"] or 0, to_date(r["planting_date"])))
+    return HarvestColumns(version, harvests, plantings)
+
+def put_snapshot(user_id, snap):
+    global _bytes
+    with _lock:
+        old = _snapshots.pop(user_id, None)
+        if old is not None:
+            _bytes -= old.nbytes()
+        _snapshots[user_id] = snap
+        _bytes += snap.nbytes()
+        budget = HARVEST_STORE_BUDGET_MB * 1024 * 1024
+        while _bytes > budget and len(_snapshots) > 1:
+            _, evicted = _snapshots.popitem(last=False)
+            _bytes -= evicted.nbytes()
+            metrics.inc("harvest_store.evictions")
+        metrics.set_gauge("harvest_store.users", len(_snapshots))
+        metrics.set_gauge("harvest_store.bytes", _bytes)
+
+def harvest_snapshot(conn, cur, user_id):
+    """The user's columns at the current data version, or None (store disabled / bad id)."""
+    if not HARVEST_STORE_ENABLED:
+        return None
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    version = get_data_version(conn, cur, user_id)
+    with _lock:
+        snap = _snapshots.get(user_id)
+        # newer is fine too: a replica read may lag the snapshot's appends
+        if snap is not None and snap.version >= version:
+            _snapshots.move_to_end(user_id)
+            metrics.inc("harvest_store.hits")
+            return snap
+
+    metrics.inc("harvest_store.loads")
+    snap = load_columns(conn, cur, user_id, version)
+    # a write landed while loading: serve it, but don't cache a mislabelled snapshot
+    if get_data_version(conn, cur, user_id) == version:
+        put_snapshot(user_id, snap)
+    return snap
+
+def append_harvest(user_id, version, crop_type_id, day, yield_kg):
+    """After add_harvest commits: extend the snapshot if it is exactly one write behind."""
+    global _bytes
+    if not HARVEST_STORE_ENABLED:
+        return
+    with _lock:
+        snap = _snapshots.get(int(user_id))
+        if snap is None:
+            return
+        if snap.version != version - 1:
+            # missed a write: reload on next read
+            _snapshots.pop(int(user_id))
+            _bytes -= snap.nbytes()
+            return
+        _bytes -= snap.nbytes()
+        snap.append(crop_type_id or 0, to_date(day), float(yield_kg))
+        snap.version = version
+        _bytes += snap.nbytes()
+    metrics.inc("harvest_store.appends")
+
+def verified(name, from_store, sql_fn):
+    """HARVEST_STORE_VERIFY: compare with the SQL path and serve SQL on mismatch."""
+    if not HARVEST_STORE_VERIFY:
+        return from_store
+    from_sql = sql_fn()
+    if not same_result(from_store, from_sql):
+        metrics.inc(f"harvest_store.{name}.mismatches")
+        print(f"harvest store mismatch in {name}: {from_store!r} != {from_sql!r}")
+        return from_sql
+    metrics.inc(f"harvest_store.{name}.verified")
+    return from_store
+
+def same_result(a, b, tol=1e-6):
+    # floats within tol: SUM order differs between SQL plans and bincount
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_result(a[k], b[k], tol) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_result(x, y, tol) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(float(a) - float(b)) <= tol * max(1.0, abs(float(a)))
+    return a == b
@@ -2,9 +2,17 @@ from flask import Blueprint, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import uuid
+import time
 import re
 
 from crop_tracker.model import get_db
+from crop_tracker.dataversion import bump_data_version, notify_user_write
+from crop_tracker.priors import move_crop, forget_crop
+from crop_tracker.sketches import rebuild_crop_types
+from crop_tracker.orgs import move_org_crop, forget_org_crop
+from crop_tracker.croptypes import resolve_crop_type
+from crop_tracker.sync import record_crop_tombstones
+from crop_tracker.shards import place_user, shard_row_id
 
 # -----------------------------
 # Blueprints
@@ -115,6 +123,8 @@ def register():
         user_id = cur.lastrowid
 
     conn.close()
+    # SHARD_MODE: the user's crops and harvests live in their shard file
+    place_user(user_id)
     return jsonify({"success": True, "userId": user_id}), 201
 
 
@@ -249,16 +259,24 @@ def add_crop(user_id):
     if not planting_date or not validate_date(planting_date):
         return jsonify({"error": "Invalid or missing planting date."}), 400
 
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     ph = placeholder(conn)
 
+    crop_type_id = resolve_crop_type(cur, is_postgres_connection(conn), name)
+    version = bump_data_version(conn, cur, user_id)
+    columns = ["user_id", "name", "area", "planting_date", "crop_type_id", "version", "updated_at"]
+    values = [user_id, name.strip(), area, planting_date, crop_type_id, version, time.time()]
+    crop_id = shard_row_id(conn, user_id, version)
+    if crop_id is not None:
+        columns, values = ["id"] + columns, [crop_id] + values
     cur.execute(
-        f"INSERT INTO crops (user_id, name, area, planting_date) VALUES ({ph}, {ph}, {ph}, {ph})",
-        (user_id, name.strip(), area, planting_date),
+        f"INSERT INTO crops ({', '.join(columns)}) VALUES ({', '.join([ph] * len(values))})",
+        tuple(values),
     )
     conn.commit()
     conn.close()
+    notify_user_write(user_id)
 
     return jsonify({"message": "Crop added successfully!"}), 201
 
@@ -273,7 +291,7 @@ def get_crops(user_id):
 
     offset = (page - 1) * limit
 
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     ph = placeholder(conn)
 
@@ -319,7 +337,7 @@ def update_crop(crop_id, user_id):
     if not planting_date or not validate_date(planting_date):
         return jsonify({"error": "Invalid or missing planting date."}), 400
 
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     ph = placeholder(conn)
 
@@ -333,19 +351,27 @@ def update_crop(crop_id, user_id):
         conn.close()
         return jsonify({"error": "Unauthorized or invalid crop"}), 403
 
+    crop_type_id = resolve_crop_type(cur, is_postgres_connection(conn), name)
+    version = bump_data_version(conn, cur, user_id)
     cur.execute(
-        f"UPDATE crops SET name={ph}, area={ph}, planting_date={ph} WHERE id={ph}",
-        (name.strip(), area, planting_date, crop_id),
+        f"""UPDATE crops SET name={ph}, area={ph}, planting_date={ph}, crop_type_id={ph},
+                  version={ph}, updated_at={ph}
+            WHERE id={ph}""",
+        (name.strip(), area, planting_date, crop_type_id, version, time.time(), crop_id),
     )
+    move_crop(conn, cur, crop, {"id": crop_id, "name": name.strip(), "area": area, "planting_date": planting_date})
+    rebuild_crop_types(conn, cur, user_id, [crop.get("crop_type_id"), crop_type_id])
+    move_org_crop(conn, cur, user_id, crop, crop_type_id)
     conn.commit()
     conn.close()
+    notify_user_write(user_id)
 
     return jsonify({"message": "Crop updated successfully!"}), 200
 
 
 @crop_routes.route("/crop/<int:crop_id>/<int:user_id>", methods=["DELETE"])
 def delete_crop(crop_id, user_id):
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     ph = placeholder(conn)
 
@@ -359,8 +385,15 @@ def delete_crop(crop_id, user_id):
         conn.close()
         return jsonify({"error": "Unauthorized or invalid crop"}), 403
 
+    forget_crop(conn, cur, crop)
+    forget_org_crop(conn, cur, user_id, crop)
+    version = bump_data_version(conn, cur, user_id)
+    # tombstones for the crop and its (cascade-deleted) harvests, for /api/sync
+    record_crop_tombstones(conn, cur, user_id, crop_id, version)
     cur.execute(f"DELETE FROM crops WHERE id={ph}", (crop_id,))
+    rebuild_crop_types(conn, cur, user_id, [crop.get("crop_type_id")])
     conn.commit()
     conn.close()
+    notify_user_write(user_id)
 
     return jsonify({"message": "Crop deleted successfully!"}), 200
@@ -0,0 +1,166 @@
+# croptypes.py — Normalized crop-type dictionary (crop_types table)
+#
+# crops.name keeps what the farmer typed; crops.crop_type_id points at one
+# row per normalized name ("maize", " Maize " -> same id), and analytics
+# join/group on that integer key. The name <-> id map is cached in memory
+# per database, and only for rows that were already committed when read.
+# With SHARD_MODE the ids are allocated in the directory database and each
+# shard file keeps a copy of the rows its crops point at.
+import threading
+
+from crop_tracker.shards import is_shard, directory_path
+
+_by_key = {}   # (database, normalized key) -> id
+_by_id = {}    # (database, id) -> display name
+_lock = threading.Lock()
+
+
+# -------------------------------
+# Normalization
+# -------------------------------
+def normalize_crop_name(name) -> str:
+    # case/whitespace-insensitive key
+    return " ".join(str(name or "").split()).casefold()
+
+def display_crop_name(name) -> str:
+    return " ".join(str(name or "").split())
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def database_key(conn):
+    """Which database's crop_types ids conn sees; None -> not cached."""
+    if is_shard(conn):
+        return directory_path()   # shard files copy the directory's ids
+    dsn = getattr(conn, "dsn", None)   # psycopg2
+    if dsn is not None:
+        return dsn
+    return getattr(conn, "database_path", None)
+
+def cached_id(cur, key):
+    db = database_key(cur.connection)
+    with _lock:
+        return _by_key.get((db, key)) if db is not None else None
+
+def remember(cur, type_id, key, name):
+    db = database_key(cur.connection)
+    if db is None:
+        return
+    with _lock:
+        _by_key[(db, key)] = int(type_id)
+        _by_id[(db, int(type_id))] = name
+
+
+# -------------------------------
+# Lookups
+# -------------------------------
+def lookup_crop_type(cur, pg, name, table="crop_types", cache=True):
+    """
+    id for a crop name, or None if no crop of that type exists yet.
+    cache=False for a row this transaction may have just inserted: it is
+    not remembered until a later lookup sees it committed.
+    """
+    key = normalize_crop_name(name)
+    if not key:
+        return None
+    type_id = cached_id(cur, key)
+    if type_id is not None:
+        return type_id
+
+    p = "%s" if pg else "?"
+    cur.execute(f"SELECT id, name_key, name FROM {table} WHERE name_key = {p}", (key,))
+    row = row_to_dict(cur.fetchone())
+    if not row:
+        return None
+    if cache:
+        remember(cur, row["id"], row["name_key"], row["name"])
+    return int(row["id"])
+
+def resolve_crop_type(cur, pg, name):
+    """id for a crop name, creating the crop_types row on first use."""
+    sharded = is_shard(cur.connection)
+    table = "directory.crop_types" if sharded else "crop_types"
+    type_id = lookup_crop_type(cur, pg, name, table)
+    if type_id is None:
+        p = "%s" if pg else "?"
+        cur.execute(f"""
+            INSERT INTO {table} (name_key, name) VALUES ({p}, {p})
+            ON CONFLICT (name_key) DO NOTHING
+        """, (normalize_crop_name(name), display_crop_name(name)))
+        # rowcount 1: the row is ours and uncommitted (the caller may roll back)
+        type_id = lookup_crop_type(cur, pg, name, table, cache=cur.rowcount != 1)
+
+    if sharded and type_id is not None:
+        # shard copy for the crops.crop_type_id foreign key
+        cur.execute("SELECT 1 FROM main.crop_types WHERE id = ?", (type_id,))
+        if cur.fetchone() is None:
+            cur.execute("""
+                INSERT OR IGNORE INTO main.crop_types (id, name_key, name)
+                SELECT id, name_key, name FROM directory.crop_types WHERE id = ?
+            """, (type_id,))
+    return type_id
+
+def crop_type_name(cur, pg, type_id):
+    if type_id is None:
+        return None
+    db = database_key(cur.connection)
+    with _lock:
+        name = _by_id.get((db, int(type_id)))
+    if name is not None:
+        return name
+
+    p = "%s" if pg else "?"
+    cur.execute(f"SELECT id, name_key, name FROM crop_types WHERE id = {p}", (int(type_id),))
+    row = row_to_dict(cur.fetchone())
+    if not row:
+        return None
+    remember(cur, row["id"], row["name_key"], row["name"])
+    return row["name"]
+
+def crop_type_names(cur, pg, type_ids):
+    """{id: name} for several ids (one query for cache misses)."""
+    ids = {int(t) for t in type_ids if t is not None}
+    db = database_key(cur.connection)
+    with _lock:
+        out = {t: _by_id[(db, t)] for t in ids if (db, t) in _by_id}
+    missing = sorted(ids - set(out))
+    if missing:
+        p = "%s" if pg else "?"
+        cur.execute(
+            f"SELECT id, name_key, name FROM crop_types WHERE id IN ({','.join([p] * len(missing))})",
+            tuple(missing),
+        )
+        for row in cur.fetchall():
+            row = row_to_dict(row)
+            remember(cur, row["id"], row["name_key"], row["name"])
+            out[int(row["id"])] = row["name"]
+    return out
+
+
+# -------------------------------
+# Backfill (migration): crops.crop_type_id from crops.name
+# -------------------------------
+def backfill_crop_types(cur, pg):
+    p = "%s" if pg else "?"
+    cur.execute("SELECT DISTINCT name FROM crops WHERE crop_type_id IS NULL")
+    names = [row_to_dict(r)["name"] for r in cur.fetchall()]
+    for name in names:
+        type_id = resolve_crop_type(cur, pg, name)
+        if type_id is None:
+            continue
+        cur.execute(
+            f"UPDATE crops SET crop_type_id = {p} WHERE name = {p} AND crop_type_id IS NULL",
+            (type_id, name),
+        )
+    return len(names)
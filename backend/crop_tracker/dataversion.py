@@ -0,0 +1,86 @@
+# dataversion.py — Per-user data version + write notifications
+#
+# Every crop/harvest write bumps the user's version inside its own
+# transaction; derived data (materialized predictions, caches) is stamped
+# with the version it was computed from and is fresh while they match.
+import time
+import threading
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_value(row, key):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row[key]
+    return row[0]
+
+
+# -------------------------------
+# Versions
+# -------------------------------
+def bump_data_version(conn, cur, user_id):
+    """Increment (or create) the user's version; call before conn.commit()."""
+    p = ph(conn)
+    cur.execute(f"""
+        INSERT INTO user_data_versions (user_id, version, updated_at)
+        VALUES ({p}, 1, {p})
+        ON CONFLICT (user_id) DO UPDATE
+        SET version = user_data_versions.version + 1,
+            updated_at = excluded.updated_at
+    """, (int(user_id), time.time()))
+    return get_data_version(conn, cur, user_id)
+
+def lock_data_version(conn, cur, user_id):
+    """
+    Take the user's version row lock (SQLite: the write lock) without
+    bumping it: their writes wait until this transaction ends. Returns the
+    version.
+    """
+    p = ph(conn)
+    cur.execute(f"""
+        INSERT INTO user_data_versions (user_id, version, updated_at)
+        VALUES ({p}, 0, {p})
+        ON CONFLICT (user_id) DO UPDATE SET updated_at = user_data_versions.updated_at
+    """, (int(user_id), time.time()))
+    return get_data_version(conn, cur, user_id)
+
+def get_data_version(conn, cur, user_id):
+    p = ph(conn)
+    cur.execute(f"SELECT version FROM user_data_versions WHERE user_id = {p}", (int(user_id),))
+    v = row_value(cur.fetchone(), "version")
+    return int(v) if v is not None else 0
+
+
+# -------------------------------
+# Write notifications (after commit)
+# -------------------------------
+def on_user_write(callback):
+    """Register callback(user_id) to run after a user's data changes."""
+    with _listeners_lock:
+        _listeners.append(callback)
+    return callback
+
+def notify_user_write(user_id):
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for cb in listeners:
+        try:
+            cb(int(user_id))
+        except Exception as e:
+            print(f"user write listener failed: {e}")
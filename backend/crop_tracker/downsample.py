@@ -0,0 +1,65 @@
+# downsample.py — Shape-preserving downsampling of (x, y) series for charts
+#
+# Both take the points as an iterator sorted by x plus their count (the
+# SQL returns it with a window COUNT), and yield the kept points in one
+# pass, holding at most two buckets of points at a time:
+#   lttb   — Largest-Triangle-Three-Buckets (Steinarsson): first and last
+#            point, plus the one point per bucket spanning the largest
+#            triangle with the previously kept point and the next bucket's
+#            average. Keeps the visual shape with exactly max_points.
+#   minmax — the lowest and highest point of each of max_points // 2
+#            buckets, in x order: keeps every peak and trough.
+# Points are tuples whose first two items are x and y; the rest ride along.
+
+METHODS = ("lttb", "minmax")
+
+
+def take(it, count):
+    return [next(it) for _ in range(count)]
+
+def lttb(points, n, max_points):
+    it = iter(points)
+    if n <= max_points or n < 3:
+        yield from it
+        return
+
+    buckets = max_points - 2
+    # bucket j holds points [1 + j*(n-2)//buckets, 1 + (j+1)*(n-2)//buckets)
+    def bucket_size(j):
+        return (j + 1) * (n - 2) // buckets - j * (n - 2) // buckets
+
+    kept = next(it)
+    yield kept
+    current = take(it, bucket_size(0))
+    for j in range(buckets):
+        if j + 1 < buckets:
+            following = take(it, bucket_size(j + 1))
+            avg_x = sum(p[0] for p in following) / len(following)
+            avg_y = sum(p[1] for p in following) / len(following)
+        else:
+            last = next(it)
+            following = None
+            avg_x, avg_y = last[0], last[1]
+
+        ax, ay = kept[0], kept[1]
+        kept = max(current, key=lambda p: abs((ax - avg_x) * (p[1] - ay) - (ax - p[0]) * (avg_y - ay)))
+        yield kept
+        current = following
+    yield last
+
+def minmax(points, n, max_points):
+    it = iter(points)
+    buckets = max_points // 2
+    if n <= max_points or buckets < 1:
+        yield from it
+        return
+
+    for j in range(buckets):
+        chunk = take(it, (j + 1) * n // buckets - j * n // buckets)
+        lo = min(range(len(chunk)), key=lambda i: chunk[i][1])
+        hi = max(range(len(chunk)), key=lambda i: chunk[i][1])
+        for i in sorted({lo, hi}):
+            yield chunk[i]
+
+def downsample(method, points, n, max_points):
+    return (lttb if method == "lttb" else minmax)(points, n, max_points)
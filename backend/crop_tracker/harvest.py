@@ -1,6 +1,22 @@
+import math
+import time
+from itertools import chain, groupby
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from crop_tracker.model import get_db
+from crop_tracker.dataversion import bump_data_version, notify_user_write
+from crop_tracker.priors import record_harvest
+from crop_tracker.croptypes import lookup_crop_type
+from crop_tracker.singleflight import coalesced
+from crop_tracker.columnstore import harvest_snapshot, append_harvest, verified
+from crop_tracker.partitions import harvest_facts, harvest_days, writable_harvests
+from crop_tracker.shards import shard_row_id
+from crop_tracker.downsample import downsample, METHODS
+from crop_tracker.orgs import record_org_harvest
+from crop_tracker.sketches import (
+    KllSketch, record_yield, user_sketch, histogram, auto_edges, percentiles, error_summary,
+    DEFAULT_EDGES, DEFAULT_LABELS,
+)
 
 harvest_routes = Blueprint("harvest_routes", __name__, url_prefix="/api")
 
@@ -69,7 +85,7 @@ def add_harvest(crop_id, user_id):
     except ValueError:
         return jsonify({"error": "Yield must be a number"}), 400
 
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     p = ph(conn)
 
@@ -85,12 +101,23 @@ def add_harvest(crop_id, user_id):
         return jsonify({"error": "Unauthorized or invalid crop"}), 403
 
     # Insert harvest
+    version = bump_data_version(conn, cur, user_id)
+    columns = ["crop_id", "date", "yield_amount", "version", "updated_at"]
+    values = [crop_id, date, yield_amount, version, time.time()]
+    harvest_id = shard_row_id(conn, user_id, version)
+    if harvest_id is not None:
+        columns, values = ["id"] + columns, [harvest_id] + values
     cur.execute(
-        f"INSERT INTO harvests (crop_id, date, yield_amount) VALUES ({p}, {p}, {p})",
-        (crop_id, date, yield_amount)
+        f"INSERT INTO {writable_harvests(conn)} ({', '.join(columns)}) VALUES ({', '.join([p] * len(values))})",
+        tuple(values)
     )
+    record_harvest(conn, cur, crop, yield_amount)
+    record_yield(conn, cur, user_id, crop.get("crop_type_id"), date, yield_amount)
+    record_org_harvest(conn, cur, user_id, crop, date, yield_amount)
     conn.commit()
     conn.close()
+    append_harvest(user_id, version, crop.get("crop_type_id"), date, yield_amount)
+    notify_user_write(user_id)
 
     return jsonify({"message": "Harvest recorded successfully"}), 201
 
@@ -104,7 +131,7 @@ def get_harvests():
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
 
-    conn = get_db()
+    conn = get_db(user_id=user_id)
     cur = conn.cursor()
     p = ph(conn)
 
@@ -133,20 +160,21 @@ def get_harvest_stats():
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
 
-    conn = get_db()
+    conn = get_db("read", user_id)
     cur = conn.cursor()
     p = ph(conn)
 
     cur.execute(f"""
-        SELECT c.name AS crop_name,
+        SELECT COALESCE(t.name, 'Unknown') AS crop_name,
                SUM(h.yield_amount) AS total_yield,
                AVG(h.yield_amount) AS avg_yield,
                COUNT(h.id) AS harvest_count,
                MAX(h.date) AS last_cropping_date
         FROM harvests h
         JOIN crops c ON h.crop_id = c.id
+        LEFT JOIN crop_types t ON t.id = c.crop_type_id
         WHERE c.user_id = {p}
-        GROUP BY c.name
+        GROUP BY t.id, t.name
         ORDER BY total_yield DESC
     """, (user_id,))
     stats_rows = rows_to_list(cur.fetchall())
@@ -172,166 +200,95 @@ def get_harvest_stats():
 # =====================================================
 # GET /api/harvests/summary/yearly?user_id=1
 # =====================================================
+def yearly_totals(conn, cur, user_id):
+    return yearly_from_facts(cur, *harvest_facts(conn, user_id))
+
+
+def yearly_from_facts(cur, facts, params):
+    cur.execute(f"""
+        WITH hv AS ({facts})
+        SELECT year, SUM(total_yield) AS total_yield
+        FROM hv
+        GROUP BY year
+        ORDER BY year
+    """, params)
+
+    rows = rows_to_list(cur.fetchall())
+    return [{"year": str(r.get("year")), "total_yield": float(r.get("total_yield") or 0)} for r in rows]
+
+
 @harvest_routes.route("/harvests/summary/yearly", methods=["GET"])
+@coalesced("summary_yearly", args=("user_id",))
 def summary_yearly():
     user_id = request.args.get("user_id")
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
 
-    conn = get_db()
+    conn = get_db("read", user_id)
     cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
-
-    if pg:
-        cur.execute(f"""
-            SELECT EXTRACT(YEAR FROM h.date)::INT AS year,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-            GROUP BY year
-            ORDER BY year
-        """, (user_id,))
+    snap = harvest_snapshot(conn, cur, user_id)
+    if snap is not None:
+        yearly = verified("summary_yearly", snap.yearly_totals(), lambda: yearly_totals(conn, cur, user_id))
     else:
-        cur.execute(f"""
-            SELECT strftime('%Y', h.date) AS year,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-            GROUP BY year
-            ORDER BY year
-        """, (user_id,))
-
-    rows = rows_to_list(cur.fetchall())
+        yearly = yearly_totals(conn, cur, user_id)
     conn.close()
 
-    yearly = []
-    for r in rows:
-        yearly.append({
-            "year": str(r.get("year")),
-            "total_yield": float(r.get("total_yield") or 0)
-        })
-
     return jsonify({"yearly": yearly}), 200
 
 
 # =====================================================
 # GET /api/harvests/summary/top-crops-yearly?user_id=1&from=2023&to=2025&top=10
 # =====================================================
-@harvest_routes.route("/harvests/summary/top-crops-yearly", methods=["GET"])
-def top_crops_yearly():
-    user_id = request.args.get("user_id")
-    year_from = request.args.get("from", type=int)
-    year_to = request.args.get("to", type=int)
-    top_n = request.args.get("top", default=10, type=int)
-
-    if not user_id:
-        return jsonify({"error": "User not logged in"}), 401
-    if year_from is None or year_to is None:
-        return jsonify({"error": "from and to years are required"}), 400
-    if year_from > year_to:
-        return jsonify({"error": "from year must be <= to year"}), 400
-
-    top_n = max(1, min(top_n, 30))
-
-    conn = get_db()
-    cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
-
-    # Top crops total
-    if pg:
-        cur.execute(f"""
-            SELECT c.name AS crop_name,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT BETWEEN {p} AND {p}
-            GROUP BY c.name
-            ORDER BY total_yield DESC
+def top_crops_by_year(conn, cur, user_id, year_from, year_to, top_n):
+    facts, params = harvest_facts(conn, user_id, year_from, year_to)
+    return top_crops_from_facts(cur, facts, params, year_from, year_to, top_n)
+
+
+def top_crops_from_facts(cur, facts, params, year_from, year_to, top_n):
+    """
+    One statement: the facts in range are scanned once (hv), the top-N crop
+    types ranked from it, and the per-year totals and the year x top-crop
+    breakdown returned as tagged rows of one UNION ALL. Crops without a
+    crop type rank together as "Unknown" (type key 0).
+    """
+    cur.execute(f"""
+        WITH hv AS ({facts}),
+        top AS (
+            SELECT COALESCE(crop_type_id, 0) AS crop_type_id, SUM(total_yield) AS total_yield
+            FROM hv
+            GROUP BY COALESCE(crop_type_id, 0)
+            ORDER BY total_yield DESC, crop_type_id
             LIMIT {int(top_n)}
-        """, (user_id, year_from, year_to))
-    else:
-        cur.execute(f"""
-            SELECT c.name AS crop_name,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) BETWEEN {p} AND {p}
-            GROUP BY c.name
-            ORDER BY total_yield DESC
-            LIMIT {p}
-        """, (user_id, year_from, year_to, top_n))
-
-    top_rows = rows_to_list(cur.fetchall())
-    top_names = [r["crop_name"] for r in top_rows]
-
-    # Total by year (all crops)
-    if pg:
-        cur.execute(f"""
-            SELECT EXTRACT(YEAR FROM h.date)::INT AS year,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT BETWEEN {p} AND {p}
-            GROUP BY year
-            ORDER BY year
-        """, (user_id, year_from, year_to))
-    else:
-        cur.execute(f"""
-            SELECT CAST(strftime('%Y', h.date) AS INTEGER) AS year,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) BETWEEN {p} AND {p}
-            GROUP BY year
-            ORDER BY year
-        """, (user_id, year_from, year_to))
-
-    all_totals = rows_to_list(cur.fetchall())
-    all_total_by_year = {int(r["year"]): float(r.get("total_yield") or 0) for r in all_totals}
-
-    # Breakdown: year x crop (only top crops)
+        )
+        SELECT 'top' AS kind,
+               CAST(NULL AS INTEGER) AS year,
+               COALESCE(t.name, 'Unknown') AS crop_name,
+               top.total_yield AS total_yield
+        FROM top
+        LEFT JOIN crop_types t ON t.id = top.crop_type_id
+        UNION ALL
+        SELECT 'year', hv.year, CAST(NULL AS TEXT), SUM(hv.total_yield)
+        FROM hv
+        GROUP BY hv.year
+        UNION ALL
+        SELECT 'year_crop', hv.year, COALESCE(t.name, 'Unknown'), SUM(hv.total_yield)
+        FROM hv
+        JOIN top ON top.crop_type_id = COALESCE(hv.crop_type_id, 0)
+        LEFT JOIN crop_types t ON t.id = top.crop_type_id
+        GROUP BY hv.year, top.crop_type_id, t.name
+        ORDER BY kind, total_yield DESC
+    """, params)
+
+    top_names = []
+    all_total_by_year = {}
     top_year_crop = []
-    if top_names:
-        if pg:
-            placeholders = ",".join([p] * len(top_names))
-            cur.execute(f"""
-                SELECT EXTRACT(YEAR FROM h.date)::INT AS year,
-                       c.name AS crop_name,
-                       SUM(h.yield_amount) AS total_yield
-                FROM harvests h
-                JOIN crops c ON h.crop_id = c.id
-                WHERE c.user_id = {p}
-                  AND EXTRACT(YEAR FROM h.date)::INT BETWEEN {p} AND {p}
-                  AND c.name IN ({placeholders})
-                GROUP BY year, c.name
-                ORDER BY year, c.name
-            """, (user_id, year_from, year_to, *top_names))
+    for r in rows_to_list(cur.fetchall()):
+        if r["kind"] == "top":
+            top_names.append(r["crop_name"])
+        elif r["kind"] == "year":
+            all_total_by_year[int(r["year"])] = float(r.get("total_yield") or 0)
         else:
-            placeholders = ",".join(["?"] * len(top_names))
-            cur.execute(f"""
-                SELECT CAST(strftime('%Y', h.date) AS INTEGER) AS year,
-                       c.name AS crop_name,
-                       SUM(h.yield_amount) AS total_yield
-                FROM harvests h
-                JOIN crops c ON h.crop_id = c.id
-                WHERE c.user_id = ?
-                  AND CAST(strftime('%Y', h.date) AS INTEGER) BETWEEN ? AND ?
-                  AND c.name IN ({placeholders})
-                GROUP BY year, c.name
-                ORDER BY year, c.name
-            """, (user_id, year_from, year_to, *top_names))
-
-        top_year_crop = rows_to_list(cur.fetchall())
-
-    conn.close()
+            top_year_crop.append(r)
 
     years = list(range(year_from, year_to + 1))
     year_map = {y: {"year": str(y)} for y in years}
@@ -348,18 +305,90 @@ def top_crops_yearly():
         top_sum = sum(float(year_map[y].get(name, 0.0) or 0.0) for name in top_names)
         year_map[y]["Others"] = max(0.0, all_total - top_sum)
 
+    return top_names, [year_map[y] for y in years]
+
+
+@harvest_routes.route("/harvests/summary/top-crops-yearly", methods=["GET"])
+def top_crops_yearly():
+    user_id = request.args.get("user_id")
+    year_from = request.args.get("from", type=int)
+    year_to = request.args.get("to", type=int)
+    top_n = request.args.get("top", default=10, type=int)
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if year_from is None or year_to is None:
+        return jsonify({"error": "from and to years are required"}), 400
+    if year_from > year_to:
+        return jsonify({"error": "from year must be <= to year"}), 400
+
+    top_n = max(1, min(top_n, 30))
+
+    conn = get_db("read", user_id)
+    cur = conn.cursor()
+    top_names, series = top_crops_by_year(conn, cur, user_id, year_from, year_to, top_n)
+    conn.close()
+
     return jsonify({
         "from": year_from,
         "to": year_to,
         "top": top_n,
         "top_names": top_names,
-        "series": [year_map[y] for y in years]
+        "series": series
     }), 200
 
 
 # =====================================================
 # GET /api/harvests/filter/crop-year?user_id=1&crop=Maize&year=2024
 # =====================================================
+def crop_year_stats(conn, cur, user_id, crop_type_id, year):
+    """
+    Planted count, harvest totals and the monthly breakdown in one statement:
+    tagged rows of a UNION ALL over the crop's harvests in that year (hv).
+    """
+    p = ph(conn)
+    if is_postgres(conn):
+        planted_year_expr = "EXTRACT(YEAR FROM planting_date)::INT"
+    else:
+        planted_year_expr = "CAST(strftime('%Y', planting_date) AS INTEGER)"
+
+    facts, params = harvest_facts(conn, user_id, year, year, crop_type_ids=[crop_type_id])
+    cur.execute(f"""
+        WITH hv AS ({facts})
+        SELECT 'planted' AS kind,
+               CAST(NULL AS INTEGER) AS month,
+               COUNT(*) AS n,
+               0 AS total_yield,
+               0 AS avg_yield
+        FROM crops
+        WHERE user_id = {p}
+          AND crop_type_id = {p}
+          AND {planted_year_expr} = {p}
+        UNION ALL
+        SELECT 'harvests', NULL, COALESCE(SUM(events), 0),
+               COALESCE(SUM(total_yield), 0),
+               COALESCE(SUM(total_yield) / SUM(events), 0)
+        FROM hv
+        UNION ALL
+        SELECT 'month', month, SUM(events), COALESCE(SUM(total_yield), 0), 0
+        FROM hv
+        GROUP BY month
+        ORDER BY kind, month
+    """, params + (user_id, crop_type_id, year))
+
+    out = {"planted_count": 0, "harvest_events": 0, "total_yield": 0.0, "avg_yield": 0.0, "monthly": []}
+    for r in rows_to_list(cur.fetchall()):
+        if r["kind"] == "planted":
+            out["planted_count"] = int(r.get("n") or 0)
+        elif r["kind"] == "harvests":
+            out["harvest_events"] = int(r.get("n") or 0)
+            out["total_yield"] = float(r.get("total_yield") or 0)
+            out["avg_yield"] = float(r.get("avg_yield") or 0)
+        else:
+            out["monthly"].append({"month": int(r["month"]), "total_yield": float(r.get("total_yield") or 0)})
+    return out
+
+
 @harvest_routes.route("/harvests/filter/crop-year", methods=["GET"])
 def crop_year_filter():
     user_id = request.args.get("user_id")
@@ -373,101 +402,150 @@ def crop_year_filter():
     if year is None:
         return jsonify({"error": "year is required"}), 400
 
-    conn = get_db()
+    conn = get_db("read", user_id)
     cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
-
-    # planted count
-    if pg:
-        cur.execute(f"""
-            SELECT COUNT(*) AS planted_count
-            FROM crops
-            WHERE user_id = {p}
-              AND name = {p}
-              AND EXTRACT(YEAR FROM planting_date)::INT = {p}
-        """, (user_id, crop, year))
+    # unknown crop name -> None, which matches no rows
+    crop_type_id = lookup_crop_type(cur, is_postgres(conn), crop)
+    snap = harvest_snapshot(conn, cur, user_id)
+    if snap is not None:
+        stats = verified("crop_year", snap.crop_year(crop_type_id, year),
+                         lambda: crop_year_stats(conn, cur, user_id, crop_type_id, year))
     else:
-        cur.execute(f"""
-            SELECT COUNT(*) AS planted_count
-            FROM crops
-            WHERE user_id = {p}
-              AND name = {p}
-              AND CAST(strftime('%Y', planting_date) AS INTEGER) = {p}
-        """, (user_id, crop, year))
+        stats = crop_year_stats(conn, cur, user_id, crop_type_id, year)
+    conn.close()
 
-    planted_row = row_to_dict(cur.fetchone())
+    return jsonify(dict(stats, crop=crop, year=year)), 200
 
-    # harvest stats
-    if pg:
-        cur.execute(f"""
-            SELECT COUNT(h.id) AS harvest_events,
-                   COALESCE(SUM(h.yield_amount), 0) AS total_yield,
-                   COALESCE(AVG(h.yield_amount), 0) AS avg_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT = {p}
-        """, (user_id, crop, year))
-    else:
-        cur.execute(f"""
-            SELECT COUNT(h.id) AS harvest_events,
-                   COALESCE(SUM(h.yield_amount), 0) AS total_yield,
-                   COALESCE(AVG(h.yield_amount), 0) AS avg_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) = {p}
-        """, (user_id, crop, year))
-
-    harvest_row = row_to_dict(cur.fetchone())
-
-    # monthly breakdown
-    if pg:
-        cur.execute(f"""
-            SELECT EXTRACT(MONTH FROM h.date)::INT AS month,
-                   COALESCE(SUM(h.yield_amount), 0) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT = {p}
-            GROUP BY month
-            ORDER BY month
-        """, (user_id, crop, year))
-    else:
-        cur.execute(f"""
-            SELECT CAST(strftime('%m', h.date) AS INTEGER) AS month,
-                   COALESCE(SUM(h.yield_amount), 0) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) = {p}
-            GROUP BY month
-            ORDER BY month
-        """, (user_id, crop, year))
-
-    monthly_rows = rows_to_list(cur.fetchall())
+
+# =====================================================
+# GET /api/harvests/compare?user_id=1&years=2022,2024,2025[&crop=Maize]
+# =====================================================
+MAX_COMPARE_YEARS = 50
+
+
+def compare_years(conn, cur, user_id, years, crop_type_ids=None):
+    """
+    Per requested year: harvests, total / average yield and kg per acre
+    (total over the area of the crops harvested that year), with deltas and
+    growth (%) against the previous requested year. One statement: facts
+    (live rows + archived rollups) of the requested years only, grouped by
+    year, LEFT JOINed onto the requested years and compared with LAG. LAG
+    runs over the requested years, so the years between them are never read.
+    """
+    p = ph(conn)
+    facts, params = harvest_facts(conn, user_id, crop_type_ids=crop_type_ids, years=years)
+    requested = ", ".join([f"({p})"] * len(years))
+    cur.execute(f"""
+        WITH hv AS ({facts}),
+        years (year) AS (VALUES {requested}),
+        per AS (
+            SELECT year, SUM(events) AS harvests, SUM(total_yield) AS total_yield
+            FROM hv
+            GROUP BY year
+        ),
+        acres AS (
+            SELECT y.year, SUM(c.area) AS area
+            FROM (SELECT DISTINCT year, crop_id FROM hv) y
+            JOIN crops c ON c.id = y.crop_id
+            GROUP BY y.year
+        ),
+        cmp AS (
+            SELECT years.year,
+                   COALESCE(per.harvests, 0) AS harvests,
+                   COALESCE(per.total_yield, 0) AS total_yield,
+                   CASE WHEN per.harvests > 0 THEN per.total_yield / per.harvests END AS avg_yield,
+                   COALESCE(acres.area, 0) AS area,
+                   CASE WHEN acres.area > 0 THEN per.total_yield / acres.area END AS yield_per_acre
+            FROM years
+            LEFT JOIN per ON per.year = years.year
+            LEFT JOIN acres ON acres.year = years.year
+        )
+        SELECT year, harvests, total_yield, avg_yield, area, yield_per_acre,
+               LAG(year) OVER w AS prev_year,
+               total_yield - LAG(total_yield) OVER w AS total_delta,
+               avg_yield - LAG(avg_yield) OVER w AS avg_delta,
+               yield_per_acre - LAG(yield_per_acre) OVER w AS per_acre_delta,
+               CASE WHEN LAG(total_yield) OVER w > 0
+                    THEN 100.0 * (total_yield - LAG(total_yield) OVER w) / LAG(total_yield) OVER w
+               END AS total_growth_pct,
+               CASE WHEN LAG(yield_per_acre) OVER w > 0
+                    THEN 100.0 * (yield_per_acre - LAG(yield_per_acre) OVER w) / LAG(yield_per_acre) OVER w
+               END AS per_acre_growth_pct
+        FROM cmp
+        WINDOW w AS (ORDER BY year)
+        ORDER BY year
+    """, params + tuple(years))
+
+    def num(value):
+        return None if value is None else round(float(value), 4)
+
+    return [{
+        "year": int(r["year"]),
+        "harvests": int(r.get("harvests") or 0),
+        "total_yield": float(r.get("total_yield") or 0),
+        "avg_yield": num(r.get("avg_yield")),
+        "area": float(r.get("area") or 0),
+        "yield_per_acre": num(r.get("yield_per_acre")),
+        "prev_year": None if r.get("prev_year") is None else int(r["prev_year"]),
+        "total_yield_delta": num(r.get("total_delta")),
+        "avg_yield_delta": num(r.get("avg_delta")),
+        "yield_per_acre_delta": num(r.get("per_acre_delta")),
+        "total_yield_growth_pct": num(r.get("total_growth_pct")),
+        "yield_per_acre_growth_pct": num(r.get("per_acre_growth_pct")),
+    } for r in rows_to_list(cur.fetchall())]
+
+
+@harvest_routes.route("/harvests/compare", methods=["GET"])
+def compare():
+    user_id = request.args.get("user_id")
+    crop = request.args.get("crop")
+    years = parse_numbers(request.args.get("years", ""))
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if not years or any(not math.isfinite(y) or y != int(y) for y in years):
+        return jsonify({"error": "years must be a comma-separated list of years"}), 400
+    years = sorted({int(y) for y in years})
+    if len(years) > MAX_COMPARE_YEARS:
+        return jsonify({"error": f"at most {MAX_COMPARE_YEARS} years"}), 400
+    if years[0] < 1 or years[-1] > 9998:
+        return jsonify({"error": "years out of range"}), 400
+
+    conn = get_db("read", user_id)
+    cur = conn.cursor()
+    crop_type_ids = None
+    if crop:
+        crop_type_id = lookup_crop_type(cur, is_postgres(conn), crop)
+        # unknown crop name -> every year empty
+        crop_type_ids = [crop_type_id if crop_type_id is not None else -1]
+    rows = compare_years(conn, cur, user_id, years, crop_type_ids)
     conn.close()
 
-    return jsonify({
-        "crop": crop,
-        "year": year,
-        "planted_count": int(planted_row.get("planted_count") or 0),
-        "harvest_events": int(harvest_row.get("harvest_events") or 0),
-        "total_yield": float(harvest_row.get("total_yield") or 0),
-        "avg_yield": float(harvest_row.get("avg_yield") or 0),
-        "monthly": [{"month": int(r["month"]), "total_yield": float(r.get("total_yield") or 0)} for r in monthly_rows]
-    }), 200
+    return jsonify({"crop": crop, "years": rows}), 200
 
 
 # =====================================================
 # GET /api/harvests/seasonality?user_id=1&from=2023&to=2025
 # =====================================================
+def seasonality_by_month(conn, cur, user_id, year_from, year_to):
+    return seasonality_from_facts(cur, *harvest_facts(conn, user_id, year_from, year_to))
+
+
+def seasonality_from_facts(cur, facts, params):
+    cur.execute(f"""
+        WITH hv AS ({facts})
+        SELECT month, SUM(total_yield) AS total_yield
+        FROM hv
+        GROUP BY month
+        ORDER BY month
+    """, params)
+
+    rows = rows_to_list(cur.fetchall())
+    return [{"month": int(r["month"]), "total_yield": float(r.get("total_yield") or 0)} for r in rows]
+
+
 @harvest_routes.route("/harvests/seasonality", methods=["GET"])
+@coalesced("seasonality", args=("user_id", "from", "to"))
 def seasonality():
     user_id = request.args.get("user_id")
     year_from = request.args.get("from", type=int)
@@ -478,101 +556,223 @@ def seasonality():
     if year_from is None or year_to is None:
         return jsonify({"error": "from and to years are required"}), 400
 
-    conn = get_db()
+    conn = get_db("read", user_id)
     cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
-
-    if pg:
-        cur.execute(f"""
-            SELECT EXTRACT(MONTH FROM h.date)::INT AS month,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT BETWEEN {p} AND {p}
-            GROUP BY month
-            ORDER BY month
-        """, (user_id, year_from, year_to))
+    snap = harvest_snapshot(conn, cur, user_id)
+    if snap is not None:
+        monthly = verified("seasonality", snap.monthly_totals(year_from, year_to),
+                           lambda: seasonality_by_month(conn, cur, user_id, year_from, year_to))
     else:
-        cur.execute(f"""
-            SELECT CAST(strftime('%m', h.date) AS INTEGER) AS month,
-                   SUM(h.yield_amount) AS total_yield
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) BETWEEN {p} AND {p}
-            GROUP BY month
-            ORDER BY month
-        """, (user_id, year_from, year_to))
-
-    rows = rows_to_list(cur.fetchall())
+        monthly = seasonality_by_month(conn, cur, user_id, year_from, year_to)
     conn.close()
 
-    return jsonify({
-        "monthly": [{"month": int(r["month"]), "total_yield": float(r.get("total_yield") or 0)} for r in rows]
-    }), 200
+    return jsonify({"monthly": monthly}), 200
 
 
 # =====================================================
 # GET /api/harvests/distribution?user_id=1&from=2023&to=2025
+#     [&crop=Maize] [&edges=100,500,1000 | &bins=8]
 # =====================================================
+def yield_distribution(conn, cur, user_id, year_from, year_to):
+    """Exact default buckets straight from the rows (benchmarks' reference)."""
+    facts, params = harvest_facts(conn, user_id, year_from, year_to)
+    cur.execute(f"""
+        WITH hv AS ({facts})
+        SELECT bucket AS label, SUM(events) AS count
+        FROM hv
+        GROUP BY bucket
+        ORDER BY count DESC, label
+    """, params)
+
+    rows = rows_to_list(cur.fetchall())
+    return [{"label": r["label"], "count": int(r.get("count") or 0)} for r in rows]
+
+
+def parse_numbers(value):
+    """Comma-separated finite numbers, or None ("nan" / "inf" parse as floats)."""
+    try:
+        numbers = [float(x) for x in value.split(",") if x.strip()]
+    except ValueError:
+        return None
+    return numbers if all(math.isfinite(x) for x in numbers) else None
+
+
+def sketch_selection(conn, cur, user_id, year_from, year_to, crop):
+    if not crop:
+        return user_sketch(conn, cur, user_id, year_from, year_to)
+    crop_type_id = lookup_crop_type(cur, is_postgres(conn), crop)
+    if crop_type_id is None:
+        return KllSketch()   # unknown crop name: no harvests
+    return user_sketch(conn, cur, user_id, year_from, year_to, [crop_type_id])
+
+
 @harvest_routes.route("/harvests/distribution", methods=["GET"])
 def distribution():
     user_id = request.args.get("user_id")
     year_from = request.args.get("from", type=int)
     year_to = request.args.get("to", type=int)
+    crop = request.args.get("crop")
+    edges = request.args.get("edges")
+    bins = request.args.get("bins", type=int)
 
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
     if year_from is None or year_to is None:
         return jsonify({"error": "from and to years are required"}), 400
+    if edges is not None:
+        edges = parse_numbers(edges)
+        if not edges or edges != sorted(set(edges)) or edges[0] <= 0:
+            return jsonify({"error": "edges must be increasing positive numbers"}), 400
+    if bins is not None and not 1 <= bins <= 100:
+        return jsonify({"error": "bins must be between 1 and 100"}), 400
+
+    conn = get_db("read", user_id)
+    cur = conn.cursor()
+    sketch = sketch_selection(conn, cur, user_id, year_from, year_to, crop)
+    conn.close()
+
+    if edges:
+        buckets = histogram(sketch, edges)
+    elif bins:
+        lower, auto = auto_edges(sketch, bins)
+        buckets = histogram(sketch, auto, lower) if sketch.n else []
+    else:
+        # the fixed kg buckets, non-empty ones by count (as before)
+        buckets = [b for b in histogram(sketch, DEFAULT_EDGES, labels=DEFAULT_LABELS) if b["count"] > 0]
+        buckets.sort(key=lambda b: (-b["count"], b["label"]))
+
+    return jsonify({**error_summary(sketch), "buckets": buckets}), 200
 
-    conn = get_db()
+
+# =====================================================
+# GET /api/harvests/percentiles?user_id=1&from=2023&to=2025[&crop=Maize][&p=10,50,90]
+# =====================================================
+@harvest_routes.route("/harvests/percentiles", methods=["GET"])
+def yield_percentiles():
+    user_id = request.args.get("user_id")
+    year_from = request.args.get("from", type=int)
+    year_to = request.args.get("to", type=int)
+    crop = request.args.get("crop")
+    qs = parse_numbers(request.args.get("p", "5,25,50,75,95"))
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if year_from is None or year_to is None:
+        return jsonify({"error": "from and to years are required"}), 400
+    if not qs or any(q < 0 or q > 100 for q in qs):
+        return jsonify({"error": "p must be percentiles between 0 and 100"}), 400
+
+    conn = get_db("read", user_id)
     cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
+    sketch = sketch_selection(conn, cur, user_id, year_from, year_to, crop)
+    conn.close()
 
+    return jsonify({**error_summary(sketch), "percentiles": percentiles(sketch, qs)}), 200
+
+
+# =====================================================
+# GET /api/harvests/timeseries?user_id=1&interval=week[&from=2015&to=2025]
+#     [&crop=Maize][&max_points=500][&method=lttb|minmax]
+# =====================================================
+def period_expr(pg, interval, col):
+    """Start of the day / ISO week (Monday) / month containing col, as YYYY-MM-DD."""
     if pg:
-        cur.execute(f"""
-            SELECT
-              CASE
-                WHEN h.yield_amount < 10 THEN '0-9'
-                WHEN h.yield_amount < 50 THEN '10-49'
-                WHEN h.yield_amount < 100 THEN '50-99'
-                WHEN h.yield_amount < 200 THEN '100-199'
-                ELSE '200+'
-              END AS label,
-              COUNT(*) AS count
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND EXTRACT(YEAR FROM h.date)::INT BETWEEN {p} AND {p}
-            GROUP BY label
-            ORDER BY count DESC
-        """, (user_id, year_from, year_to))
-    else:
-        cur.execute(f"""
-            SELECT
-              CASE
-                WHEN h.yield_amount < 10 THEN '0-9'
-                WHEN h.yield_amount < 50 THEN '10-49'
-                WHEN h.yield_amount < 100 THEN '50-99'
-                WHEN h.yield_amount < 200 THEN '100-199'
-                ELSE '200+'
-              END AS label,
-              COUNT(*) AS count
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND CAST(strftime('%Y', h.date) AS INTEGER) BETWEEN {p} AND {p}
-            GROUP BY label
-            ORDER BY count DESC
-        """, (user_id, year_from, year_to))
+        if interval == "day":
+            return f"to_char({col}, 'YYYY-MM-DD')"
+        return f"to_char(date_trunc('{interval}', {col}), 'YYYY-MM-DD')"
+    return {
+        "day": f"date({col})",
+        "week": f"date({col}, 'weekday 0', '-6 days')",
+        "month": f"strftime('%Y-%m-01', {col})",
+    }[interval]
+
+
+def stream_rows(cur, size=1000):
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        for r in rows:
+            yield row_to_dict(r)
+
+
+def yield_timeseries(conn, cur, user_id, interval, year_from, year_to, crop_type_ids, max_points, method):
+    """
+    Per crop type: harvest totals per period, downsampled to max_points.
+    Rows arrive ordered by crop type and period with the crop's point count,
+    so each series is reduced as it streams past (see downsample.py).
+    """
+    days, params = harvest_days(conn, user_id, year_from, year_to, crop_type_ids)
+    period = period_expr(is_postgres(conn), interval, "hv.day")
+    cur.execute(f"""
+        WITH hv AS ({days}),
+        per AS (
+            SELECT hv.crop_type_id, {period} AS period,
+                   SUM(hv.events) AS harvests, SUM(hv.total_yield) AS total_yield
+            FROM hv
+            GROUP BY 1, 2
+        )
+        SELECT per.crop_type_id, t.name AS crop_name, per.period, per.harvests, per.total_yield,
+               COUNT(*) OVER (PARTITION BY per.crop_type_id) AS points
+        FROM per
+        LEFT JOIN crop_types t ON t.id = per.crop_type_id
+        ORDER BY per.crop_type_id, per.period
+    """, params)
+
+    series = []
+    for _, rows in groupby(stream_rows(cur), key=lambda r: r["crop_type_id"]):
+        first = next(rows)
+        points = (
+            (datetime.strptime(str(r["period"])[:10], "%Y-%m-%d").toordinal(),
+             float(r.get("total_yield") or 0), str(r["period"])[:10], int(r["harvests"]))
+            for r in chain([first], rows)
+        )
+        kept = downsample(method, points, int(first["points"]), max_points)
+        series.append({
+            "crop": first["crop_name"],
+            "points_total": int(first["points"]),
+            "points": [{"date": d, "total_yield": y, "harvests": n} for _, y, d, n in kept],
+        })
+    return series
 
-    rows = rows_to_list(cur.fetchall())
+
+@harvest_routes.route("/harvests/timeseries", methods=["GET"])
+def timeseries():
+    user_id = request.args.get("user_id")
+    interval = request.args.get("interval", "month")
+    year_from = request.args.get("from", type=int)
+    year_to = request.args.get("to", type=int)
+    crop = request.args.get("crop")
+    max_points = request.args.get("max_points", default=500, type=int)
+    method = request.args.get("method", "lttb")
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if interval not in ("day", "week", "month"):
+        return jsonify({"error": "interval must be day, week or month"}), 400
+    if (year_from is None) != (year_to is None):
+        return jsonify({"error": "from and to years go together"}), 400
+    if year_from is not None and year_from > year_to:
+        return jsonify({"error": "from year must be <= to year"}), 400
+    if method not in METHODS:
+        return jsonify({"error": "method must be lttb or minmax"}), 400
+
+    max_points = max(4, min(max_points, 5000))
+
+    conn = get_db("read", user_id)
+    cur = conn.cursor()
+    crop_type_ids = None
+    if crop:
+        crop_type_id = lookup_crop_type(cur, is_postgres(conn), crop)
+        # unknown crop name -> no series
+        crop_type_ids = [crop_type_id if crop_type_id is not None else -1]
+    series = yield_timeseries(conn, cur, user_id, interval, year_from, year_to,
+                              crop_type_ids, max_points, method)
     conn.close()
 
     return jsonify({
-        "buckets": [{"label": r["label"], "count": int(r.get("count") or 0)} for r in rows]
+        "interval": interval,
+        "method": method,
+        "max_points": max_points,
+        "series": series,
     }), 200
@@ -0,0 +1,39 @@
+# metrics.py — In-process counters, gauges and timing summaries
+import threading
+
+_counters = {}
+_gauges = {}
+_summaries = {}
+_lock = threading.Lock()
+
+
+def inc(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def observe(name, value):
+    with _lock:
+        s = _summaries.get(name)
+        if s is None:
+            s = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0}
+            _summaries[name] = s
+        s["count"] += 1
+        s["sum"] += value
+        s["last"] = value
+        if value > s["max"]:
+            s["max"] = value
+
+def snapshot():
+    with _lock:
+        summaries = {}
+        for name, s in _summaries.items():
+            summaries[name] = dict(s, avg=(s["sum"] / s["count"]) if s["count"] else 0.0)
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "summaries": summaries,
+        }
@@ -1,50 +1,80 @@
 import os
 import sqlite3
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
 from urllib.parse import urlparse
 
+from crop_tracker.querylog import TimedSqliteConnection, pg_cursor_class
+from crop_tracker.croptypes import backfill_crop_types
+from crop_tracker.replicas import read_connection
+from crop_tracker.partitions import attach_partitions
+from crop_tracker.shards import sharding_enabled, shard_connection
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-SQLITE_PATH = os.path.join(BASE_DIR, "database.db")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(BASE_DIR, "database.db"))
+# Postgres DDL is run by an operator (`python -m crop_tracker.model migrate`),
+# as the app has never changed the production schema by itself; set to 1 to
+# let the first request apply pending migrations instead.
+PG_AUTO_MIGRATE = os.environ.get("PG_AUTO_MIGRATE", "0") == "1"
 
-def get_db():
+def get_db(role="primary", user_id=None):
     """
     Uses PostgreSQL if DATABASE_URL is set (Render),
     otherwise uses SQLite (local development).
+    Cursors are timed (see querylog.py) for the slow-query log.
+
+    role="read" returns a DATABASE_READ_URL replica when one is healthy and
+    user_id has not written recently (see replicas.py), else the primary.
+    Read connections must not be written to.
+
+    On SQLite, year partition files are attached behind a `harvests` view
+    (see partitions.py) except for role="schema" (migrations, maintenance).
+
+    With SHARD_MODE set (SQLite only), a user_id selects that user's shard
+    file (see shards.py); without one, or for users not yet moved to a
+    shard, this is the directory database at SQLITE_PATH.
     """
+    sharded = sharding_enabled()
+    if sharded and user_id is not None and role != "schema":
+        conn = shard_connection(user_id)
+        if conn is not None:
+            return conn
+
+    if role == "read" and not sharded:
+        conn = read_connection(user_id)
+        if conn is not None:
+            return conn
+
     db_url = os.environ.get("DATABASE_URL")
 
     # ---- LOCAL: SQLite
     if not db_url:
-        conn = sqlite3.connect(SQLITE_PATH)
+        conn = sqlite3.connect(SQLITE_PATH, factory=TimedSqliteConnection)
+        conn.database_path = SQLITE_PATH
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
+        if role != "schema":
+            attach_partitions(conn)
         return conn
 
     # ---- Render sometimes gives postgres://
     if db_url.startswith("postgres://"):
         db_url = db_url.replace("postgres://", "postgresql://", 1)
 
-    # ---- POSTGRESQL
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
+    # ---- POSTGRESQL (driver imported on first use: SQLite mode never loads it)
+    import psycopg2
+    return psycopg2.connect(db_url, cursor_factory=pg_cursor_class())
 
 
-def init_db():
-    """
-    Create tables ONLY for SQLite.
-    PostgreSQL tables should already exist.
-    """
-    db_url = os.environ.get("DATABASE_URL")
-
-    # If PostgreSQL → DO NOT auto-create tables
-    if db_url:
-        print("PostgreSQL detected – skipping SQLite init_db()")
+# -------------------------------
+# Schema versioning
+# SQLite keeps the version in PRAGMA user_version, Postgres in schema_meta.
+# Migrations must be idempotent: several workers may start at once.
+# -------------------------------
+def migrate_base_tables(cur, pg):
+    # PostgreSQL base tables are provisioned outside the app
+    if pg:
         return
 
-    # SQLite init (local only)
-    conn = get_db()
-    cur = conn.cursor()
-
     cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -85,5 +115,424 @@ def init_db():
         )
     """)
 
-    conn.commit()
-    conn.close()
+
+def migrate_prediction_store(cur, pg):
+    # Per-user data version (bumped on every crop/harvest write) and the
+    # materialized prediction for each crop, stamped with that version.
+    if pg:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS user_data_versions (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                version BIGINT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                crop_id INTEGER PRIMARY KEY REFERENCES crops(id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                data_version BIGINT NOT NULL,
+                payload TEXT NOT NULL,
+                computed_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+        return
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS predictions (
+            crop_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            computed_at REAL NOT NULL,
+            FOREIGN KEY (crop_id) REFERENCES crops(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def migrate_crop_priors(cur, pg):
+    # Global kg/acre histograms per (crop name, planting month); see priors.py.
+    # month 0 holds the crop-wide histogram.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS crop_prior_hist (
+            crop_name TEXT NOT NULL,
+            month INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (crop_name, month, bucket)
+        )
+    """)
+
+def add_column(cur, pg, table, column, decl):
+    if pg:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {decl}")
+        return
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [r[1] for r in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def migrate_crop_types(cur, pg):
+    # One row per normalized crop name; crops.crop_type_id is the integer key
+    # analytics join/group on (see croptypes.py). crops.name is kept as typed.
+    if pg:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS crop_types (
+                id SERIAL PRIMARY KEY,
+                name_key TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL
+            )
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS crop_types (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name_key TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL
+            )
+        """)
+
+    add_column(cur, pg, "crops", "crop_type_id", "INTEGER REFERENCES crop_types(id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_crops_user_type ON crops (user_id, crop_type_id)")
+    backfill_crop_types(cur, pg)
+
+    # priors are now keyed by normalized name: let the refresher rebuild them
+    cur.execute("DELETE FROM crop_prior_hist")
+
+def migrate_sync_tracking(cur, pg):
+    # Change tracking for GET /api/sync (see sync.py): rows are stamped with
+    # the user's data version at write time; deletes leave tombstones.
+    # Rows written before this migration keep version 0.
+    real = "DOUBLE PRECISION" if pg else "REAL"
+    for table in ("crops", "harvests"):
+        add_column(cur, pg, table, "version", "BIGINT NOT NULL DEFAULT 0" if pg else "INTEGER NOT NULL DEFAULT 0")
+        add_column(cur, pg, table, "updated_at", real)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_crops_user_version ON crops (user_id, version)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_harvests_crop_version ON harvests (crop_id, version)")
+
+    if pg:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sync_tombstones (
+                id BIGSERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                version BIGINT NOT NULL,
+                deleted_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS sync_tombstones (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                deleted_at REAL NOT NULL
+            )
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_user_version ON sync_tombstones (user_id, version)")
+
+def migrate_report_jobs(cur, pg):
+    # DB-backed queue for async reports (see reports.py); one row per
+    # distinct spec (spec_hash), claimed by worker processes.
+    if pg:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id SERIAL PRIMARY KEY,
+                spec_hash TEXT UNIQUE NOT NULL,
+                spec TEXT NOT NULL,
+                status TEXT NOT NULL,
+                done_steps INTEGER NOT NULL DEFAULT 0,
+                total_steps INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                worker TEXT,
+                created_at DOUBLE PRECISION NOT NULL,
+                started_at DOUBLE PRECISION,
+                heartbeat_at DOUBLE PRECISION,
+                finished_at DOUBLE PRECISION
+            )
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                spec_hash TEXT UNIQUE NOT NULL,
+                spec TEXT NOT NULL,
+                status TEXT NOT NULL,
+                done_steps INTEGER NOT NULL DEFAULT 0,
+                total_steps INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs (status, id)")
+
+def migrate_harvest_archive(cur, pg):
+    # Year partitions / cold archive (see partitions.py): archived years are
+    # kept as rollups per (crop, year, month, yield bucket). The date index
+    # serves the range filters the year-range analytics now use.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_harvests_crop_date ON harvests (crop_id, date)")
+    real = "DOUBLE PRECISION" if pg else "REAL"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS harvest_rollups (
+            crop_id INTEGER NOT NULL REFERENCES crops(id) ON DELETE CASCADE,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            events INTEGER NOT NULL,
+            total_yield {real} NOT NULL,
+            PRIMARY KEY (crop_id, year, month, bucket)
+        )
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS harvest_archive (
+            year INTEGER PRIMARY KEY,
+            row_count INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            archived_at {real} NOT NULL
+        )
+    """)
+
+def migrate_shard_map(cur, pg):
+    # SHARD_MODE (see shards.py): which shard file holds each user's data.
+    # Sharding is SQLite-only; shard files get the table too (unused there).
+    if pg:
+        return
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS shard_map (
+            user_id INTEGER PRIMARY KEY,
+            shard TEXT NOT NULL,
+            placed_at REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_shard_map_shard ON shard_map (shard)")
+
+def migrate_yield_sketches(cur, pg):
+    # Mergeable yield quantile sketches per (user, crop type, harvest year),
+    # see sketches.py. Existing users' sketches are built on first read.
+    blob = "BYTEA" if pg else "BLOB"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS yield_sketches (
+            user_id INTEGER NOT NULL,
+            crop_type_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            sketch {blob} NOT NULL,
+            PRIMARY KEY (user_id, crop_type_id, year)
+        )
+    """)
+
+def migrate_organizations(cur, pg):
+    # Cooperatives (see orgs.py): memberships plus per (org, crop type,
+    # year, month) harvest rollups kept current by every member's writes.
+    # With SHARD_MODE they live in the directory database.
+    real = "DOUBLE PRECISION" if pg else "REAL"
+    if pg:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS organizations (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                created_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS organizations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS org_members (
+            org_id INTEGER NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            joined_at {real} NOT NULL,
+            PRIMARY KEY (org_id, user_id)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_org_members_user ON org_members (user_id)")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS org_rollups (
+            org_id INTEGER NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+            crop_type_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            events INTEGER NOT NULL,
+            total_yield {real} NOT NULL,
+            PRIMARY KEY (org_id, crop_type_id, year, month)
+        )
+    """)
+
+
+def migrate_scheduler(cur, pg):
+    # Background jobs (see scheduler.py): one row per job holds the shared
+    # schedule and the lease that lets a single process run it. Reset
+    # tokens are looked up by token and purged by expiry.
+    real = "DOUBLE PRECISION" if pg else "REAL"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+            name TEXT PRIMARY KEY,
+            next_run_at {real} NOT NULL,
+            locked_until {real} NOT NULL DEFAULT 0,
+            owner TEXT,
+            last_started_at {real},
+            last_duration_s {real},
+            last_status TEXT,
+            last_error TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reset_tokens_token ON reset_tokens (token)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reset_tokens_expiry ON reset_tokens (expiry)")
+
+
+def migrate_prediction_priors(cur, pg):
+    # Stored predictions also depend on the global priors (see priors.py):
+    # they are stamped with the priors generation they were computed from.
+    add_column(cur, pg, "predictions", "priors_generation",
+               "BIGINT NOT NULL DEFAULT 0" if pg else "INTEGER NOT NULL DEFAULT 0")
+
+
+def migrate_report_requester(cur, pg):
+    # Reports are readable only by the user who requested them; jobs from
+    # before this migration have no requester and are readable by nobody.
+    add_column(cur, pg, "report_jobs", "requested_by", "INTEGER")
+
+
+def migrate_org_invites(cur, pg):
+    # Managers invite farmers; the invitee's history joins the org rollups
+    # only when they accept (see orgs.py). Directory database with SHARD_MODE.
+    real = "DOUBLE PRECISION" if pg else "REAL"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS org_invites (
+            org_id INTEGER NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            invited_by INTEGER,
+            created_at {real} NOT NULL,
+            PRIMARY KEY (org_id, user_id)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_org_invites_user ON org_invites (user_id)")
+
+
+MIGRATIONS = [
+    (1, migrate_base_tables),
+    (2, migrate_prediction_store),
+    (3, migrate_crop_priors),
+    (4, migrate_crop_types),
+    (5, migrate_sync_tracking),
+    (6, migrate_report_jobs),
+    (7, migrate_harvest_archive),
+    (8, migrate_shard_map),
+    (9, migrate_yield_sketches),
+    (10, migrate_organizations),
+    (11, migrate_scheduler),
+    (12, migrate_prediction_priors),
+    (13, migrate_report_requester),
+    (14, migrate_org_invites),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def is_postgres(conn) -> bool:
+    return not isinstance(conn, sqlite3.Connection)
+
+def read_schema_version(cur, pg):
+    if not pg:
+        cur.execute("PRAGMA user_version")
+        return int(cur.fetchone()[0])
+
+    cur.execute("SELECT to_regclass('schema_meta') AS t")
+    if cur.fetchone()["t"] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM schema_meta")
+    return int(cur.fetchone()["v"])
+
+def write_schema_version(cur, pg, version):
+    if not pg:
+        cur.execute(f"PRAGMA user_version = {int(version)}")
+        return
+
+    cur.execute("CREATE TABLE IF NOT EXISTS schema_meta (version INTEGER NOT NULL)")
+    cur.execute("DELETE FROM schema_meta")
+    cur.execute("INSERT INTO schema_meta (version) VALUES (%s)", (int(version),))
+
+def migrate_connection(conn):
+    """Run the pending MIGRATIONS on one database (also used for shard files)."""
+    cur = conn.cursor()
+    pg = is_postgres(conn)
+
+    current = read_schema_version(cur, pg)
+    for version, migrate in MIGRATIONS:
+        if version > current:
+            migrate(cur, pg)
+            write_schema_version(cur, pg, version)
+            conn.commit()
+
+def init_db(force=False):
+    """
+    Bring the schema up to SCHEMA_VERSION. Skips all DDL when the stored
+    version is already current (one cheap read). On Postgres only with
+    force=True (the migrate command) or PG_AUTO_MIGRATE=1; otherwise a
+    pending migration is reported and the app starts on the current schema.
+    """
+    global _schema_ready
+    conn = get_db(role="schema")
+    try:
+        if is_postgres(conn) and not (force or PG_AUTO_MIGRATE):
+            current = read_schema_version(conn.cursor(), True)
+            if current < SCHEMA_VERSION:
+                print(f"PostgreSQL schema is at version {current}, the app expects {SCHEMA_VERSION}: "
+                      "run `python -m crop_tracker.model migrate`")
+        else:
+            migrate_connection(conn)
+    finally:
+        conn.close()
+    _schema_ready = True
+
+def ensure_schema():
+    """
+    Deferred init_db(): run once per process, on the first request, so
+    importing the app never touches the database.
+    """
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            init_db()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database schema")
+    parser.add_argument("command", choices=["migrate", "version"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        init_db(force=True)
+        print(f"schema at version {SCHEMA_VERSION}")
+    else:
+        conn = get_db(role="schema")
+        print(f"schema at version {read_schema_version(conn.cursor(), is_postgres(conn))}, app expects {SCHEMA_VERSION}")
+        conn.close()
@@ -0,0 +1,609 @@
+# orgs.py — Organizations (cooperatives) + org-level harvest analytics
+#
+# org_members maps farmers to organizations (role manager or member).
+# Managers only invite (org_invites); a farmer's history joins an org's
+# rollups once they accept.
+# org_rollups keeps, per (org, crop type, year, month), the harvest count
+# and yield total over all members, updated inside each write's own
+# transaction like the priors: add_harvest adds one event, a crop
+# update/delete moves or subtracts that crop's harvests, and joining or
+# leaving adds or subtracts the member's whole history. The org stats /
+# yearly / top-crops / seasonality routes read only those rows, so their
+# cost depends on crops x months, not on the number of members.
+#
+# With SHARD_MODE the org tables live in the directory database: a member's
+# writes reach them through the `directory` schema attached to their shard
+# connection, in the same transaction.
+#
+#   python -m crop_tracker.orgs rebuild   # recompute every org's rollups
+import time
+import argparse
+from flask import Blueprint, request, jsonify
+
+from crop_tracker.model import get_db
+from crop_tracker.dataversion import lock_data_version
+from crop_tracker.partitions import date_parts
+from crop_tracker.shards import directory_table
+
+org_routes = Blueprint("org_routes", __name__, url_prefix="/api")
+
+ROLES = ("manager", "member")
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def rows_to_list(rows):
+    return [row_to_dict(r) for r in rows]
+
+
+# -------------------------------
+# Rollup maintenance (inside the caller's transaction)
+# -------------------------------
+def member_orgs(conn, cur, user_id):
+    cur.execute(
+        f"SELECT org_id FROM {directory_table(conn, 'org_members')} WHERE user_id = {ph(conn)}",
+        (int(user_id),),
+    )
+    return [int(row_to_dict(r)["org_id"]) for r in cur.fetchall()]
+
+def harvest_aggregates(conn, cur, user_id, crop_id=None):
+    """{(crop_type_id, year, month): [events, total_yield]} over live harvests + archived rollups."""
+    p = ph(conn)
+    year_expr, month_expr = date_parts(is_postgres(conn), "h.date")
+    where, params = f"c.user_id = {p}", [int(user_id)]
+    if crop_id is not None:
+        where, params = f"{where} AND c.id = {p}", params + [int(crop_id)]
+    cur.execute(f"""
+        SELECT COALESCE(c.crop_type_id, 0) AS crop_type_id, {year_expr} AS year, {month_expr} AS month,
+               COUNT(*) AS events, SUM(h.yield_amount) AS total_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE {where}
+        GROUP BY 1, 2, 3
+        UNION ALL
+        SELECT COALESCE(c.crop_type_id, 0), r.year, r.month, SUM(r.events), SUM(r.total_yield)
+        FROM harvest_rollups r
+        JOIN crops c ON r.crop_id = c.id
+        WHERE {where}
+        GROUP BY 1, 2, 3
+    """, tuple(params) * 2)
+
+    out = {}
+    for r in rows_to_list(cur.fetchall()):
+        agg = out.setdefault((int(r["crop_type_id"]), int(r["year"]), int(r["month"])), [0, 0.0])
+        agg[0] += int(r["events"])
+        agg[1] += float(r["total_yield"] or 0)
+    return out
+
+def apply_org_deltas(conn, cur, org_ids, aggregates, sign):
+    if not org_ids or not aggregates:
+        return
+    p = ph(conn)
+    table = directory_table(conn, "org_rollups")
+    for org_id in org_ids:
+        for (crop_type_id, year, month), (events, total) in aggregates.items():
+            cur.execute(f"""
+                INSERT INTO {table} AS o (org_id, crop_type_id, year, month, events, total_yield)
+                VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+                ON CONFLICT (org_id, crop_type_id, year, month) DO UPDATE
+                SET events = o.events + excluded.events,
+                    total_yield = o.total_yield + excluded.total_yield
+            """, (org_id, crop_type_id, year, month, sign * events, sign * total))
+    cur.execute(
+        f"DELETE FROM {table} WHERE org_id IN ({', '.join([p] * len(org_ids))}) AND events <= 0",
+        tuple(org_ids),
+    )
+
+def record_org_harvest(conn, cur, user_id, crop, day, yield_amount):
+    """add_harvest: one more event for each of the user's orgs."""
+    orgs = member_orgs(conn, cur, user_id)
+    if not orgs:
+        return
+    year, month = int(str(day)[:4]), int(str(day)[5:7])
+    apply_org_deltas(conn, cur, orgs, {(crop.get("crop_type_id") or 0, year, month): [1, float(yield_amount)]}, +1)
+
+def forget_org_crop(conn, cur, user_id, crop):
+    """Before a crop (and its harvests) is deleted."""
+    orgs = member_orgs(conn, cur, user_id)
+    if orgs:
+        apply_org_deltas(conn, cur, orgs, harvest_aggregates(conn, cur, user_id, crop["id"]), -1)
+
+def move_org_crop(conn, cur, user_id, crop, new_crop_type_id):
+    """Crop renamed to another crop type: its harvests move between the orgs' crop rows."""
+    old_type, new_type = crop.get("crop_type_id") or 0, new_crop_type_id or 0
+    if old_type == new_type:
+        return
+    orgs = member_orgs(conn, cur, user_id)
+    if not orgs:
+        return
+    by_month = {}
+    for (_, year, month), agg in harvest_aggregates(conn, cur, user_id, crop["id"]).items():
+        by_month[(year, month)] = agg
+    apply_org_deltas(conn, cur, orgs, {(old_type, y, m): agg for (y, m), agg in by_month.items()}, -1)
+    apply_org_deltas(conn, cur, orgs, {(new_type, y, m): agg for (y, m), agg in by_month.items()}, +1)
+
+
+# -------------------------------
+# Membership
+# -------------------------------
+def join_org(org_id, user_id, role):
+    """Add a member and their harvest history; False if already a member."""
+    conn = get_db(user_id=user_id)   # their data, plus the directory on a shard
+    cur = conn.cursor()
+    p = ph(conn)
+    try:
+        # none of their harvests can commit between the history read and the insert
+        lock_data_version(conn, cur, user_id)
+        if int(org_id) in member_orgs(conn, cur, user_id):
+            conn.rollback()
+            return False
+        cur.execute(
+            f"INSERT INTO {directory_table(conn, 'org_members')} (org_id, user_id, role, joined_at) VALUES ({p}, {p}, {p}, {p})",
+            (int(org_id), int(user_id), role, time.time()),
+        )
+        apply_org_deltas(conn, cur, [int(org_id)], harvest_aggregates(conn, cur, user_id), +1)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+def leave_org(org_id, user_id):
+    """Remove a member and subtract their history; False if not a member."""
+    conn = get_db(user_id=user_id)
+    cur = conn.cursor()
+    p = ph(conn)
+    try:
+        lock_data_version(conn, cur, user_id)
+        if int(org_id) not in member_orgs(conn, cur, user_id):
+            conn.rollback()
+            return False
+        cur.execute(
+            f"DELETE FROM {directory_table(conn, 'org_members')} WHERE org_id = {p} AND user_id = {p}",
+            (int(org_id), int(user_id)),
+        )
+        apply_org_deltas(conn, cur, [int(org_id)], harvest_aggregates(conn, cur, user_id), -1)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+def member_role(conn, cur, org_id, user_id):
+    p = ph(conn)
+    cur.execute(f"SELECT role FROM org_members WHERE org_id = {p} AND user_id = {p}", (org_id, user_id))
+    row = row_to_dict(cur.fetchone())
+    return row["role"] if row else None
+
+def rebuild_org_rollups():
+    """Maintenance: recompute every org's rollups from its members' harvests."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT org_id, user_id FROM org_members ORDER BY user_id")
+    members = [(int(r["org_id"]), int(r["user_id"])) for r in rows_to_list(cur.fetchall())]
+    conn.close()
+
+    totals = {}
+    for org_id, user_id in members:
+        data = get_db(user_id=user_id)
+        try:
+            for key, (events, total) in harvest_aggregates(data, data.cursor(), user_id).items():
+                agg = totals.setdefault((org_id,) + key, [0, 0.0])
+                agg[0] += events
+                agg[1] += total
+        finally:
+            data.close()
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute("DELETE FROM org_rollups")
+    for (org_id, crop_type_id, year, month), (events, total) in totals.items():
+        cur.execute(f"""
+            INSERT INTO org_rollups (org_id, crop_type_id, year, month, events, total_yield)
+            VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+        """, (org_id, crop_type_id, year, month, events, total))
+    conn.commit()
+    conn.close()
+    return len(totals)
+
+
+# -------------------------------
+# Org facts: the harvest_facts row shape over org_rollups
+# -------------------------------
+def org_facts(conn, org_id, year_from=None, year_to=None):
+    p = ph(conn)
+    where, params = [f"org_id = {p}"], [int(org_id)]
+    if year_from is not None:
+        where.append(f"year BETWEEN {p} AND {p}")
+        params += [year_from, year_to]
+    return f"""
+            SELECT crop_type_id, CAST(NULL AS INTEGER) AS crop_id, year, month,
+                   CAST(NULL AS TEXT) AS bucket, events, total_yield
+            FROM org_rollups
+            WHERE {" AND ".join(where)}""", tuple(params)
+
+def org_reader(org_id):
+    """(conn, cur, None) for a member, else (None, None, error response)."""
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return None, None, (jsonify({"error": "User not logged in"}), 401)
+    conn = get_db("read")
+    cur = conn.cursor()
+    if member_role(conn, cur, org_id, user_id) is None:
+        conn.close()
+        return None, None, (jsonify({"error": "Not a member of this organization"}), 403)
+    return conn, cur, None
+
+
+# =====================================================
+# POST /api/orgs   {"user_id": 1, "name": "Kilimo Coop"}
+# GET  /api/orgs?user_id=1
+# =====================================================
+@org_routes.route("/orgs", methods=["POST"])
+def create_org():
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    name = data.get("name")
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if not name or not isinstance(name, str) or name.strip() == "":
+        return jsonify({"error": "Organization name must be a non-empty string."}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute(f"SELECT id FROM users WHERE id = {p}", (user_id,))
+    if cur.fetchone() is None:
+        conn.close()
+        return jsonify({"error": "Unknown user"}), 404
+    cur.execute(f"SELECT id FROM organizations WHERE name = {p}", (name.strip(),))
+    if cur.fetchone() is not None:
+        conn.close()
+        return jsonify({"error": "Organization name already taken"}), 409
+
+    returning = " RETURNING id" if is_postgres(conn) else ""
+    cur.execute(
+        f"INSERT INTO organizations (name, created_at) VALUES ({p}, {p}){returning}",
+        (name.strip(), time.time()),
+    )
+    org_id = row_to_dict(cur.fetchone())["id"] if returning else cur.lastrowid
+    conn.commit()
+    conn.close()
+
+    join_org(org_id, user_id, "manager")
+    return jsonify({"message": "Organization created", "org_id": org_id}), 201
+
+
+@org_routes.route("/orgs", methods=["GET"])
+def list_orgs():
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    conn = get_db("read")
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT o.id, o.name, m.role,
+               (SELECT COUNT(*) FROM org_members a WHERE a.org_id = o.id) AS members
+        FROM org_members m
+        JOIN organizations o ON o.id = m.org_id
+        WHERE m.user_id = {p}
+        ORDER BY o.name
+    """, (user_id,))
+    orgs = rows_to_list(cur.fetchall())
+    conn.close()
+
+    return jsonify({"orgs": [
+        {"id": r["id"], "name": r["name"], "role": r["role"], "members": int(r["members"])} for r in orgs
+    ]}), 200
+
+
+# =====================================================
+# GET    /api/orgs/<org_id>/members?user_id=1
+# POST   /api/orgs/<org_id>/members   {"user_id": 1, "member_id": 7, "role": "member"}  (invites)
+# DELETE /api/orgs/<org_id>/members/<member_id>?user_id=1
+# =====================================================
+@org_routes.route("/orgs/<int:org_id>/members", methods=["GET"])
+def list_members(org_id):
+    conn, cur, error = org_reader(org_id)
+    if error:
+        return error
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT u.id, u.username, m.role, m.joined_at
+        FROM org_members m
+        JOIN users u ON u.id = m.user_id
+        WHERE m.org_id = {p}
+        ORDER BY u.username
+    """, (org_id,))
+    members = rows_to_list(cur.fetchall())
+    conn.close()
+
+    return jsonify({"members": [
+        {"user_id": r["id"], "username": r["username"], "role": r["role"], "joined_at": r["joined_at"]}
+        for r in members
+    ]}), 200
+
+
+@org_routes.route("/orgs/<int:org_id>/members", methods=["POST"])
+def add_member(org_id):
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    member_id = data.get("member_id")
+    role = data.get("role", "member")
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if not member_id:
+        return jsonify({"error": "member_id is required"}), 400
+    if role not in ROLES:
+        return jsonify({"error": "role must be manager or member"}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    try:
+        if member_role(conn, cur, org_id, user_id) != "manager":
+            return jsonify({"error": "Only organization managers can invite members"}), 403
+        cur.execute(f"SELECT id FROM users WHERE id = {p}", (member_id,))
+        if cur.fetchone() is None:
+            return jsonify({"error": "Unknown user"}), 404
+        if member_role(conn, cur, org_id, member_id) is not None:
+            return jsonify({"error": "Already a member"}), 409
+
+        # the member's data is only shared once they accept
+        cur.execute(f"""
+            INSERT INTO org_invites (org_id, user_id, role, invited_by, created_at)
+            VALUES ({p}, {p}, {p}, {p}, {p})
+            ON CONFLICT (org_id, user_id) DO UPDATE
+            SET role = excluded.role, invited_by = excluded.invited_by, created_at = excluded.created_at
+        """, (org_id, member_id, role, user_id, time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+    return jsonify({"message": "Invitation sent"}), 201
+
+
+@org_routes.route("/orgs/<int:org_id>/members/<int:member_id>", methods=["DELETE"])
+def remove_member(org_id, member_id):
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    conn = get_db()
+    cur = conn.cursor()
+    manager = member_role(conn, cur, org_id, user_id) == "manager"
+    conn.close()
+    if not manager and user_id != member_id:
+        return jsonify({"error": "Only organization managers can remove other members"}), 403
+
+    if not leave_org(org_id, member_id):
+        return jsonify({"error": "Not a member"}), 404
+    return jsonify({"message": "Member removed"}), 200
+
+
+# =====================================================
+# GET    /api/orgs/invites?user_id=7
+# POST   /api/orgs/<org_id>/invites/accept   {"user_id": 7}
+# DELETE /api/orgs/<org_id>/invites/<member_id>?user_id=7
+# =====================================================
+@org_routes.route("/orgs/invites", methods=["GET"])
+def list_invites():
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    conn = get_db("read")
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT o.id, o.name, i.role, u.username AS invited_by, i.created_at
+        FROM org_invites i
+        JOIN organizations o ON o.id = i.org_id
+        LEFT JOIN users u ON u.id = i.invited_by
+        WHERE i.user_id = {p}
+        ORDER BY i.created_at
+    """, (user_id,))
+    invites = rows_to_list(cur.fetchall())
+    conn.close()
+
+    return jsonify({"invites": [
+        {"org_id": r["id"], "name": r["name"], "role": r["role"],
+         "invited_by": r["invited_by"], "created_at": r["created_at"]}
+        for r in invites
+    ]}), 200
+
+
+@org_routes.route("/orgs/<int:org_id>/invites/accept", methods=["POST"])
+def accept_invite(org_id):
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute(f"SELECT role FROM org_invites WHERE org_id = {p} AND user_id = {p}", (org_id, user_id))
+    invite = row_to_dict(cur.fetchone())
+    claimed = False
+    if invite:
+        # the guarded delete lets one of two concurrent accepts through
+        cur.execute(f"DELETE FROM org_invites WHERE org_id = {p} AND user_id = {p}", (org_id, user_id))
+        claimed = cur.rowcount == 1
+        conn.commit()
+    conn.close()
+    if not claimed:
+        return jsonify({"error": "No pending invitation"}), 404
+
+    if not join_org(org_id, user_id, invite["role"]):
+        return jsonify({"error": "Already a member"}), 409
+    return jsonify({"message": "Joined organization", "role": invite["role"]}), 201
+
+
+@org_routes.route("/orgs/<int:org_id>/invites/<int:member_id>", methods=["DELETE"])
+def decline_invite(org_id, member_id):
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    try:
+        if user_id != member_id and member_role(conn, cur, org_id, user_id) != "manager":
+            return jsonify({"error": "Only the invitee or a manager can cancel an invitation"}), 403
+        cur.execute(f"DELETE FROM org_invites WHERE org_id = {p} AND user_id = {p}", (org_id, member_id))
+        deleted = cur.rowcount == 1
+        conn.commit()
+    finally:
+        conn.close()
+    if not deleted:
+        return jsonify({"error": "No pending invitation"}), 404
+    return jsonify({"message": "Invitation cancelled"}), 200
+
+
+# =====================================================
+# GET /api/orgs/<org_id>/stats?user_id=1
+# =====================================================
+@org_routes.route("/orgs/<int:org_id>/stats", methods=["GET"])
+def org_stats(org_id):
+    conn, cur, error = org_reader(org_id)
+    if error:
+        return error
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT COALESCE(t.name, 'Unknown') AS crop_name,
+               SUM(r.total_yield) AS total_yield,
+               SUM(r.events) AS harvest_count,
+               MAX(r.year * 100 + r.month) AS last_month
+        FROM org_rollups r
+        LEFT JOIN crop_types t ON t.id = r.crop_type_id
+        WHERE r.org_id = {p}
+        GROUP BY r.crop_type_id, t.name
+        ORDER BY total_yield DESC
+    """, (org_id,))
+    stats_rows = rows_to_list(cur.fetchall())
+    cur.execute(f"SELECT COUNT(*) AS n FROM org_members WHERE org_id = {p}", (org_id,))
+    members = int(row_to_dict(cur.fetchone())["n"])
+    conn.close()
+
+    stats = []
+    for r in stats_rows:
+        count = int(r.get("harvest_count") or 0)
+        total = float(r.get("total_yield") or 0)
+        last = int(r["last_month"])
+        stats.append({
+            "crop_name": r.get("crop_name"),
+            "total_yield": total,
+            "avg_yield": total / count if count else 0.0,
+            "harvest_count": count,
+            "last_harvest_month": f"{last // 100:04d}-{last % 100:02d}",
+        })
+
+    return jsonify({
+        "members": members,
+        "stats": stats,
+        "overall_total_yield": float(sum(s["total_yield"] for s in stats)),
+    }), 200
+
+
+# =====================================================
+# GET /api/orgs/<org_id>/summary/yearly?user_id=1
+# =====================================================
+@org_routes.route("/orgs/<int:org_id>/summary/yearly", methods=["GET"])
+def org_summary_yearly(org_id):
+    from crop_tracker.harvest import yearly_from_facts
+
+    conn, cur, error = org_reader(org_id)
+    if error:
+        return error
+    yearly = yearly_from_facts(cur, *org_facts(conn, org_id))
+    conn.close()
+
+    return jsonify({"yearly": yearly}), 200
+
+
+# =====================================================
+# GET /api/orgs/<org_id>/summary/top-crops-yearly?user_id=1&from=2023&to=2025&top=10
+# =====================================================
+@org_routes.route("/orgs/<int:org_id>/summary/top-crops-yearly", methods=["GET"])
+def org_top_crops_yearly(org_id):
+    from crop_tracker.harvest import top_crops_from_facts
+
+    year_from = request.args.get("from", type=int)
+    year_to = request.args.get("to", type=int)
+    top_n = request.args.get("top", default=10, type=int)
+
+    if year_from is None or year_to is None:
+        return jsonify({"error": "from and to years are required"}), 400
+    if year_from > year_to:
+        return jsonify({"error": "from year must be <= to year"}), 400
+
+    top_n = max(1, min(top_n, 30))
+
+    conn, cur, error = org_reader(org_id)
+    if error:
+        return error
+    facts, params = org_facts(conn, org_id, year_from, year_to)
+    top_names, series = top_crops_from_facts(cur, facts, params, year_from, year_to, top_n)
+    conn.close()
+
+    return jsonify({
+        "from": year_from,
+        "to": year_to,
+        "top": top_n,
+        "top_names": top_names,
+        "series": series
+    }), 200
+
+
+# =====================================================
+# GET /api/orgs/<org_id>/seasonality?user_id=1&from=2023&to=2025
+# =====================================================
+@org_routes.route("/orgs/<int:org_id>/seasonality", methods=["GET"])
+def org_seasonality(org_id):
+    from crop_tracker.harvest import seasonality_from_facts
+
+    year_from = request.args.get("from", type=int)
+    year_to = request.args.get("to", type=int)
+
+    if year_from is None or year_to is None:
+        return jsonify({"error": "from and to years are required"}), 400
+
+    conn, cur, error = org_reader(org_id)
+    if error:
+        return error
+    monthly = seasonality_from_facts(cur, *org_facts(conn, org_id, year_from, year_to))
+    conn.close()
+
+    return jsonify({"monthly": monthly}), 200
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Organization rollup maintenance")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    print(f"{rebuild_org_rollups()} org rollup rows rebuilt")
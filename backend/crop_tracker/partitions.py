@@ -0,0 +1,505 @@
+# partitions.py — Year-partitioned harvest storage + cold-archive compaction
+#
+# Postgres: `harvests` is converted once into a declaratively range
+# partitioned table (one partition per calendar year plus a default):
+#   python -m crop_tracker.partitions partition
+# Queries that filter h.date on a range (see harvest_facts) are pruned by
+# the planner. `ensure --ahead 1` creates next year's partition ahead of
+# time, moving any of its rows out of the default partition.
+#
+# SQLite: `partition` moves closed years out of the main file into one
+# file per year (HARVEST_PARTITION_DIR/harvests_YYYY.db). get_db() attaches
+# them and puts a read-only TEMP VIEW named `harvests` (main + every year)
+# in front of the table, so existing queries still see every row. Inserts
+# name writable_harvests(conn), i.e. main; a crop delete cascades in main
+# only, and its rows left in year files are dropped by every crops join
+# (compaction skips them). harvest_facts() scans only the files whose year
+# is in range. SQLite attaches at most 10 files per connection:
+# compact the oldest years before partitioning more.
+#
+# Compaction: `compact --before 2015` adds per (crop, year, month, yield
+# bucket) rollups to harvest_rollups and moves the detail rows to a
+# read-only archive (SQLite: HARVEST_ARCHIVE_DIR/harvests_YYYY.db, chmod
+# 0444; Postgres: the partition is detached into the `archive` schema).
+# Year-range analytics read rollups next to live rows, so their answers
+# don't change; per-harvest reads (lists, stats, sync, training) no longer
+# see archived rows.
+import os
+import re
+import time
+import stat
+import sqlite3
+import threading
+import argparse
+from datetime import date
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HARVEST_PARTITION_DIR = os.environ.get("HARVEST_PARTITION_DIR", os.path.join(BASE_DIR, "partitions"))
+HARVEST_ARCHIVE_DIR = os.environ.get("HARVEST_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+
+# archived years are cached per database; compaction run from the CLI
+# reaches other processes within this many seconds
+ARCHIVE_CACHE_S = float(os.environ.get("ARCHIVE_CACHE_S", "60"))
+
+PARTITION_FILE = re.compile(r"harvests_(\d{4})\.db")
+
+_archived = {}   # database -> (loaded at, frozenset of archived years)
+_archived_lock = threading.Lock()
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def year_bounds(year_from, year_to):
+    """[from-01-01, (to+1)-01-01): a sargable range on the partition key."""
+    return f"{int(year_from):04d}-01-01", f"{int(year_to) + 1:04d}-01-01"
+
+def date_parts(pg, col):
+    if pg:
+        return f"EXTRACT(YEAR FROM {col})::INT", f"EXTRACT(MONTH FROM {col})::INT"
+    return f"CAST(strftime('%Y', {col}) AS INTEGER)", f"CAST(strftime('%m', {col}) AS INTEGER)"
+
+def bucket_expr(col):
+    return f"""CASE
+                WHEN {col} < 10 THEN '0-9'
+                WHEN {col} < 50 THEN '10-49'
+                WHEN {col} < 100 THEN '50-99'
+                WHEN {col} < 200 THEN '100-199'
+                ELSE '200+'
+              END"""
+
+
+# -------------------------------
+# SQLite: attach year files behind a TEMP VIEW
+# -------------------------------
+def partition_files(directory=None):
+    directory = directory or HARVEST_PARTITION_DIR
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for name in sorted(os.listdir(directory)):
+        m = PARTITION_FILE.fullmatch(name)
+        if m:
+            out.append((int(m.group(1)), os.path.join(directory, name)))
+    return out
+
+def harvest_columns(cur):
+    cur.execute("PRAGMA main.table_info(harvests)")
+    return [r[1] for r in cur.fetchall()]
+
+def attach_partitions(conn):
+    """Called by get_db() for SQLite; a no-op until `partition` has run."""
+    files = partition_files()
+    if not files:
+        return
+    cur = conn.cursor()
+    for year, path in files:
+        cur.execute(f"ATTACH DATABASE ? AS p{year}", (path,))
+
+    names = ", ".join(harvest_columns(cur))
+    branches = [f"SELECT {names} FROM main.harvests"]
+    branches += [f"SELECT {names} FROM p{year}.harvests" for year, _ in files]
+    cur.execute("CREATE TEMP VIEW harvests AS " + " UNION ALL ".join(branches))
+
+def writable_harvests(conn):
+    """INSERT target for harvests: the view in front of SQLite partitions is read-only."""
+    return "harvests" if is_postgres(conn) else "main.harvests"
+
+def attached_years(conn):
+    cur = conn.cursor()
+    cur.execute("PRAGMA database_list")
+    years = []
+    for r in cur.fetchall():
+        m = re.fullmatch(r"p(\d{4})", r[1])
+        if m:
+            years.append(int(m.group(1)))
+    return sorted(years)
+
+def harvest_sources(conn, year_from=None, year_to=None, years=None):
+    """Tables holding harvests dated in [year_from, year_to], or in `years` (partition pruning)."""
+    if is_postgres(conn):
+        return ["harvests"]   # the planner prunes on the h.date ranges
+    attached = attached_years(conn)
+    if not attached:
+        return ["harvests"]
+    return ["main.harvests"] + [
+        f"p{y}.harvests" for y in attached
+        if (year_from is None or y >= year_from) and (year_to is None or y <= year_to)
+        and (years is None or y in years)
+    ]
+
+
+def database_key(conn):
+    """Which harvest_archive conn reads; None -> not cached."""
+    dsn = getattr(conn, "dsn", None)   # psycopg2
+    if dsn is not None:
+        return dsn
+    shard = getattr(conn, "shard", None)
+    if shard is not None:
+        return ("shard", shard)
+    return getattr(conn, "database_path", None)
+
+def archived_years(conn, year_from=None, year_to=None):
+    """Archived years in [year_from, year_to]; read once per ARCHIVE_CACHE_S, not per query."""
+    key = database_key(conn)
+    now = time.monotonic()
+    with _archived_lock:
+        hit = _archived.get(key) if key is not None else None
+    if hit is not None and now - hit[0] <= ARCHIVE_CACHE_S:
+        years = hit[1]
+    else:
+        cur = conn.cursor()
+        cur.execute("SELECT year FROM harvest_archive")
+        years = frozenset(int(r["year"]) for r in cur.fetchall())
+        if key is not None:
+            with _archived_lock:
+                _archived[key] = (now, years)
+    return sorted(y for y in years if year_from is None or year_from <= y <= year_to)
+
+def forget_archived_years(conn):
+    with _archived_lock:
+        _archived.pop(database_key(conn), None)
+
+
+# -------------------------------
+# Facts: live harvests + archived rollups, one row shape
+# -------------------------------
+def year_runs(years):
+    """Sorted runs of consecutive years: [2019, 2020, 2024] -> [(2019, 2020), (2024, 2024)]."""
+    runs = []
+    for y in sorted(set(years)):
+        if runs and runs[-1][1] == y - 1:
+            runs[-1] = (runs[-1][0], y)
+        else:
+            runs.append((y, y))
+    return runs
+
+def fact_filters(conn, user_id, year_from, year_to, crop_type_ids, years=None):
+    """WHERE terms + params for live rows (h, c) and for rollups (r, c)."""
+    p = ph(conn)
+    where, params = [f"c.user_id = {p}"], [user_id]
+    rollup_where, rollup_params = [f"c.user_id = {p}"], [user_id]
+    if years is not None:
+        # one sargable date range per run of consecutive years
+        runs = year_runs(years)
+        where.append("(" + " OR ".join([f"(h.date >= {p} AND h.date < {p})"] * len(runs)) + ")")
+        for first, last in runs:
+            params += list(year_bounds(first, last))
+        rollup_where.append(f"r.year IN ({','.join([p] * len(years))})")
+        rollup_params += list(years)
+    elif year_from is not None:
+        where.append(f"h.date >= {p} AND h.date < {p}")
+        params += list(year_bounds(year_from, year_to))
+        rollup_where.append(f"r.year BETWEEN {p} AND {p}")
+        rollup_params += [year_from, year_to]
+    if crop_type_ids is not None:
+        in_list = ",".join([p] * len(crop_type_ids))
+        where.append(f"c.crop_type_id IN ({in_list})")
+        params += list(crop_type_ids)
+        rollup_where.append(f"c.crop_type_id IN ({in_list})")
+        rollup_params += list(crop_type_ids)
+    return where, params, rollup_where, rollup_params
+
+def harvest_facts(conn, user_id, year_from=None, year_to=None, crop_type_ids=None, years=None):
+    """
+    (sql, params) for the user's harvest facts in [year_from, year_to], or
+    in just the listed `years`: crop_type_id, crop_id, year, month, bucket,
+    events, total_yield. One row per live harvest (events = 1), plus the
+    rollup rows when archived years are in range.
+    """
+    if years is not None:
+        years = sorted(set(years))
+        year_from, year_to = years[0], years[-1]
+    year_expr, month_expr = date_parts(is_postgres(conn), "h.date")
+    where, params, rollup_where, rollup_params = fact_filters(conn, user_id, year_from, year_to, crop_type_ids, years)
+
+    branches, all_params = [], []
+    for src in harvest_sources(conn, year_from, year_to, years):
+        branches.append(f"""
+            SELECT c.crop_type_id, h.crop_id, {year_expr} AS year, {month_expr} AS month,
+                   {bucket_expr("h.yield_amount")} AS bucket,
+                   1 AS events, h.yield_amount AS total_yield
+            FROM {src} h
+            JOIN crops c ON h.crop_id = c.id
+            WHERE {" AND ".join(where)}""")
+        all_params += params
+    archived = archived_years(conn, year_from, year_to)
+    if years is not None:
+        archived = [y for y in archived if y in years]
+    if archived:
+        branches.append(f"""
+            SELECT c.crop_type_id, r.crop_id, r.year, r.month, r.bucket, r.events, r.total_yield
+            FROM harvest_rollups r
+            JOIN crops c ON r.crop_id = c.id
+            WHERE {" AND ".join(rollup_where)}""")
+        all_params += rollup_params
+    return "\n            UNION ALL".join(branches), tuple(all_params)
+
+def harvest_days(conn, user_id, year_from=None, year_to=None, crop_type_ids=None):
+    """
+    (sql, params) like harvest_facts but dated: crop_type_id, day, events,
+    total_yield. Rollups of archived years are dated on the 1st of their month.
+    """
+    first_of_month = "make_date(r.year, r.month, 1)" if is_postgres(conn) else "printf('%04d-%02d-01', r.year, r.month)"
+    where, params, rollup_where, rollup_params = fact_filters(conn, user_id, year_from, year_to, crop_type_ids)
+
+    branches, all_params = [], []
+    for src in harvest_sources(conn, year_from, year_to):
+        branches.append(f"""
+            SELECT c.crop_type_id, h.date AS day, 1 AS events, h.yield_amount AS total_yield
+            FROM {src} h
+            JOIN crops c ON h.crop_id = c.id
+            WHERE {" AND ".join(where)}""")
+        all_params += params
+    if archived_years(conn, year_from, year_to):
+        branches.append(f"""
+            SELECT c.crop_type_id, {first_of_month}, r.events, r.total_yield
+            FROM harvest_rollups r
+            JOIN crops c ON r.crop_id = c.id
+            WHERE {" AND ".join(rollup_where)}""")
+        all_params += rollup_params
+    return "\n            UNION ALL".join(branches), tuple(all_params)
+
+
+# -------------------------------
+# Postgres: declarative partitioning
+# -------------------------------
+def pg_is_partitioned(cur):
+    cur.execute("SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass('harvests')")
+    row = cur.fetchone()
+    return row is not None and row["relkind"] == "p"
+
+def pg_partition_years(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('harvests')
+    """)
+    return sorted(int(m.group(1)) for m in (re.fullmatch(r"harvests_y(\d{4})", r["relname"]) for r in cur.fetchall()) if m)
+
+def pg_partition(conn, cur):
+    """Convert the plain harvests table into a partitioned one (idempotent)."""
+    if pg_is_partitioned(cur):
+        print("harvests is already partitioned")
+        return
+    cur.execute("SELECT pg_get_serial_sequence('harvests', 'id') AS seq")
+    seq = cur.fetchone()["seq"]
+    cur.execute("SELECT DISTINCT EXTRACT(YEAR FROM date)::INT AS year FROM harvests ORDER BY year")
+    years = [int(r["year"]) for r in cur.fetchall()]
+
+    cur.execute("ALTER TABLE harvests RENAME TO harvests_unpartitioned")
+    if seq:
+        cur.execute(f"ALTER SEQUENCE {seq} OWNED BY NONE")   # survives the DROP below
+    cur.execute("CREATE TABLE harvests (LIKE harvests_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (date)")
+    cur.execute("ALTER TABLE harvests ADD PRIMARY KEY (id, date)")
+    cur.execute("ALTER TABLE harvests ADD FOREIGN KEY (crop_id) REFERENCES crops(id) ON DELETE CASCADE")
+    for year in years:
+        lo, hi = year_bounds(year, year)
+        cur.execute(f"CREATE TABLE harvests_y{year} PARTITION OF harvests FOR VALUES FROM ('{lo}') TO ('{hi}')")
+    cur.execute("CREATE TABLE harvests_default PARTITION OF harvests DEFAULT")
+    cur.execute("INSERT INTO harvests SELECT * FROM harvests_unpartitioned")
+    cur.execute("DROP TABLE harvests_unpartitioned")
+    if seq:
+        cur.execute(f"ALTER SEQUENCE {seq} OWNED BY harvests.id")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_harvests_crop_version ON harvests (crop_id, version)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_harvests_crop_date ON harvests (crop_id, date)")
+    conn.commit()
+    print(f"harvests partitioned by year: {years}")
+
+def pg_ensure_partition(conn, cur, year):
+    """Create harvests_y<year>, carving its rows out of the default partition."""
+    if year in pg_partition_years(cur):
+        return
+    lo, hi = year_bounds(year, year)
+    cur.execute(f"CREATE TABLE harvests_y{year} (LIKE harvests INCLUDING DEFAULTS)")
+    cur.execute(f"INSERT INTO harvests_y{year} SELECT * FROM harvests_default WHERE date >= %s AND date < %s", (lo, hi))
+    cur.execute("DELETE FROM harvests_default WHERE date >= %s AND date < %s", (lo, hi))
+    cur.execute(f"ALTER TABLE harvests ATTACH PARTITION harvests_y{year} FOR VALUES FROM ('{lo}') TO ('{hi}')")
+    conn.commit()
+    print(f"created partition harvests_y{year}")
+
+
+# -------------------------------
+# SQLite: move closed years into per-year files
+# -------------------------------
+def create_year_file_table(cur, schema):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {schema}.harvests AS SELECT * FROM main.harvests WHERE 0")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_harvests_crop_date ON harvests (crop_id, date)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_harvests_crop_version ON harvests (crop_id, version)")
+
+def sqlite_partition(conn, cur, before_year):
+    """Move main.harvests rows dated before `before_year` into year files."""
+    lo, hi = year_bounds(1, before_year - 1)
+    cur.execute("""
+        SELECT DISTINCT CAST(strftime('%Y', date) AS INTEGER) AS year
+        FROM main.harvests
+        WHERE date >= ? AND date < ?
+    """, (lo, hi))
+    years = sorted(r["year"] for r in cur.fetchall())
+    existing = {y for y, _ in partition_files()}
+    if len(existing | set(years)) > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        raise SystemExit("too many year files for SQLite to attach: compact the oldest years first")
+
+    os.makedirs(HARVEST_PARTITION_DIR, exist_ok=True)
+    for year in years:
+        path = os.path.join(HARVEST_PARTITION_DIR, f"harvests_{year}.db")
+        ylo, yhi = year_bounds(year, year)
+        cur.execute(f"ATTACH DATABASE ? AS p{year}", (path,))
+        create_year_file_table(cur, f"p{year}")
+        cur.execute(f"INSERT INTO p{year}.harvests SELECT * FROM main.harvests WHERE date >= ? AND date < ?", (ylo, yhi))
+        moved = cur.rowcount
+        cur.execute("DELETE FROM main.harvests WHERE date >= ? AND date < ?", (ylo, yhi))
+        conn.commit()
+        cur.execute(f"DETACH DATABASE p{year}")
+        print(f"moved {moved} harvests into {path}")
+
+
+# -------------------------------
+# Compaction
+# -------------------------------
+def write_rollups(conn, cur, year, sources):
+    """Add the year's live rows (of existing crops) to harvest_rollups."""
+    p = ph(conn)
+    pg = is_postgres(conn)
+    _, month_expr = date_parts(pg, "h.date")
+    lo, hi = year_bounds(year, year)
+    n = 0
+    for src in sources:
+        cur.execute(f"""
+            INSERT INTO harvest_rollups (crop_id, year, month, bucket, events, total_yield)
+            SELECT h.crop_id, {p}, {month_expr}, {bucket_expr("h.yield_amount")}, COUNT(*), SUM(h.yield_amount)
+            FROM {src} h
+            JOIN crops c ON c.id = h.crop_id
+            WHERE h.date >= {p} AND h.date < {p}
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (crop_id, year, month, bucket) DO UPDATE
+            SET events = harvest_rollups.events + excluded.events,
+                total_yield = harvest_rollups.total_yield + excluded.total_yield
+        """, (year, lo, hi))
+        cur.execute(f"SELECT COUNT(*) AS n FROM {src} WHERE date >= {p} AND date < {p}", (lo, hi))
+        n += int(cur.fetchone()["n"])
+    return n
+
+def record_archive(conn, cur, year, rows, location):
+    p = ph(conn)
+    cur.execute(f"""
+        INSERT INTO harvest_archive (year, row_count, location, archived_at)
+        VALUES ({p}, {p}, {p}, {p})
+        ON CONFLICT (year) DO UPDATE
+        SET row_count = harvest_archive.row_count + excluded.row_count,
+            location = excluded.location,
+            archived_at = excluded.archived_at
+    """, (year, rows, location, time.time()))
+    forget_archived_years(conn)
+
+def pg_compact_year(conn, cur, year):
+    lo, hi = year_bounds(year, year)
+    rows = write_rollups(conn, cur, year, ["harvests"])
+    cur.execute("CREATE SCHEMA IF NOT EXISTS archive")
+    cur.execute("SELECT to_regclass(%s) AS t", (f"archive.harvests_y{year}",))
+    archived = cur.fetchone()["t"] is not None
+    if year in pg_partition_years(cur) and not archived:
+        cur.execute(f"ALTER TABLE harvests DETACH PARTITION harvests_y{year}")
+        cur.execute(f"ALTER TABLE harvests_y{year} SET SCHEMA archive")
+    else:
+        # rows in the default partition (or written after an earlier compaction)
+        if not archived:
+            cur.execute(f"CREATE TABLE archive.harvests_y{year} (LIKE harvests INCLUDING DEFAULTS)")
+        cur.execute(f"INSERT INTO archive.harvests_y{year} SELECT * FROM harvests WHERE date >= %s AND date < %s", (lo, hi))
+        cur.execute("DELETE FROM harvests WHERE date >= %s AND date < %s", (lo, hi))
+    cur.execute(f"REVOKE INSERT, UPDATE, DELETE ON archive.harvests_y{year} FROM PUBLIC")
+    record_archive(conn, cur, year, rows, f"archive.harvests_y{year}")
+    conn.commit()
+    # again: a reader may have re-cached the old set before the commit
+    forget_archived_years(conn)
+    return rows
+
+def sqlite_compact_year(conn, cur, year):
+    lo, hi = year_bounds(year, year)
+    partition_path = os.path.join(HARVEST_PARTITION_DIR, f"harvests_{year}.db")
+    archive_path = os.path.join(HARVEST_ARCHIVE_DIR, f"harvests_{year}.db")
+    os.makedirs(HARVEST_ARCHIVE_DIR, exist_ok=True)
+    if os.path.exists(archive_path):
+        # compacted before: its rows are in the rollups already
+        os.chmod(archive_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+    cur.execute("ATTACH DATABASE ? AS cold", (archive_path,))
+    create_year_file_table(cur, "cold")
+    sources = ["main.harvests"]
+    if os.path.exists(partition_path):
+        cur.execute("ATTACH DATABASE ? AS hot", (partition_path,))
+        sources.append("hot.harvests")
+
+    rows = write_rollups(conn, cur, year, sources)
+    for src in sources:
+        cur.execute(f"INSERT INTO cold.harvests SELECT * FROM {src} WHERE date >= ? AND date < ?", (lo, hi))
+    cur.execute("DELETE FROM main.harvests WHERE date >= ? AND date < ?", (lo, hi))
+    record_archive(conn, cur, year, rows, archive_path)
+    conn.commit()
+    # again: a reader may have re-cached the old set before the commit
+    forget_archived_years(conn)
+
+    cur.execute("DETACH DATABASE cold")
+    if len(sources) > 1:
+        cur.execute("DETACH DATABASE hot")
+        os.remove(partition_path)
+    os.chmod(archive_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return rows
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+def compact(conn, cur, before_year):
+    p = ph(conn)
+    pg = is_postgres(conn)
+    lo, _ = year_bounds(before_year, before_year)
+    year_expr, _ = date_parts(pg, "date")
+    years = set()
+    for src in (["harvests"] if pg else ["main.harvests"]):
+        cur.execute(f"SELECT DISTINCT {year_expr} AS year FROM {src} WHERE date < {p}", (lo,))
+        years |= {int(r["year"]) for r in cur.fetchall()}
+    if not pg:
+        years |= {y for y, _ in partition_files() if y < before_year}
+
+    for year in sorted(years):
+        rows = pg_compact_year(conn, cur, year) if pg else sqlite_compact_year(conn, cur, year)
+        print(f"archived {year}: {rows} harvests rolled up")
+
+
+if __name__ == "__main__":
+    from crop_tracker.model import get_db, init_db
+
+    parser = argparse.ArgumentParser(description="Year partitions and cold archive for harvests")
+    sub = parser.add_subparsers(dest="command", required=True)
+    part = sub.add_parser("partition", help="Postgres: convert to partitions; SQLite: move closed years to files")
+    part.add_argument("--before", type=int, default=date.today().year, help="SQLite: years before this one")
+    ensure = sub.add_parser("ensure", help="Postgres: create partitions for the coming years")
+    ensure.add_argument("--ahead", type=int, default=1)
+    comp = sub.add_parser("compact", help="roll up and archive years before --before")
+    comp.add_argument("--before", type=int, required=True)
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db(role="schema")
+    cur = conn.cursor()
+    pg = is_postgres(conn)
+    if args.command == "partition":
+        pg_partition(conn, cur) if pg else sqlite_partition(conn, cur, args.before)
+    elif args.command == "ensure":
+        if pg:
+            for year in range(date.today().year, date.today().year + args.ahead + 1):
+                pg_ensure_partition(conn, cur, year)
+    else:
+        compact(conn, cur, args.before)
+    conn.close()
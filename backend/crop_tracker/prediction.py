@@ -1,7 +1,22 @@
 # prediction.py (FULL) — Area in acres, yield in kilograms (kg)
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+import os
+import copy
+import json
+import math
+import time
+import zlib
+import queue
+import threading
+from collections import OrderedDict
+from flask import Blueprint, request, jsonify, Response
+from datetime import datetime, timedelta, timezone
 from crop_tracker.model import get_db
+from crop_tracker.partitions import archived_years
+from crop_tracker.dataversion import get_data_version, on_user_write
+from crop_tracker.priors import prior_profile, priors_generation
+from crop_tracker.croptypes import normalize_crop_name, display_crop_name, lookup_crop_type
+from crop_tracker.singleflight import coalesced
+from crop_tracker import metrics
 
 prediction_routes = Blueprint("prediction_routes", __name__, url_prefix="/api")
 
@@ -16,6 +31,19 @@ CROP_PROFILES = {
     "Sorghum": {"baseline": 500,  "min": 200,  "max": 1200},
 }
 DEFAULT_PROFILE = {"baseline": 800, "min": 300, "max": 2000}
+# case/whitespace-insensitive lookup ("maize ", "MAIZE" -> Maize)
+PROFILES_BY_KEY = {normalize_crop_name(name): profile for name, profile in CROP_PROFILES.items()}
+# CROP_PROFILES / DEFAULT_PROFILE are the fallback: once enough harvests of a
+# crop exist across all users, resolve_profile() uses the data-driven priors
+# maintained in priors.py instead.
+
+# Ridge model features (see ridge.FEATURES); "month" alone is the original
+# y = b0 + b1*month model.
+RIDGE_FEATURES = tuple(f.strip() for f in os.environ.get("RIDGE_FEATURES", "month").split(",") if f.strip())
+RIDGE_LAMBDA = float(os.environ.get("RIDGE_LAMBDA", "0.5"))
+# 1: scale features to unit variance and leave the intercept unpenalized
+# (better with year/area); 0 keeps the original raw-scale penalty.
+RIDGE_STANDARDIZE = os.environ.get("RIDGE_STANDARDIZE", "0") == "1"
 
 TIPS = {
     "Low": [
@@ -51,6 +79,17 @@ def parse_month(date_str: str):
     except Exception:
         return None
 
+def parse_date(value):
+    # DATE (postgres) or TEXT (sqlite)
+    if value is None:
+        return None
+    if hasattr(value, "year") and hasattr(value, "month"):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except Exception:
+        return None
+
 def clamp(x, lo, hi):
     return max(lo, min(hi, x))
 
@@ -107,60 +146,109 @@ def rows_to_list(rows):
 
 
 # -------------------------------
-# Stable simple regression (ridge) on kg/acre vs month
-# Model: y = b0 + b1*month
+# Ridge regression on kg/acre (ridge.py)
+# Default model: y = b0 + b1*month
 # -------------------------------
-def train_ridge_month_model(samples, lam=0.5):
+def train_ridge_model(samples, features=RIDGE_FEATURES, lam=RIDGE_LAMBDA, standardize=RIDGE_STANDARDIZE):
+    # samples: [(sample_dict, kg_per_acre), ...]
     if len(samples) < 3:
         return None
 
-    xtx00 = 0.0
-    xtx01 = 0.0
-    xtx11 = 0.0
-    xty0 = 0.0
-    xty1 = 0.0
+    from crop_tracker.ridge import RidgeModel
 
-    for m, y in samples:
-        x0 = 1.0
-        x1 = float(m)
-        y = float(y)
+    model = RidgeModel(features, lam, standardize)
+    model.fit([s for s, _ in samples], [y for _, y in samples])
+    if model.n < 3 or model.solve() is None:
+        return None
+    return model
 
-        xtx00 += x0 * x0
-        xtx01 += x0 * x1
-        xtx11 += x1 * x1
+def resolve_profile(crop_name, month=None):
+    """
+    Global prior for (crop, planting month) when available, else the static
+    profile. month=None asks for the crop-wide range (used to clamp samples).
+    """
+    key = normalize_crop_name(crop_name)
+    prior = prior_profile(key, month)
+    if prior:
+        return prior
+    return dict(PROFILES_BY_KEY.get(key, DEFAULT_PROFILE), season_adjusted=False, source="static")
 
-        xty0 += x0 * y
-        xty1 += x1 * y
+def seasonal_baseline(profile, month):
+    # month-specific priors already include the season effect
+    if profile.get("season_adjusted"):
+        return profile["baseline"]
+    return profile["baseline"] * season_factor(month)
 
-    xtx00 += lam
-    xtx11 += lam
+def blended_pred_kg_per_acre(month, profile, model, n_points, target=None):
+    baseline = seasonal_baseline(profile, month)
 
-    det = xtx00 * xtx11 - xtx01 * xtx01
-    if abs(det) < 1e-9:
-        return None
+    if not model:
+        return clamp(baseline, profile["min"], profile["max"])
 
-    inv00 = xtx11 / det
-    inv01 = -xtx01 / det
-    inv10 = -xtx01 / det
-    inv11 = xtx00 / det
+    model_pred = model.predict_one(target or {"month": month})
+
+    w = clamp(0.20 + 0.10 * n_points, 0.25, 0.85)
+    pred = (w * model_pred) + ((1.0 - w) * baseline)
 
-    b0 = inv00 * xty0 + inv01 * xty1
-    b1 = inv10 * xty0 + inv11 * xty1
-    return (b0, b1)
+    return clamp(pred, profile["min"], profile["max"])
 
-def blended_pred_kg_per_acre(month, profile, model, n_points):
-    baseline = profile["baseline"] * season_factor(month)
+# -------------------------------
+# Vectorized versions (numpy arrays of months / predictions)
+# numpy and ridge.py are imported inside the functions that use them, so
+# loading the blueprints (cold start) does not pay for them.
+# -------------------------------
+SEASON_FACTORS = [season_factor(m) for m in range(13)]
+SEASON_NAMES = [season_name(m) for m in range(13)]
+CATEGORY_LABELS = ("Low", "Medium", "High")
+
+def season_factor_array(months):
+    import numpy as np
+    return np.asarray(SEASON_FACTORS)[np.asarray(months, dtype=int)]
+
+def category_array(pred_kg_acre, baseline_kg_acre):
+    import numpy as np
+    pred_kg_acre = np.asarray(pred_kg_acre, dtype=float)
+    baseline = np.broadcast_to(np.asarray(baseline_kg_acre, dtype=float), pred_kg_acre.shape)
+    ratio = pred_kg_acre / np.where(baseline > 0, baseline, 1.0)
+    idx = (ratio >= 0.70).astype(int) + (ratio >= 1.10).astype(int)
+    # non-positive baseline -> "Medium", as in category_from_kg_per_acre
+    return np.array(CATEGORY_LABELS, dtype=object)[np.where(baseline > 0, idx, 1)]
+
+def profile_table(crop_name):
+    """resolve_profile for months 1..12 as arrays indexed by month."""
+    import numpy as np
+    profiles = [resolve_profile(crop_name, m) for m in range(1, 13)]
+    profiles.insert(0, profiles[0])
+    return {
+        "baseline": np.array([pr["baseline"] for pr in profiles], dtype=float),
+        "seasonal_baseline": np.array([seasonal_baseline(pr, m) for m, pr in enumerate(profiles)], dtype=float),
+        "min": np.array([pr["min"] for pr in profiles], dtype=float),
+        "max": np.array([pr["max"] for pr in profiles], dtype=float),
+    }
+
+def blended_pred_array(months, table, model, n_points, columns=None):
+    """
+    blended_pred_kg_per_acre over arrays: table comes from profile_table(),
+    columns maps ridge feature names to arrays aligned with months (month is
+    filled in from months).
+    """
+    import numpy as np
+    months = np.asarray(months, dtype=int)
+    baseline = table["seasonal_baseline"][months]
+    lo = table["min"][months]
+    hi = table["max"][months]
 
     if not model:
-        return clamp(baseline, profile["min"], profile["max"])
+        return np.clip(baseline, lo, hi)
 
-    b0, b1 = model
-    model_pred = b0 + b1 * month
+    cols = dict(columns or {})
+    cols["month"] = months
+    model_pred = model.predict_arrays(model.design_columns(cols, len(months)))
 
     w = clamp(0.20 + 0.10 * n_points, 0.25, 0.85)
     pred = (w * model_pred) + ((1.0 - w) * baseline)
 
-    return clamp(pred, profile["min"], profile["max"])
+    return np.clip(pred, lo, hi)
 
 def confidence_label(n_points, used_model):
     if not used_model:
@@ -172,46 +260,196 @@ def confidence_label(n_points, used_model):
     return "Low"
 
 
-# =====================================================
-# GET /api/predict/<crop_id>?user_id=1
-# =====================================================
-@prediction_routes.route("/predict/<int:crop_id>", methods=["GET"])
-def predict_yield(crop_id):
-    user_id = request.args.get("user_id")
-    if not user_id:
-        return jsonify({"error": "User not logged in"}), 401
+# -------------------------------
+# Prediction for one crop (shared by the route and the refresh worker)
+# -------------------------------
+def training_rows(cur, pg, user_id, crop_type_id, since=None, crop_ids=None):
+    """
+    The user's harvests of one crop type as training rows. since: only
+    harvests written after that data version; crop_ids: only those crops.
+    """
+    p = "%s" if pg else "?"
+    where, params = [], [user_id, crop_type_id]
+    if since is not None:
+        where.append(f"AND h.version > {p}")
+        params.append(since)
+    if crop_ids is not None:
+        where.append(f"AND c.id IN ({','.join([p] * len(crop_ids))})")
+        params += list(crop_ids)
+
+    # Training data: same crop type for this user
+    # Postgres: EXTRACT(MONTH FROM date); SQLite: strftime
+    month_expr = "EXTRACT(MONTH FROM c.planting_date)::INT" if pg else "CAST(strftime('%m', c.planting_date) AS INTEGER)"
+    cur.execute(f"""
+        SELECT h.id AS harvest_id,
+               h.crop_id AS crop_id,
+               c.area AS area_acres,
+               {month_expr} AS month_planted,
+               c.planting_date AS planting_date,
+               h.date AS harvest_date,
+               h.yield_amount AS yield_kg
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p}
+          AND c.crop_type_id = {p}
+          AND c.area > 0
+          AND h.yield_amount > 0
+          {" ".join(where)}
+    """, tuple(params))
+    return rows_to_list(cur.fetchall())
 
+def training_sample(r, profile):
+    """Training row -> (sample, kg/acre), or None when it is unusable."""
     try:
-        user_id_int = int(user_id)
-    except ValueError:
-        return jsonify({"error": "Invalid user_id"}), 400
+        a = float(r["area_acres"])
+        m = int(r["month_planted"])
+        y = float(r["yield_kg"])
+    except Exception:
+        return None
+    if not (a > 0 and y > 0 and 1 <= m <= 12):
+        return None
+    kg_per_acre = y / a
+    kg_per_acre = clamp(kg_per_acre, profile["min"] * 0.5, profile["max"] * 1.5)
+    sample = {"month": m, "area": a}
+    if any(f in ("year", "lag") for f in RIDGE_FEATURES):
+        planted = parse_date(r["planting_date"])
+        harvested = parse_date(r["harvest_date"])
+        sample["year"] = planted.year if planted else None
+        if planted and harvested:
+            sample["lag_days"] = (harvested - planted).days
+    return sample, kg_per_acre
 
-    conn = get_db()
-    cur = conn.cursor()
-    p = ph(conn)
-    pg = is_postgres(conn)
+def load_training_samples(cur, pg, user_id, crop_type_id, profile):
+    if crop_type_id is None:
+        return []
+    # Convert training records -> kg/acre
+    samples = (training_sample(r, profile) for r in training_rows(cur, pg, user_id, crop_type_id))
+    return [s for s in samples if s is not None]
 
-    # Ownership check
-    cur.execute(
-        f"SELECT id, user_id, name, area, planting_date FROM crops WHERE id={p} AND user_id={p}",
-        (crop_id, user_id_int)
-    )
-    crop = row_to_dict(cur.fetchone())
 
-    if not crop:
-        conn.close()
-        return jsonify({"error": "Unauthorized or invalid crop"}), 403
+# -------------------------------
+# Incremental training
+# Per (user, crop type): the training samples by harvest id and a
+# RidgeModel kept current with rank-one updates from the rows written since
+# the entry's data version, read as /api/sync reads them (row versions and
+# tombstones). Applying a delta is idempotent — a harvest id is replaced,
+# a changed crop's harvests are re-read whole, tombstones remove what is
+# there — so an entry may already hold rows newer than its version.
+# -------------------------------
+TRAINING_CACHE_SIZE = int(os.environ.get("TRAINING_CACHE_SIZE", "1024"))
+
+_training = OrderedDict()   # (user_id, crop_type_id) -> TrainingSet
+_training_lock = threading.Lock()
+
+
+class TrainingSet:
+    def __init__(self, version, generation, archived, model):
+        self.version = version
+        self.generation = generation
+        self.archived = archived   # compaction drops rows without versions or tombstones
+        self.model = model
+        self.rows = {}   # harvest id -> (crop id, sample, kg/acre)
+
+    def put(self, r, profile):
+        self.drop(r["harvest_id"])
+        sample = training_sample(r, profile)
+        if sample is not None:
+            self.rows[r["harvest_id"]] = (r["crop_id"], *sample)
+            self.model.add_sample(*sample)
+
+    def drop(self, harvest_id):
+        old = self.rows.pop(harvest_id, None)
+        if old is not None:
+            self.model.remove_sample(old[1], old[2])
+
+    def drop_crops(self, crop_ids):
+        for hid in [hid for hid, (cid, _, _) in self.rows.items() if cid in crop_ids]:
+            self.drop(hid)
+
+    def samples(self):
+        # harvest id order: seeded bootstrap resamples stay reproducible
+        return [(self.rows[hid][1], self.rows[hid][2]) for hid in sorted(self.rows)]
+
+def apply_training_delta(cur, pg, entry, user_id, crop_type_id, profile):
+    """Bring entry up to the rows written after entry.version."""
+    p = "%s" if pg else "?"
+    cur.execute(f"""
+        SELECT entity, entity_id
+        FROM sync_tombstones
+        WHERE user_id = {p} AND version > {p}
+    """, (user_id, entry.version))
+    for r in rows_to_list(cur.fetchall()):
+        if r["entity"] == "harvest":
+            entry.drop(r["entity_id"])
+        else:
+            entry.drop_crops({r["entity_id"]})
+
+    # updated crops (area, planting date or type changed): re-read their harvests
+    cur.execute(f"SELECT id FROM crops WHERE user_id = {p} AND version > {p}", (user_id, entry.version))
+    changed = {row_to_dict(r)["id"] for r in cur.fetchall()}
+    if changed:
+        entry.drop_crops(changed)
+        for r in training_rows(cur, pg, user_id, crop_type_id, crop_ids=sorted(changed)):
+            entry.put(r, profile)
+
+    for r in training_rows(cur, pg, user_id, crop_type_id, since=entry.version):
+        if r["crop_id"] not in changed:
+            entry.put(r, profile)
+
+def incremental_training(cur, pg, user_id, crop_type_id, profile, data_version):
+    """(samples, model or None) for the user's crop type at data_version, as train_ridge_model."""
+    from crop_tracker.ridge import RidgeModel
+    if crop_type_id is None:
+        return [], None
+
+    key = (int(user_id), crop_type_id)
+    generation = priors_generation()
+    archived = tuple(archived_years(cur.connection))
+    with _training_lock:
+        # taken out while in use: a concurrent caller loads its own copy
+        entry = _training.pop(key, None)
 
+    behind = None if entry is None else int(data_version) - entry.version
+    # clamping depends on the priors; past ~one write per row a refit is cheaper
+    if (entry is None or (entry.generation, entry.archived) != (generation, archived)
+            or behind < 0 or behind > max(64, len(entry.rows))):
+        entry = TrainingSet(int(data_version), generation, archived,
+                            RidgeModel(RIDGE_FEATURES, RIDGE_LAMBDA, RIDGE_STANDARDIZE))
+        for r in training_rows(cur, pg, user_id, crop_type_id):
+            entry.put(r, profile)
+        metrics.inc("predictions.training_full")
+    elif behind > 0:
+        apply_training_delta(cur, pg, entry, user_id, crop_type_id, profile)
+        entry.version = int(data_version)
+        metrics.inc("predictions.training_incremental")
+
+    with _training_lock:
+        _training[key] = entry
+        while len(_training) > TRAINING_CACHE_SIZE:
+            _training.popitem(last=False)
+
+    samples = entry.samples()
+    if len(samples) < 3 or entry.model.n < 3 or entry.model.solve() is None:
+        return samples, None
+    # the cached model keeps changing with later deltas; callers get a copy
+    return samples, copy.deepcopy(entry.model)
+
+def compute_prediction(cur, pg, crop, training_cache=None, data_version=None):
+    """
+    crop: row with id, name, crop_type_id, area, planting_date (ownership
+    already checked); type_name, when joined in, is the canonical name.
+    Returns (payload, 200) or ({"error": ...}, status). training_cache lets a
+    caller predicting many crops train once per crop name; with the user's
+    data_version the model is updated incrementally (see TrainingSet).
+    """
     # Area stored in acres
     try:
         area_acres = float(crop["area"])
     except Exception:
-        conn.close()
-        return jsonify({"error": "Invalid area stored for this crop"}), 400
+        return {"error": "Invalid area stored for this crop"}, 400
 
     if area_acres <= 0:
-        conn.close()
-        return jsonify({"error": "Area must be > 0 acres"}), 400
+        return {"error": "Area must be > 0 acres"}, 400
 
     planting_date = crop["planting_date"]
 
@@ -222,73 +460,37 @@ def predict_yield(crop_id):
         planting_date_str = str(planting_date)
 
     if not validate_date_str(planting_date_str):
-        conn.close()
-        return jsonify({"error": "Invalid planting_date stored for this crop"}), 400
+        return {"error": "Invalid planting_date stored for this crop"}, 400
 
     month = parse_month(planting_date_str)
     if month is None:
-        conn.close()
-        return jsonify({"error": "Invalid planting_date stored for this crop"}), 400
+        return {"error": "Invalid planting_date stored for this crop"}, 400
 
-    crop_name = (crop["name"] or "").strip()
-    profile = CROP_PROFILES.get(crop_name, DEFAULT_PROFILE)
+    crop_name = crop.get("type_name") or display_crop_name(crop["name"])
+    profile = resolve_profile(crop_name, month)
 
-    # Training data: same crop name for this user
-    if pg:
-        # Postgres: EXTRACT(MONTH FROM date)
-        cur.execute(f"""
-            SELECT c.area AS area_acres,
-                   EXTRACT(MONTH FROM c.planting_date)::INT AS month_planted,
-                   h.yield_amount AS yield_kg
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND c.area > 0
-              AND h.yield_amount > 0
-        """, (user_id_int, crop_name))
+    if training_cache is not None and crop_name in training_cache:
+        samples, model = training_cache[crop_name]
     else:
-        # SQLite: strftime
-        cur.execute(f"""
-            SELECT c.area AS area_acres,
-                   CAST(strftime('%m', c.planting_date) AS INTEGER) AS month_planted,
-                   h.yield_amount AS yield_kg
-            FROM harvests h
-            JOIN crops c ON h.crop_id = c.id
-            WHERE c.user_id = {p}
-              AND c.name = {p}
-              AND c.area > 0
-              AND h.yield_amount > 0
-        """, (user_id_int, crop_name))
-
-    rows = rows_to_list(cur.fetchall())
-    conn.close()
-
-    # Convert training records -> kg/acre
-    samples = []
-    for r in rows:
-        try:
-            a = float(r["area_acres"])
-            m = int(r["month_planted"])
-            y = float(r["yield_kg"])
-            if a > 0 and y > 0 and 1 <= m <= 12:
-                kg_per_acre = y / a
-                kg_per_acre = clamp(kg_per_acre, profile["min"] * 0.5, profile["max"] * 1.5)
-                samples.append((m, kg_per_acre))
-        except Exception:
-            continue
-
-    model = train_ridge_month_model(samples, lam=0.5)
+        if data_version is not None:
+            samples, model = incremental_training(cur, pg, crop["user_id"], crop.get("crop_type_id"),
+                                                  resolve_profile(crop_name), data_version)
+        else:
+            samples = load_training_samples(cur, pg, crop["user_id"], crop.get("crop_type_id"), resolve_profile(crop_name))
+            model = train_ridge_model(samples)
+        if training_cache is not None:
+            training_cache[crop_name] = (samples, model)
     used_model = model is not None
 
-    pred_kg_per_acre = blended_pred_kg_per_acre(month, profile, model, len(samples))
+    target = {"month": month, "area": area_acres, "year": int(planting_date_str[:4])}
+    pred_kg_per_acre = blended_pred_kg_per_acre(month, profile, model, len(samples), target)
     pred_total_kg = pred_kg_per_acre * area_acres
 
     category = category_from_kg_per_acre(pred_kg_per_acre, profile["baseline"])
     season = season_name(month)
 
-    return jsonify({
-        "crop_id": crop_id,
+    return {
+        "crop_id": crop["id"],
         "crop_name": crop_name,
         "area": area_acres,
         "area_unit": "acres",
@@ -301,8 +503,9 @@ def predict_yield(crop_id):
         "predicted_yield_per_acre": round(pred_kg_per_acre, 1),
         "yield_per_acre_unit": "kg/acre",
 
-        "baseline_yield_per_acre": profile["baseline"],
+        "baseline_yield_per_acre": round(profile["baseline"], 1),
         "baseline_unit": "kg/acre",
+        "baseline_source": profile["source"],
 
         "yield_category": category,
         "tips": TIPS[category],
@@ -310,4 +513,619 @@ def predict_yield(crop_id):
         "training_points": len(samples),
         "used_regression_model": used_model,
         "confidence": confidence_label(len(samples), used_model),
+    }, 200
+
+
+# -------------------------------
+# Uncertainty bands: bootstrap over the user's samples
+# Coefficients of all resample refits are cached per
+# (user, crop name, data version); intervals for a crop are then a
+# matrix-vector product.
+# -------------------------------
+BOOTSTRAP_RESAMPLES = int(os.environ.get("BOOTSTRAP_RESAMPLES", "500"))
+BOOTSTRAP_CACHE_SIZE = int(os.environ.get("BOOTSTRAP_CACHE_SIZE", "1024"))
+
+_bootstrap_cache = OrderedDict()
+_bootstrap_lock = threading.Lock()
+
+def cached_bootstrap(user_id, crop_name, data_version):
+    key = (int(user_id), crop_name, int(data_version), priors_generation())
+    with _bootstrap_lock:
+        hit = _bootstrap_cache.get(key)
+        if hit is not None:
+            _bootstrap_cache.move_to_end(key)
+    metrics.inc("predictions.bootstrap_cache_hits" if hit is not None else "predictions.bootstrap_cache_misses")
+    return hit
+
+def bootstrap_for(user_id, crop_name, data_version, samples, model):
+    """
+    Compute and cache (coefs (B, k), feature means) for this training set;
+    None when there is no model to resample.
+    """
+    import numpy as np
+    from crop_tracker.ridge import bootstrap_coefficients
+    if model is None:
+        return None
+
+    key = (int(user_id), crop_name, int(data_version), priors_generation())
+    X, y = model.design([s for s, _ in samples], [t for _, t in samples])
+    # seeded by the key so repeated requests give the same interval
+    rng = np.random.default_rng(zlib.crc32(repr(key).encode()))
+    entry = (
+        bootstrap_coefficients(X, y, model.lam, BOOTSTRAP_RESAMPLES, rng, standardize=model.standardize),
+        model.feature_means(),
+    )
+    with _bootstrap_lock:
+        _bootstrap_cache[key] = entry
+        while len(_bootstrap_cache) > BOOTSTRAP_CACHE_SIZE:
+            _bootstrap_cache.popitem(last=False)
+    return entry
+
+def prediction_intervals(boot, model, profile, n_points, target, area_acres, level=90):
+    import numpy as np
+    coefs, means = boot
+    x = model.row(target, fill=means)
+    model_preds = coefs @ x
+
+    baseline = seasonal_baseline(profile, target["month"])
+    w = clamp(0.20 + 0.10 * n_points, 0.25, 0.85)
+    per_acre = np.clip(w * model_preds + (1.0 - w) * baseline, profile["min"], profile["max"])
+
+    tail = (100.0 - level) / 2.0
+    lo, mid, hi = np.percentile(per_acre, [tail, 50.0, 100.0 - tail])
+    return {
+        "level": level,
+        "method": "bootstrap",
+        "resamples": int(len(coefs)),
+        "yield_per_acre": {"low": round(float(lo), 1), "median": round(float(mid), 1), "high": round(float(hi), 1)},
+        "yield": {
+            "low": round(float(lo) * area_acres, 1),
+            "median": round(float(mid) * area_acres, 1),
+            "high": round(float(hi) * area_acres, 1),
+        },
+    }
+
+def add_prediction_intervals(cur, pg, crop, payload, data_version, level):
+    from crop_tracker.ridge import RidgeModel
+    crop_name = payload["crop_name"]
+    profile = resolve_profile(crop_name, payload["month_planted"])
+
+    boot = cached_bootstrap(crop["user_id"], crop_name, data_version)
+    if boot is None:
+        samples = load_training_samples(cur, pg, crop["user_id"], crop.get("crop_type_id"), resolve_profile(crop_name))
+        boot = bootstrap_for(crop["user_id"], crop_name, data_version, samples, train_ridge_model(samples))
+    if boot is None:
+        payload["intervals"] = None
+        return payload
+
+    target = {"month": payload["month_planted"], "area": payload["area"], "year": int(payload["planting_date"][:4])}
+    payload["intervals"] = prediction_intervals(
+        boot, RidgeModel(RIDGE_FEATURES, RIDGE_LAMBDA, RIDGE_STANDARDIZE), profile,
+        payload["training_points"], target, payload["area"], level
+    )
+    return payload
+
+
+# -------------------------------
+# Materialized predictions (refreshed in the background after writes)
+# A stored row is fresh while its data_version equals the user's current
+# version in user_data_versions and its priors_generation the current
+# priors snapshot's (profiles clamp and blend every prediction).
+# -------------------------------
+PREDICTION_WORKER = os.environ.get("PREDICTION_WORKER", "1") == "1"
+
+_refresh_queue = queue.Queue()
+_refresh_pending = {}  # user_id -> time first enqueued
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+
+def store_prediction(cur, pg, crop_id, user_id, data_version, generation, payload):
+    p = "%s" if pg else "?"
+    cur.execute(f"""
+        INSERT INTO predictions (crop_id, user_id, data_version, priors_generation, payload, computed_at)
+        VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+        ON CONFLICT (crop_id) DO UPDATE
+        SET user_id = excluded.user_id,
+            data_version = excluded.data_version,
+            priors_generation = excluded.priors_generation,
+            payload = excluded.payload,
+            computed_at = excluded.computed_at
+    """, (crop_id, user_id, data_version, generation, json.dumps(payload, sort_keys=True), time.time()))
+
+def refresh_user_predictions(user_id):
+    conn = get_db(user_id=user_id)
+    cur = conn.cursor()
+    p = ph(conn)
+    pg = is_postgres(conn)
+
+    try:
+        version = get_data_version(conn, cur, user_id)
+        cur.execute(f"""
+            SELECT c.id, c.user_id, c.name, c.crop_type_id, t.name AS type_name, c.area, c.planting_date
+            FROM crops c
+            LEFT JOIN crop_types t ON t.id = c.crop_type_id
+            WHERE c.user_id = {p}
+        """, (user_id,))
+        crops = rows_to_list(cur.fetchall())
+
+        # the refresher may swap the priors snapshot mid-pass: only stamp
+        # payloads that were all computed under the generation they carry
+        for _ in range(3):
+            generation = priors_generation()
+            training_cache = {}
+            results = [(crop, compute_prediction(cur, pg, crop, training_cache, version)) for crop in crops]
+            if priors_generation() == generation:
+                break
+        else:
+            metrics.inc("predictions.refresh_unstable_priors")
+            return 0
+
+        for crop, (payload, status) in results:
+            if status == 200:
+                store_prediction(cur, pg, crop["id"], user_id, version, generation, payload)
+        conn.commit()
+
+        # warm the bootstrap cache so interval requests stay off the slow path
+        for crop_name, (samples, model) in training_cache.items():
+            bootstrap_for(user_id, crop_name, version, samples, model)
+        return len(crops)
+    finally:
+        conn.close()
+
+def refresh_worker():
+    while True:
+        user_id = _refresh_queue.get()
+        with _refresh_lock:
+            enqueued_at = _refresh_pending.pop(user_id, None)
+            metrics.set_gauge("predictions.refresh_queue_depth", len(_refresh_pending))
+        try:
+            refresh_user_predictions(user_id)
+            metrics.inc("predictions.refreshed_users")
+            if enqueued_at is not None:
+                metrics.observe("predictions.refresh_lag_s", time.time() - enqueued_at)
+        except Exception as e:
+            metrics.inc("predictions.refresh_errors")
+            print(f"prediction refresh failed for user {user_id}: {e}")
+
+def schedule_prediction_refresh(user_id):
+    global _refresh_thread
+    if not PREDICTION_WORKER:
+        return
+
+    with _refresh_lock:
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=refresh_worker, name="prediction-refresh", daemon=True)
+            _refresh_thread.start()
+        # coalesce: one queued refresh per user covers every write before it runs
+        if user_id in _refresh_pending:
+            return
+        _refresh_pending[user_id] = time.time()
+        metrics.set_gauge("predictions.refresh_queue_depth", len(_refresh_pending))
+    _refresh_queue.put(user_id)
+
+on_user_write(schedule_prediction_refresh)
+
+
+# =====================================================
+# GET /api/predict/<crop_id>?user_id=1
+# =====================================================
+@prediction_routes.route("/predict/<int:crop_id>", methods=["GET"])
+@coalesced("predict_yield", args=("user_id", "intervals", "level"))
+def predict_yield(crop_id):
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    try:
+        user_id_int = int(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id"}), 400
+
+    conn = get_db("read", user_id_int)
+    cur = conn.cursor()
+    p = ph(conn)
+    pg = is_postgres(conn)
+
+    # Ownership check + stored prediction + current data version in one read
+    cur.execute(f"""
+        SELECT c.id, c.user_id, c.name, c.crop_type_id, t.name AS type_name, c.area, c.planting_date,
+               pr.data_version AS stored_version,
+               pr.priors_generation AS stored_generation,
+               pr.payload AS stored_payload,
+               pr.computed_at AS computed_at,
+               COALESCE(v.version, 0) AS current_version
+        FROM crops c
+        LEFT JOIN crop_types t ON t.id = c.crop_type_id
+        LEFT JOIN predictions pr ON pr.crop_id = c.id
+        LEFT JOIN user_data_versions v ON v.user_id = c.user_id
+        WHERE c.id = {p} AND c.user_id = {p}
+    """, (crop_id, user_id_int))
+    crop = row_to_dict(cur.fetchone())
+
+    if not crop:
+        conn.close()
+        return jsonify({"error": "Unauthorized or invalid crop"}), 403
+
+    # ?intervals=1 adds bootstrap percentile bands (level=90 by default)
+    want_intervals = request.args.get("intervals") in ("1", "true")
+    level = request.args.get("level", type=int) if "level" in request.args else 90
+    if want_intervals and (level is None or not 50 <= level <= 99):
+        conn.close()
+        return jsonify({"error": "level must be between 50 and 99"}), 400
+
+    version = int(crop["current_version"])
+    fresh = (
+        crop["stored_payload"] is not None
+        and int(crop["stored_version"]) == version
+        and int(crop["stored_generation"]) == priors_generation()
+    )
+
+    if fresh:
+        metrics.inc("predictions.served_fresh")
+        metrics.observe("predictions.staleness_age_s", time.time() - float(crop["computed_at"]))
+        if not want_intervals:
+            conn.close()
+            resp = Response(crop["stored_payload"], status=200, mimetype="application/json")
+            resp.headers["X-Prediction-Source"] = "stored"
+            return resp
+        payload, status = json.loads(crop["stored_payload"]), 200
+    else:
+        # Stale or missing: compute inline, refresh the table in the background
+        payload, status = compute_prediction(cur, pg, crop)
+        if status == 200:
+            metrics.inc("predictions.served_inline")
+            schedule_prediction_refresh(user_id_int)
+
+    if want_intervals and status == 200:
+        add_prediction_intervals(cur, pg, crop, payload, version, level)
+    conn.close()
+
+    resp = jsonify(payload)
+    resp.status_code = status
+    resp.headers["X-Prediction-Source"] = "stored" if fresh else "inline"
+    return resp
+
+
+# -------------------------------
+# Scenario inputs
+# -------------------------------
+MAX_SCENARIOS = 2000
+
+# Range specs are sized before anything is built, so an oversized grid is
+# rejected without allocating it.
+def area_range(spec):
+    lo = float(spec.get("min"))
+    hi = float(spec.get("max"))
+    step = float(spec.get("step", 0.5))
+    if not all(math.isfinite(v) for v in (lo, hi, step)) or step <= 0 or hi < lo:
+        raise ValueError("Invalid area range")
+    return lo, hi, step
+
+def planting_date_range(spec):
+    start = datetime.strptime(spec.get("from"), "%Y-%m-%d").date()
+    end = datetime.strptime(spec.get("to"), "%Y-%m-%d").date()
+    step = int(spec.get("step_days", 7))
+    if step <= 0 or end < start:
+        raise ValueError("Invalid planting date range")
+    return start, end, step
+
+def area_count(spec):
+    if isinstance(spec, dict):
+        lo, hi, step = area_range(spec)
+        return int(math.floor((hi - lo) / step + 1e-9)) + 1
+    return len(spec)
+
+def planting_date_count(spec):
+    if isinstance(spec, dict):
+        start, end, step = planting_date_range(spec)
+        return (end - start).days // step + 1
+    return len(spec)
+
+def parse_area_values(spec):
+    """[1, 2.5, ...] or {"min": 0.5, "max": 5, "step": 0.5} -> array of acres."""
+    import numpy as np
+    if isinstance(spec, dict):
+        lo, _, step = area_range(spec)
+        values = lo + step * np.arange(area_count(spec))
+    else:
+        values = np.array([float(a) for a in spec], dtype=float)
+    if values.size == 0 or not np.all(np.isfinite(values)) or np.any(values <= 0):
+        raise ValueError("Areas must be positive numbers")
+    return values
+
+def parse_planting_dates(spec):
+    """["2025-03-01", ...] or {"from": ..., "to": ..., "step_days": 7} -> list of dates."""
+    if isinstance(spec, dict):
+        start, _, step = planting_date_range(spec)
+        return [start + timedelta(days=i * step) for i in range(planting_date_count(spec))]
+    out = [datetime.strptime(d, "%Y-%m-%d").date() for d in spec]
+    if not out:
+        raise ValueError("At least one planting date is required")
+    return out
+
+
+# =====================================================
+# POST /api/predict/scenarios?user_id=1
+# {"crop_name": "Maize", "areas": {"min": 1, "max": 5, "step": 0.5},
+#  "planting_dates": {"from": "2025-01-01", "to": "2025-12-31", "step_days": 14},
+#  "rank_by": "per_acre" | "total", "top": 50}
+# =====================================================
+@prediction_routes.route("/predict/scenarios", methods=["POST"])
+def predict_scenarios():
+    import numpy as np
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    try:
+        user_id_int = int(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id"}), 400
+
+    data = request.get_json() or {}
+    crop_name = (data.get("crop_name") or "").strip()
+    rank_by = data.get("rank_by", "per_acre")
+    top = data.get("top")
+
+    if not crop_name:
+        return jsonify({"error": "crop_name is required"}), 400
+    if rank_by not in ("per_acre", "total"):
+        return jsonify({"error": "rank_by must be per_acre or total"}), 400
+    if top is not None:
+        try:
+            top = int(top)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"error": "top must be a positive integer"}), 400
+        if top < 1:
+            return jsonify({"error": "top must be a positive integer"}), 400
+
+    area_spec = data.get("areas") or []
+    date_spec = data.get("planting_dates") or []
+    try:
+        n_scenarios = area_count(area_spec) * planting_date_count(date_spec)
+    except (TypeError, ValueError, OverflowError) as e:
+        return jsonify({"error": str(e) or "Invalid areas or planting_dates"}), 400
+    if n_scenarios > MAX_SCENARIOS:
+        return jsonify({"error": f"Too many scenarios (max {MAX_SCENARIOS})"}), 400
+
+    try:
+        areas = parse_area_values(area_spec)
+        dates = parse_planting_dates(date_spec)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e) or "Invalid areas or planting_dates"}), 400
+
+    table = profile_table(crop_name)
+
+    # Train once for all scenarios
+    conn = get_db("read", user_id_int)
+    cur = conn.cursor()
+    pg = is_postgres(conn)
+    crop_type_id = lookup_crop_type(cur, pg, crop_name)
+    samples = load_training_samples(cur, pg, user_id_int, crop_type_id, resolve_profile(crop_name))
+    conn.close()
+    model = train_ridge_model(samples)
+    used_model = model is not None
+
+    # Grid: every planting date x every area
+    n_areas = len(areas)
+    months = np.repeat(np.array([d.month for d in dates]), n_areas)
+    years = np.repeat(np.array([d.year for d in dates]), n_areas)
+    date_idx = np.repeat(np.arange(len(dates)), n_areas)
+    grid_areas = np.tile(areas, len(dates))
+
+    per_acre = blended_pred_array(months, table, model, len(samples), {"area": grid_areas, "year": years})
+    totals = per_acre * grid_areas
+    categories = category_array(per_acre, table["baseline"][months])
+
+    key = per_acre if rank_by == "per_acre" else totals
+    order = np.argsort(-key, kind="stable")
+    if top is not None:
+        order = order[:top]
+
+    scenarios = []
+    for rank, i in enumerate(order, start=1):
+        scenarios.append({
+            "rank": rank,
+            "planting_date": dates[date_idx[i]].isoformat(),
+            "month_planted": int(months[i]),
+            "season": SEASON_NAMES[months[i]],
+            "area": round(float(grid_areas[i]), 3),
+            "predicted_yield_per_acre": round(float(per_acre[i]), 1),
+            "predicted_yield": round(float(totals[i]), 1),
+            "yield_category": categories[i],
+            "baseline_yield_per_acre": round(float(table["baseline"][months[i]]), 1),
+        })
+
+    return jsonify({
+        "crop_name": crop_name,
+        "rank_by": rank_by,
+        "scenario_count": int(len(key)),
+        "area_unit": "acres",
+        "yield_unit": "kg",
+        "training_points": len(samples),
+        "used_regression_model": used_model,
+        "confidence": confidence_label(len(samples), used_model),
+        "scenarios": scenarios,
+    }), 200
+
+
+# -------------------------------
+# Harvest calendar: every unharvested crop's expected harvest month and kg
+# Growing time is the user's median planting-to-first-harvest days for that
+# crop (once MIN_TIMING_SAMPLES crops have been harvested), else GROWING_DAYS.
+# Forecasts are cached per (user, data version); the calendar window is cut
+# from them per request.
+# -------------------------------
+GROWING_DAYS = {"Maize": 120, "Rice": 130, "Beans": 90, "Cassava": 300, "Sorghum": 110}
+DEFAULT_GROWING_DAYS = 120
+GROWING_DAYS_BY_KEY = {normalize_crop_name(name): days for name, days in GROWING_DAYS.items()}
+MIN_TIMING_SAMPLES = 3
+MAX_CALENDAR_MONTHS = 36
+FORECAST_CACHE_SIZE = int(os.environ.get("FORECAST_CACHE_SIZE", "256"))
+
+_forecast_cache = OrderedDict()
+_forecast_lock = threading.Lock()
+
+def load_forecast_crops(cur, pg, user_id):
+    """The user's crops with their first harvest on/after planting (None = still growing)."""
+    p = "%s" if pg else "?"
+    cur.execute(f"""
+        SELECT c.id, c.name, c.crop_type_id, t.name AS type_name, c.area, c.planting_date,
+               MIN(h.date) AS first_harvest
+        FROM crops c
+        LEFT JOIN crop_types t ON t.id = c.crop_type_id
+        LEFT JOIN harvests h ON h.crop_id = c.id AND h.date >= c.planting_date
+        WHERE c.user_id = {p}
+        GROUP BY c.id, c.name, c.crop_type_id, t.name, c.area, c.planting_date
+    """, (user_id,))
+    return rows_to_list(cur.fetchall())
+
+def growing_days(crop_name, lags):
+    import numpy as np
+    lags = [d for d in lags if 0 < d <= 730]
+    if len(lags) >= MIN_TIMING_SAMPLES:
+        return int(round(float(np.median(lags)))), "history"
+    return GROWING_DAYS_BY_KEY.get(normalize_crop_name(crop_name), DEFAULT_GROWING_DAYS), "profile"
+
+def forecast_crops(cur, pg, user_id):
+    """
+    (crops, crop_types): one entry per growing crop with its expected harvest
+    date and predicted kg, plus per crop name how it was trained. Each crop
+    name is trained once and predicted for all its crops as arrays.
+    """
+    import numpy as np
+    growing, lags = {}, {}
+    for r in load_forecast_crops(cur, pg, user_id):
+        planted = parse_date(r["planting_date"])
+        try:
+            area = float(r["area"])
+        except (TypeError, ValueError):
+            continue
+        if planted is None or area <= 0:
+            continue
+        crop_name = r.get("type_name") or display_crop_name(r["name"])
+        harvested = parse_date(r["first_harvest"])
+        if harvested is not None:
+            lags.setdefault(crop_name, []).append((harvested - planted).days)
+        else:
+            growing.setdefault(crop_name, []).append((r, planted, area))
+
+    crops, crop_types = [], []
+    for crop_name, group in sorted(growing.items()):
+        samples = load_training_samples(cur, pg, user_id, group[0][0].get("crop_type_id"), resolve_profile(crop_name))
+        model = train_ridge_model(samples)
+        days, timing = growing_days(crop_name, lags.get(crop_name, []))
+
+        months = np.array([planted.month for _, planted, _ in group])
+        years = np.array([planted.year for _, planted, _ in group])
+        areas = np.array([area for _, _, area in group], dtype=float)
+        per_acre = blended_pred_array(months, profile_table(crop_name), model, len(samples), {"area": areas, "year": years})
+        totals = per_acre * areas
+
+        for i, (r, planted, area) in enumerate(group):
+            crops.append({
+                "crop_id": r["id"],
+                "crop_name": crop_name,
+                "planting_date": planted.isoformat(),
+                "expected_harvest_date": (planted + timedelta(days=days)).isoformat(),
+                "area": area,
+                "predicted_yield": round(float(totals[i]), 1),
+                "predicted_yield_per_acre": round(float(per_acre[i]), 1),
+            })
+        crop_types.append({
+            "crop_name": crop_name,
+            "crops": len(group),
+            "growing_days": days,
+            "timing_source": timing,
+            "training_points": len(samples),
+            "used_regression_model": model is not None,
+            "confidence": confidence_label(len(samples), model is not None),
+        })
+    crops.sort(key=lambda c: (c["expected_harvest_date"], c["crop_id"]))
+    return crops, crop_types
+
+def cached_forecast(cur, pg, user_id, data_version):
+    key = (int(user_id), int(data_version), priors_generation())
+    with _forecast_lock:
+        hit = _forecast_cache.get(key)
+        if hit is not None:
+            _forecast_cache.move_to_end(key)
+    metrics.inc("forecast.cache_hits" if hit is not None else "forecast.cache_misses")
+    if hit is not None:
+        return hit
+
+    entry = forecast_crops(cur, pg, user_id)
+    with _forecast_lock:
+        _forecast_cache[key] = entry
+        while len(_forecast_cache) > FORECAST_CACHE_SIZE:
+            _forecast_cache.popitem(last=False)
+    return entry
+
+def month_index(date_str):
+    return int(date_str[:4]) * 12 + int(date_str[5:7]) - 1
+
+def harvest_calendar(crops, start, n_months):
+    """Monthly buckets from month index `start`; crops due earlier are overdue, later ones beyond."""
+    import numpy as np
+    offsets = np.array([month_index(c["expected_harvest_date"]) - start for c in crops], dtype=int)
+    kg = np.array([c["predicted_yield"] for c in crops], dtype=float)
+    in_window = (offsets >= 0) & (offsets < n_months)
+    totals = np.bincount(offsets[in_window], weights=kg[in_window], minlength=n_months)
+    counts = np.bincount(offsets[in_window], minlength=n_months)
+
+    calendar = [{
+        "month": f"{(start + i) // 12:04d}-{(start + i) % 12 + 1:02d}",
+        "predicted_yield": round(float(totals[i]), 1),
+        "crop_count": int(counts[i]),
+        "crops": [],
+    } for i in range(n_months)]
+    for c, off in zip(crops, offsets):
+        if 0 <= off < n_months:
+            calendar[off]["crops"].append(c)
+
+    def outside(mask):
+        return {"crop_count": int(mask.sum()), "predicted_yield": round(float(kg[mask].sum()), 1)}
+
+    return calendar, outside(offsets < 0), outside(offsets >= n_months)
+
+
+# =====================================================
+# GET /api/forecast/calendar?user_id=1&months=12
+# =====================================================
+@prediction_routes.route("/forecast/calendar", methods=["GET"])
+def forecast_calendar():
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    try:
+        user_id_int = int(user_id)
+    except ValueError:
+        return jsonify({"error": "Invalid user_id"}), 400
+
+    # a non-integer ?months= is rejected below rather than read as the default
+    n_months = request.args.get("months", type=int) if "months" in request.args else 12
+    if n_months is None or not (1 <= n_months <= MAX_CALENDAR_MONTHS):
+        return jsonify({"error": f"months must be between 1 and {MAX_CALENDAR_MONTHS}"}), 400
+
+    conn = get_db("read", user_id_int)
+    cur = conn.cursor()
+    version = get_data_version(conn, cur, user_id_int)
+    crops, crop_types = cached_forecast(cur, is_postgres(conn), user_id_int, version)
+    conn.close()
+
+    today = datetime.now(timezone.utc).date()
+    start = today.year * 12 + today.month - 1
+    calendar, overdue, later = harvest_calendar(crops, start, n_months)
+
+    return jsonify({
+        "from": calendar[0]["month"],
+        "months": n_months,
+        "yield_unit": "kg",
+        "data_version": version,
+        "total_predicted_yield": round(sum(m["predicted_yield"] for m in calendar), 1),
+        "calendar": calendar,
+        "overdue": overdue,
+        "later": later,
+        "crop_types": crop_types,
     }), 200
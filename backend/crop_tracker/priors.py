@@ -0,0 +1,313 @@
+# priors.py — Global per-crop, per-month yield priors from all users' harvests
+#
+# Each harvest adds one count to a log-scale kg/acre histogram bucket keyed by
+# (normalized crop name, planting month) in crop_prior_hist, inside the write's own
+# transaction. Baseline/min/max are read off the histogram as percentiles
+# (p50 / p5 / p95). The request path only reads an in-memory snapshot that a
+# background thread reloads from the (small) histogram table; no request ever
+# scans harvests across users. With SHARD_MODE each shard file counts its own
+# users' harvests and the refresher adds the histograms up.
+import os
+import math
+import time
+import zlib
+import threading
+from datetime import datetime
+
+from crop_tracker import metrics
+from crop_tracker.croptypes import normalize_crop_name
+from crop_tracker.shards import fan_out
+
+PRIORS_ENABLED = os.environ.get("PRIORS_ENABLED", "1") == "1"
+PRIORS_REFRESH_S = float(os.environ.get("PRIORS_REFRESH_S", "300"))
+# fewer harvests than this for a (crop, month) -> fall back
+PRIORS_MIN_SAMPLES = int(os.environ.get("PRIORS_MIN_SAMPLES", "30"))
+
+BUCKET_BASE = 1.05  # ~5% wide buckets
+ALL_MONTHS = 0      # month key for the crop-wide histogram
+
+_snapshot = {}      # (crop_name, month) -> {"n", "baseline", "min", "max"}
+_generation = 0     # stamp of the profiles _snapshot serves (see snapshot_generation)
+_snapshot_lock = threading.Lock()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def bucket_of(kg_per_acre):
+    return int(math.floor(math.log(kg_per_acre) / math.log(BUCKET_BASE)))
+
+def bucket_value(bucket):
+    # geometric midpoint of the bucket
+    return BUCKET_BASE ** (bucket + 0.5)
+
+def planting_month(value):
+    if hasattr(value, "month"):
+        return int(value.month)
+    try:
+        return int(datetime.strptime(str(value)[:10], "%Y-%m-%d").month)
+    except Exception:
+        return None
+
+
+# -------------------------------
+# Incremental maintenance (call inside the write's transaction)
+# -------------------------------
+def harvest_deltas(crop, yields, sign):
+    """{(crop_name, month, bucket): +/-count} for harvests of one crop row."""
+    out = {}
+    name = normalize_crop_name(crop["name"])
+    month = planting_month(crop["planting_date"])
+    try:
+        area = float(crop["area"])
+    except Exception:
+        return out
+    if not name or month is None or area <= 0:
+        return out
+
+    for y in yields:
+        y = float(y)
+        if y <= 0:
+            continue
+        b = bucket_of(y / area)
+        for m in (month, ALL_MONTHS):
+            key = (name, m, b)
+            out[key] = out.get(key, 0) + sign
+    return out
+
+def apply_prior_deltas(conn, cur, deltas):
+    if not PRIORS_ENABLED:
+        return
+    p = ph(conn)
+    for (name, month, bucket), delta in deltas.items():
+        if delta == 0:
+            continue
+        cur.execute(f"""
+            INSERT INTO crop_prior_hist (crop_name, month, bucket, count)
+            VALUES ({p}, {p}, {p}, {p})
+            ON CONFLICT (crop_name, month, bucket) DO UPDATE
+            SET count = crop_prior_hist.count + excluded.count
+        """, (name, month, bucket, delta))
+
+def crop_harvest_yields(conn, cur, crop_id):
+    p = ph(conn)
+    cur.execute(f"SELECT yield_amount FROM harvests WHERE crop_id = {p}", (crop_id,))
+    return [float(row_to_dict(r)["yield_amount"]) for r in cur.fetchall()]
+
+def record_harvest(conn, cur, crop, yield_amount):
+    apply_prior_deltas(conn, cur, harvest_deltas(crop, [yield_amount], +1))
+
+def forget_crop(conn, cur, crop):
+    """Before a crop (and its harvests) is deleted."""
+    if not PRIORS_ENABLED:
+        return
+    apply_prior_deltas(conn, cur, harvest_deltas(crop, crop_harvest_yields(conn, cur, crop["id"]), -1))
+
+def move_crop(conn, cur, old_crop, new_crop):
+    """Name/area/planting month changed: re-bucket the crop's harvests."""
+    if not PRIORS_ENABLED:
+        return
+    yields = crop_harvest_yields(conn, cur, old_crop["id"])
+    if not yields:
+        return
+    deltas = harvest_deltas(old_crop, yields, -1)
+    for key, d in harvest_deltas(new_crop, yields, +1).items():
+        deltas[key] = deltas.get(key, 0) + d
+    apply_prior_deltas(conn, cur, deltas)
+
+
+# -------------------------------
+# Full rebuild (maintenance only: scans every harvest)
+# -------------------------------
+REBUILD_LOCK_KEY = 7301  # pg_advisory_xact_lock key serializing rebuilds
+
+def rebuild_database_priors(conn, cur, backfill=False):
+    """
+    Replace crop_prior_hist with counts recomputed from every harvest, in
+    one transaction. Counts are written as absolute values (never added),
+    so overlapping rebuilds cannot double-count. On Postgres, rebuilds also
+    queue on an advisory lock, and a backfill that finds the table already
+    filled by another worker leaves it alone.
+    """
+    p = ph(conn)
+    if is_postgres(conn):
+        cur.execute(f"SELECT pg_advisory_xact_lock({p})", (REBUILD_LOCK_KEY,))
+    if backfill:
+        cur.execute("SELECT 1 FROM crop_prior_hist WHERE count > 0 LIMIT 1")
+        if cur.fetchone() is not None:
+            conn.commit()
+            return 0
+
+    cur.execute("""
+        SELECT c.id, c.name, c.area, c.planting_date, h.yield_amount
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+    """)
+    counts = {}
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        for key, d in harvest_deltas(r, [r["yield_amount"]], +1).items():
+            counts[key] = counts.get(key, 0) + d
+
+    cur.execute("DELETE FROM crop_prior_hist")
+    for (name, month, bucket), count in counts.items():
+        cur.execute(f"""
+            INSERT INTO crop_prior_hist (crop_name, month, bucket, count)
+            VALUES ({p}, {p}, {p}, {p})
+            ON CONFLICT (crop_name, month, bucket) DO UPDATE
+            SET count = excluded.count
+        """, (name, month, bucket, count))
+    conn.commit()
+    return len(counts)
+
+def rebuild_crop_priors(backfill=False):
+    # each shard file (SHARD_MODE) keeps the counts of its own users' harvests
+    return sum(n for _, n in fan_out(lambda conn, cur: rebuild_database_priors(conn, cur, backfill)))
+
+
+# -------------------------------
+# Snapshot (in memory, refreshed in the background)
+# -------------------------------
+def percentiles_from_hist(buckets, qs):
+    """buckets: sorted [(bucket, count)] -> values at quantiles qs."""
+    total = sum(c for _, c in buckets)
+    out = []
+    for q in qs:
+        target = q * (total - 1)
+        seen = 0
+        value = bucket_value(buckets[-1][0])
+        for b, c in buckets:
+            if seen + c > target:
+                value = bucket_value(b)
+                break
+            seen += c
+        out.append(value)
+    return out
+
+def read_prior_hist(conn, cur):
+    cur.execute("""
+        SELECT crop_name, month, bucket, count
+        FROM crop_prior_hist
+        WHERE count > 0
+    """)
+    return [row_to_dict(r) for r in cur.fetchall()]
+
+def load_priors():
+    # histograms add up across shard files (SHARD_MODE)
+    counts = {}
+    for _, rows in fan_out(read_prior_hist):
+        for r in rows:
+            key = (r["crop_name"], int(r["month"]), int(r["bucket"]))
+            counts[key] = counts.get(key, 0) + int(r["count"])
+
+    grouped = {}
+    for (name, month, bucket), count in sorted(counts.items()):
+        grouped.setdefault((name, month), []).append((bucket, count))
+
+    snapshot = {}
+    for key, buckets in grouped.items():
+        n = sum(c for _, c in buckets)
+        p5, p50, p95 = percentiles_from_hist(buckets, (0.05, 0.50, 0.95))
+        snapshot[key] = {"n": n, "baseline": p50, "min": p5, "max": p95}
+    return snapshot
+
+def snapshot_generation(snapshot):
+    """
+    Stamp of the profiles prior_profile() can serve from `snapshot`. It only
+    depends on the histogram contents, so every process that loaded the
+    same counts gets the same stamp, and it only moves when a served
+    baseline/min/max does.
+    """
+    served = sorted(
+        (key, v["baseline"], v["min"], v["max"])
+        for key, v in snapshot.items()
+        if v["n"] >= PRIORS_MIN_SAMPLES
+    )
+    return zlib.crc32(repr(served).encode()) if served else 0
+
+def count_harvests(conn, cur):
+    cur.execute("SELECT COUNT(*) AS n FROM harvests")
+    return int(row_to_dict(cur.fetchone())["n"] or 0)
+
+def refresh_priors():
+    global _snapshot, _generation
+    t0 = time.perf_counter()
+    snapshot = load_priors()
+    if not snapshot:
+        # first run on an existing database: backfill once, off the request path
+        if any(n > 0 for _, n in fan_out(count_harvests)):
+            rebuild_crop_priors(backfill=True)
+            snapshot = load_priors()
+
+    generation = snapshot_generation(snapshot)
+    with _snapshot_lock:
+        _snapshot = snapshot
+        _generation = generation
+    metrics.observe("priors.refresh_s", time.perf_counter() - t0)
+    metrics.set_gauge("priors.keys", len(snapshot))
+
+def refresher_loop():
+    while True:
+        try:
+            refresh_priors()
+        except Exception as e:
+            metrics.inc("priors.refresh_errors")
+            print(f"crop priors refresh failed: {e}")
+        time.sleep(PRIORS_REFRESH_S)
+
+def start_refresher():
+    global _refresher
+    if not PRIORS_ENABLED or _refresher is not None:
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=refresher_loop, name="crop-priors", daemon=True)
+            _refresher.start()
+
+def priors_generation():
+    """
+    Stamp of the current snapshot; data derived from prior_profile() is
+    stamped with it and is stale once it changes.
+    """
+    start_refresher()
+    with _snapshot_lock:
+        return _generation
+
+def prior_profile(crop_name, month):
+    """
+    Data-driven profile for (normalized crop name, planting month), or the crop-wide one,
+    or None when neither has PRIORS_MIN_SAMPLES harvests yet. Month-specific
+    priors already carry seasonality ("season_adjusted").
+    """
+    start_refresher()
+    with _snapshot_lock:
+        by_month = _snapshot.get((crop_name, month))
+        overall = _snapshot.get((crop_name, ALL_MONTHS))
+
+    if by_month and by_month["n"] >= PRIORS_MIN_SAMPLES:
+        return dict(by_month, season_adjusted=True, source="global_prior_month")
+    if overall and overall["n"] >= PRIORS_MIN_SAMPLES:
+        return dict(overall, season_adjusted=False, source="global_prior")
+    return None
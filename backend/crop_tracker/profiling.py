@@ -0,0 +1,229 @@
+# profiling.py — On-demand per-request cProfile + aggregated stack sampling
+import os
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import Counter, OrderedDict
+from flask import request, g
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = "X-Profile"
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+# > 0 starts the sampler: every in-flight request is sampled at this interval
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "0"))
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+_active = {}  # thread id -> endpoint being served
+_samples = Counter()
+_samples_lock = threading.Lock()
+_sampler = None
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+def frame_label(filename, lineno, funcname):
+    if filename == "~":
+        # builtins: "<method 'execute' of 'sqlite3.Cursor' objects>"
+        return funcname.strip("<>")
+    return f"{funcname} ({os.path.basename(filename)}:{lineno})"
+
+def time_category(filename, funcname):
+    text = f"{filename} {funcname}"
+    if "sqlite3" in text or "psycopg2" in text:
+        return "db"
+    if "/json/" in filename or "_json" in funcname or "flask/json" in filename:
+        return "json"
+    return "python"
+
+def collapsed_from_stats(stats, max_depth=64, min_fraction=1e-4):
+    """
+    cProfile only records caller->callee edges, so full stacks are rebuilt by
+    walking the call graph from the roots and splitting each function's own
+    time across paths in proportion to the edge times.
+    """
+    children = {}
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    out = Counter()
+
+    def walk(func, path, fraction):
+        cc, nc, tt, ct, callers = stats[func]
+        label = frame_label(*func)
+        stack = path + [label]
+        own_us = int(tt * fraction * 1_000_000)
+        if own_us > 0:
+            out[";".join(stack)] += own_us
+
+        if len(stack) >= max_depth or ct <= 0:
+            return
+        for child, edge_ct in children.get(func, []):
+            child_ct = stats[child][3]
+            if child_ct <= 0 or frame_label(*child) in stack:
+                continue
+            child_fraction = fraction * edge_ct / child_ct
+            if child_fraction >= min_fraction:
+                walk(child, stack, child_fraction)
+
+    for root in roots:
+        walk(root, [], 1.0)
+    return out
+
+def summarize_profile(profiler):
+    st = pstats.Stats(profiler)
+    split = {"python": 0.0, "db": 0.0, "json": 0.0}
+    top = []
+    for func, (cc, nc, tt, ct, callers) in st.stats.items():
+        split[time_category(func[0], func[2])] += tt
+        top.append((tt, ct, nc, frame_label(*func)))
+
+    top.sort(reverse=True)
+    collapsed = collapsed_from_stats(st.stats)
+    return {
+        "split_ms": {k: round(v * 1000.0, 3) for k, v in split.items()},
+        "top_functions": [
+            {"function": label, "calls": nc, "self_ms": round(tt * 1000.0, 3), "cumulative_ms": round(ct * 1000.0, 3)}
+            for tt, ct, nc, label in top[:25]
+        ],
+        "collapsed": "\n".join(f"{stack} {us}" for stack, us in collapsed.most_common()),
+    }
+
+def store_profile(entry):
+    with _profiles_lock:
+        _profiles[entry["id"]] = entry
+        while len(_profiles) > PROFILE_KEEP:
+            _profiles.popitem(last=False)
+
+def list_profiles():
+    with _profiles_lock:
+        entries = list(_profiles.values())
+    return [
+        {k: e[k] for k in ("id", "endpoint", "path", "status", "wall_ms", "split_ms", "created_at")}
+        for e in reversed(entries)
+    ]
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+# -------------------------------
+# Sampling mode
+# -------------------------------
+def sample_once():
+    frames = sys._current_frames()
+    active = dict(_active)
+    batch = Counter()
+
+    for tid, endpoint in active.items():
+        frame = frames.get(tid)
+        if frame is None:
+            continue
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        stack.append(endpoint or "unknown")
+        batch[";".join(reversed(stack))] += 1
+
+    if batch:
+        with _samples_lock:
+            _samples.update(batch)
+
+def sampler_loop(interval_s):
+    while True:
+        time.sleep(interval_s)
+        try:
+            sample_once()
+        except Exception:
+            continue
+
+def start_sampler():
+    """
+    Samples OS threads only; under gevent every greenlet shares one thread,
+    so stacks are attributed to whichever request is running at that moment.
+    """
+    global _sampler
+    if _sampler is not None or PROFILE_SAMPLE_INTERVAL_MS <= 0:
+        return
+    _sampler = threading.Thread(
+        target=sampler_loop,
+        args=(PROFILE_SAMPLE_INTERVAL_MS / 1000.0,),
+        name="profile-sampler",
+        daemon=True,
+    )
+    _sampler.start()
+
+def collapsed_samples():
+    with _samples_lock:
+        items = _samples.most_common()
+    return "\n".join(f"{stack} {count}" for stack, count in items)
+
+def reset_samples():
+    with _samples_lock:
+        _samples.clear()
+
+
+# -------------------------------
+# Flask hooks
+# -------------------------------
+def before_request():
+    if PROFILE_SAMPLE_INTERVAL_MS > 0:
+        _active[threading.get_ident()] = request.endpoint
+
+    if request.headers.get(PROFILE_HEADER) != "1":
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: only one profiler may be active per process
+        return
+    g.profile_started = time.perf_counter()
+    g.profiler = profiler
+
+def after_request(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+
+    profiler.disable()
+    wall_ms = (time.perf_counter() - g.pop("profile_started")) * 1000.0
+    entry = summarize_profile(profiler)
+    entry.update({
+        "id": uuid.uuid4().hex[:12],
+        "endpoint": request.endpoint,
+        "path": request.full_path,
+        "status": response.status_code,
+        "wall_ms": round(wall_ms, 3),
+        "created_at": time.time(),
+    })
+    store_profile(entry)
+    response.headers["X-Profile-Id"] = entry["id"]
+    return response
+
+def teardown_request(exc):
+    _active.pop(threading.get_ident(), None)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        # request failed before after_request ran
+        profiler.disable()
+
+def init_profiling(app):
+    if not PROFILING_ENABLED:
+        return
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    start_sampler()
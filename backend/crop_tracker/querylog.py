@@ -0,0 +1,297 @@
+# querylog.py — Statement timing + slow-query log (SQLite + Postgres)
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# unset -> stderr (the process log); a path -> rotating file
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG")
+SLOW_QUERY_LOG_BYTES = int(os.environ.get("SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", "5"))
+# distinct normalized statements kept in the timing table (least recently seen dropped)
+QUERY_STATS_MAX = int(os.environ.get("QUERY_STATS_MAX", "2000"))
+
+# Statements touching these columns never have their string params logged
+SENSITIVE_SQL = re.compile(r"password|token|email", re.IGNORECASE)
+
+_stats = OrderedDict()
+_stats_lock = threading.Lock()
+_logger = None
+_logger_lock = threading.Lock()
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def normalize_sql(sql: str) -> str:
+    # Collapse whitespace, numeric literals (LIMIT 20, PRAGMA user_version = 9)
+    # and variable-length IN / VALUES lists so the same statement built for
+    # different inputs aggregates under one key. Quoted strings are kept.
+    text = " ".join(str(sql).split())
+    text = SQL_LITERAL.sub(lambda m: m.group(0) if m.group(0).startswith("'") else "N", text)
+    text = re.sub(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)", "(?+)", text)
+    return re.sub(r"\((?:\?|%s)\)(?:\s*,\s*\((?:\?|%s)\))+", "(?)+", text)
+
+def redact_params(sql, params):
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        values = list(params.values())
+    else:
+        values = list(params)
+
+    sensitive = SENSITIVE_SQL.search(str(sql)) is not None
+    out = []
+    for v in values:
+        if isinstance(v, str):
+            if sensitive:
+                out.append("<redacted>")
+            elif len(v) > 64:
+                out.append(v[:64] + "...")
+            else:
+                out.append(v)
+        elif isinstance(v, (bytes, bytearray, memoryview)):
+            out.append(f"<{len(v)} bytes>")
+        else:
+            out.append(v)
+    return out
+
+def get_logger():
+    global _logger
+    if _logger is not None:
+        return _logger
+
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("crop_tracker.slow_queries")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = None
+            if SLOW_QUERY_LOG:
+                try:
+                    handler = RotatingFileHandler(
+                        SLOW_QUERY_LOG,
+                        maxBytes=SLOW_QUERY_LOG_BYTES,
+                        backupCount=SLOW_QUERY_LOG_BACKUPS,
+                    )
+                except OSError:
+                    pass   # read-only filesystem etc. -> stderr
+            if handler is None:
+                handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+            _logger = logger
+    return _logger
+
+
+# -------------------------------
+# Plan capture
+# -------------------------------
+EXPLAINABLE = re.compile(r"^\s*(select|with|insert|update|delete)\b", re.IGNORECASE)
+
+def explain_sqlite(conn, sql, params):
+    if not EXPLAINABLE.match(sql):
+        return []
+    try:
+        # plain sqlite3.Cursor so the EXPLAIN itself is not timed/recorded
+        cur = sqlite3.Cursor(conn)
+        cur.execute("EXPLAIN QUERY PLAN " + sql, params or ())
+        return [str(r[3]) for r in cur.fetchall()]
+    except Exception as e:
+        return [f"<explain failed: {e}>"]
+
+def explain_postgres(conn, sql, params):
+    """
+    Runs inside the caller's transaction, so behind a savepoint: a failing
+    EXPLAIN must not abort the request's own work.
+    """
+    if not EXPLAINABLE.match(sql):
+        return []
+    try:
+        import psycopg2.extensions
+        cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    except Exception as e:
+        return [f"<explain failed: {e}>"]
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            cur.execute("SAVEPOINT querylog_explain")
+        try:
+            cur.execute("EXPLAIN " + sql, params)
+            plan = [str(r[0]) for r in cur.fetchall()]
+        except Exception as e:
+            if savepoint:
+                cur.execute("ROLLBACK TO SAVEPOINT querylog_explain")
+            plan = [f"<explain failed: {e}>"]
+        if savepoint:
+            cur.execute("RELEASE SAVEPOINT querylog_explain")
+        return plan
+    except Exception as e:
+        return [f"<explain failed: {e}>"]
+    finally:
+        cur.close()
+
+
+# -------------------------------
+# Recording
+# -------------------------------
+def record_statement(conn, sql, params, elapsed_ms, explain=None):
+    key = normalize_sql(sql)
+    slow = elapsed_ms >= SLOW_QUERY_MS
+
+    with _stats_lock:
+        st = _stats.get(key)
+        if st is None:
+            st = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "slow_calls": 0}
+            _stats[key] = st
+            while len(_stats) > QUERY_STATS_MAX:
+                _stats.popitem(last=False)
+        else:
+            _stats.move_to_end(key)
+        st["calls"] += 1
+        st["total_ms"] += elapsed_ms
+        if elapsed_ms > st["max_ms"]:
+            st["max_ms"] = elapsed_ms
+        if slow:
+            st["slow_calls"] += 1
+
+    if not slow:
+        return
+
+    plan = explain(conn, sql, params) if explain else []
+    get_logger().info(
+        "slow query %.1fms | %s | params=%r | plan=%s",
+        elapsed_ms,
+        key,
+        redact_params(sql, params),
+        " / ".join(plan),
+    )
+
+def top_statements(n=20, order_by="total_ms"):
+    if order_by not in ("total_ms", "max_ms", "calls", "slow_calls"):
+        order_by = "total_ms"
+
+    with _stats_lock:
+        items = [(k, dict(v)) for k, v in _stats.items()]
+
+    items.sort(key=lambda kv: kv[1][order_by], reverse=True)
+    out = []
+    for sql, st in items[:n]:
+        out.append({
+            "sql": sql,
+            "calls": st["calls"],
+            "total_ms": round(st["total_ms"], 3),
+            "avg_ms": round(st["total_ms"] / st["calls"], 3) if st["calls"] else 0.0,
+            "max_ms": round(st["max_ms"], 3),
+            "slow_calls": st["slow_calls"],
+        })
+    return out
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# -------------------------------
+# SQLite: timed connection/cursor
+# -------------------------------
+class TimedSqliteCursor(sqlite3.Cursor):
+    """
+    SQLite evaluates SELECTs lazily while rows are fetched, so a statement
+    that returns rows is timed from execute() until its first fetch call
+    completes (or the next execute/close).
+    """
+    _pending = None
+
+    def _flush(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            sql, params, elapsed = pending
+            record_statement(self.connection, sql, params, elapsed * 1000.0, explain_sqlite)
+
+    def execute(self, sql, parameters=()):
+        self._flush()
+        t0 = time.perf_counter()
+        result = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - t0
+
+        if self.description is not None:
+            self._pending = (sql, parameters, elapsed)
+        else:
+            record_statement(self.connection, sql, parameters, elapsed * 1000.0, explain_sqlite)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush()
+        t0 = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        # no plan for bulk statements: params are an iterator we already consumed
+        record_statement(self.connection, sql, None, (time.perf_counter() - t0) * 1000.0)
+        return result
+
+    def _timed_fetch(self, fetch, *args):
+        t0 = time.perf_counter()
+        rows = fetch(*args)
+        if self._pending is not None:
+            sql, params, elapsed = self._pending
+            self._pending = (sql, params, elapsed + (time.perf_counter() - t0))
+            self._flush()
+        return rows
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed_fetch(super().fetchmany)
+        return self._timed_fetch(super().fetchmany, size)
+
+    def close(self):
+        self._flush()
+        super().close()
+
+
+class TimedSqliteConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedSqliteCursor):
+        return super().cursor(factory)
+
+
+# -------------------------------
+# Postgres: timed cursor (psycopg2 is imported lazily)
+# -------------------------------
+_pg_cursor_class = None
+
+def pg_cursor_class():
+    global _pg_cursor_class
+    if _pg_cursor_class is not None:
+        return _pg_cursor_class
+
+    from psycopg2.extras import RealDictCursor
+
+    class TimedRealDictCursor(RealDictCursor):
+        def execute(self, query, vars=None):
+            t0 = time.perf_counter()
+            result = super().execute(query, vars)
+            record_statement(self.connection, query, vars,
+                             (time.perf_counter() - t0) * 1000.0, explain_postgres)
+            return result
+
+        def executemany(self, query, vars_list):
+            t0 = time.perf_counter()
+            result = super().executemany(query, vars_list)
+            record_statement(self.connection, query, None, (time.perf_counter() - t0) * 1000.0)
+            return result
+
+    _pg_cursor_class = TimedRealDictCursor
+    return _pg_cursor_class
@@ -0,0 +1,205 @@
+# replicas.py — Read-only replica routing for get_db(role="read")
+#
+# DATABASE_READ_URL lists one or more replicas, comma separated: postgres
+# URLs, or sqlite:///path files for local testing. Reads rotate over them
+# round-robin; a replica that fails to connect or fails its health check
+# (SELECT 1, plus replay lag under REPLICA_MAX_LAG_S on Postgres) is skipped
+# for REPLICA_RETRY_S. With no healthy replica, reads go to the primary.
+#
+# Read-your-writes: after a user writes, that user's reads stay on the
+# primary for READ_STICKY_S. Writes are tracked per process (like the other
+# on_user_write listeners), so the window should cover replication lag.
+#
+# Local replication for two SQLite files (copies the primary every N s):
+#   DATABASE_READ_URL=sqlite:////tmp/replica.db python -m crop_tracker.replicas --every 5
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from urllib.parse import urlparse
+
+from crop_tracker.querylog import TimedSqliteConnection, pg_cursor_class
+from crop_tracker.dataversion import on_user_write
+from crop_tracker import metrics
+
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL", "")
+READ_STICKY_S = float(os.environ.get("READ_STICKY_S", "10"))
+REPLICA_RETRY_S = float(os.environ.get("REPLICA_RETRY_S", "30"))
+REPLICA_CHECK_S = float(os.environ.get("REPLICA_CHECK_S", "5"))
+REPLICA_MAX_LAG_S = float(os.environ.get("REPLICA_MAX_LAG_S", "30"))
+REPLICA_CONNECT_TIMEOUT_S = int(os.environ.get("REPLICA_CONNECT_TIMEOUT_S", "2"))
+
+_last_write = {}   # user_id -> monotonic time of the last write
+_next = 0
+_lock = threading.Lock()
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag_s = None
+        self.reads = 0
+        self.failures = 0
+        self.last_error = None
+
+    def label(self):
+        # never expose credentials in /api/admin/replicas
+        if self.url.startswith("sqlite:///"):
+            return self.url
+        u = urlparse(self.url)
+        return f"{u.scheme}://{u.hostname}:{u.port or 5432}{u.path}"
+
+    def connect(self):
+        if self.url.startswith("sqlite:///"):
+            path = self.url[len("sqlite:///"):]
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, factory=TimedSqliteConnection)
+            conn.database_path = path
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        url = self.url
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        import psycopg2
+        conn = psycopg2.connect(url, cursor_factory=pg_cursor_class(), connect_timeout=REPLICA_CONNECT_TIMEOUT_S)
+        conn.set_session(readonly=True)
+        return conn
+
+    def check(self, conn):
+        cur = conn.cursor()
+        if isinstance(conn, sqlite3.Connection):
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            return
+        # lag is 0 when everything received has been replayed (an idle
+        # primary would otherwise look like a lagging replica)
+        cur.execute("""
+            SELECT CASE
+                     WHEN NOT pg_is_in_recovery() THEN 0
+                     WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                     ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                   END AS lag_s
+        """)
+        self.lag_s = float(cur.fetchone()["lag_s"])
+        metrics.set_gauge(f"replicas.{self.label()}.lag_s", round(self.lag_s, 3))
+        if self.lag_s > REPLICA_MAX_LAG_S:
+            raise RuntimeError(f"replica lag {self.lag_s:.1f}s > {REPLICA_MAX_LAG_S:.0f}s")
+
+    def state(self):
+        return {
+            "replica": self.label(),
+            "healthy": self.down_until <= time.time(),
+            "lag_s": self.lag_s,
+            "reads": self.reads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+_replicas = [Replica(u.strip()) for u in DATABASE_READ_URL.split(",") if u.strip()]
+
+
+# -------------------------------
+# Read-your-writes
+# -------------------------------
+@on_user_write
+def remember_write(user_id):
+    now = time.monotonic()
+    with _lock:
+        _last_write[int(user_id)] = now
+        if len(_last_write) > 10000:
+            for uid, t in list(_last_write.items()):
+                if now - t > READ_STICKY_S:
+                    del _last_write[uid]
+
+def sticky_to_primary(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return False
+    with _lock:
+        t = _last_write.get(user_id)
+    return t is not None and time.monotonic() - t < READ_STICKY_S
+
+
+# -------------------------------
+# Routing
+# -------------------------------
+def read_connection(user_id=None):
+    """A replica connection, or None when reads should go to the primary."""
+    if not _replicas:
+        return None
+    if user_id is not None and sticky_to_primary(user_id):
+        metrics.inc("replicas.sticky_primary")
+        return None
+
+    global _next
+    for _ in range(len(_replicas)):
+        with _lock:
+            r = _replicas[_next % len(_replicas)]
+            _next += 1
+        now = time.time()
+        if r.down_until > now:
+            continue
+
+        conn = None
+        try:
+            conn = r.connect()
+            if now - r.checked_at >= REPLICA_CHECK_S:
+                r.check(conn)
+                r.checked_at = now
+        except Exception as e:
+            if conn is not None:
+                conn.close()
+            r.failures += 1
+            r.last_error = str(e) or e.__class__.__name__
+            r.down_until = now + REPLICA_RETRY_S
+            metrics.inc("replicas.marked_down")
+            print(f"replica {r.label()} unavailable for {REPLICA_RETRY_S:.0f}s: {r.last_error}")
+            continue
+
+        r.reads += 1
+        metrics.inc("replicas.reads")
+        return conn
+
+    metrics.inc("replicas.fallback_primary")
+    return None
+
+def replica_state():
+    return [r.state() for r in _replicas]
+
+
+# -------------------------------
+# Local testing: SQLite "replication" by periodic copy
+# -------------------------------
+def copy_sqlite_primary(primary_path):
+    for r in _replicas:
+        if not r.url.startswith("sqlite:///"):
+            continue
+        src = sqlite3.connect(primary_path)
+        try:
+            dst = sqlite3.connect(r.url[len("sqlite:///"):])
+            src.backup(dst)
+            dst.close()
+        except sqlite3.Error as e:
+            print(f"copy to {r.label()} failed: {e}")
+        finally:
+            src.close()
+
+
+if __name__ == "__main__":
+    from crop_tracker.model import SQLITE_PATH
+
+    parser = argparse.ArgumentParser(description="Copy the SQLite primary into sqlite:/// replicas")
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds (simulated lag)")
+    args = parser.parse_args()
+
+    while True:
+        copy_sqlite_primary(SQLITE_PATH)
+        print(f"copied {SQLITE_PATH} to sqlite replicas")
+        if args.every <= 0:
+            break
+        time.sleep(args.every)
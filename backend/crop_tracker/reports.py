@@ -0,0 +1,429 @@
+# reports.py — Asynchronous multi-user reports (DB-backed queue + worker pool)
+#
+# POST /api/reports only records the spec in report_jobs (deduplicated by a
+# hash of the normalized spec) and returns its id; worker processes started
+# separately claim queued jobs and compute them:
+#
+#   python -m crop_tracker.reports --processes 2
+#
+# GET /api/reports/<id> reports progress; .../download returns the result.
+# A report may cover the requester and members of organizations they
+# manage; only the requester can read its status and download it.
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import multiprocessing
+from flask import Blueprint, request, jsonify, Response
+
+from crop_tracker.model import get_db, ensure_schema
+from crop_tracker.croptypes import lookup_crop_type, normalize_crop_name
+from crop_tracker.harvest import top_crops_by_year, seasonality_by_month, crop_year_stats
+from crop_tracker.shards import sharding_enabled, shard_connection
+
+report_routes = Blueprint("report_routes", __name__, url_prefix="/api")
+
+REPORT_MAX_USERS = int(os.environ.get("REPORT_MAX_USERS", "500"))
+REPORT_MAX_YEARS = int(os.environ.get("REPORT_MAX_YEARS", "30"))
+# an identical spec re-posted after this long is recomputed (data may have changed)
+REPORT_TTL_S = float(os.environ.get("REPORT_TTL_S", "3600"))
+# a running job whose worker has not reported progress for this long is re-queued
+REPORT_STALE_S = float(os.environ.get("REPORT_STALE_S", "300"))
+REPORT_POLL_S = float(os.environ.get("REPORT_POLL_S", "1.0"))
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def rows_to_list(rows):
+    return [row_to_dict(r) for r in rows]
+
+
+# -------------------------------
+# Spec
+# -------------------------------
+def normalize_spec(data):
+    """(spec, None) or (None, error message). Equal specs hash equally."""
+    try:
+        user_ids = sorted({int(u) for u in data.get("user_ids") or []})
+        year_from = int(data.get("from"))
+        year_to = int(data.get("to"))
+        top = int(data.get("top", 5))
+    except (TypeError, ValueError):
+        return None, "user_ids, from and to must be integers"
+
+    crops = data.get("crops") or []
+    if not isinstance(crops, list) or not all(isinstance(c, str) for c in crops):
+        return None, "crops must be a list of crop names"
+
+    if not user_ids:
+        return None, "user_ids is required"
+    if len(user_ids) > REPORT_MAX_USERS:
+        return None, f"At most {REPORT_MAX_USERS} users per report"
+    if year_from > year_to:
+        return None, "from year must be <= to year"
+    if year_to - year_from + 1 > REPORT_MAX_YEARS:
+        return None, f"At most {REPORT_MAX_YEARS} years per report"
+
+    return {
+        "user_ids": user_ids,
+        "from": year_from,
+        "to": year_to,
+        "top": max(1, min(top, 30)),
+        "crops": sorted({normalize_crop_name(c) for c in crops if c.strip()}),
+    }, None
+
+def spec_hash(spec, requested_by):
+    key = {"spec": spec, "requested_by": int(requested_by)}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# -------------------------------
+# Access
+# -------------------------------
+def unreadable_users(conn, cur, requester, user_ids):
+    """The user_ids requester may not report on: anyone but themselves and members of orgs they manage."""
+    others = [u for u in user_ids if u != int(requester)]
+    if not others:
+        return []
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT DISTINCT m.user_id
+        FROM org_members mgr
+        JOIN org_members m ON m.org_id = mgr.org_id
+        WHERE mgr.user_id = {p} AND mgr.role = 'manager'
+    """, (int(requester),))
+    readable = {int(row_to_dict(r)["user_id"]) for r in cur.fetchall()}
+    return [u for u in others if u not in readable]
+
+def report_reader(report_id):
+    """(job, None) for the report's requester, else (None, error response)."""
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return None, (jsonify({"error": "User not logged in"}), 401)
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        job = get_job(conn, cur, report_id)
+        # requester's access is re-checked: they may have lost a manager role since
+        if (not job or job["requested_by"] is None or int(job["requested_by"]) != user_id
+                or unreadable_users(conn, cur, user_id, json.loads(job["spec"])["user_ids"])):
+            return None, (jsonify({"error": "Report not found"}), 404)
+        return job, None
+    finally:
+        conn.close()
+
+
+# -------------------------------
+# Queue
+# -------------------------------
+def get_job(conn, cur, job_id):
+    p = ph(conn)
+    cur.execute(f"SELECT * FROM report_jobs WHERE id = {p}", (job_id,))
+    return row_to_dict(cur.fetchone())
+
+def enqueue_report(conn, cur, spec, requested_by):
+    """
+    Returns (job, created). The same requester posting an identical spec
+    reuses its job unless it failed or expired.
+    """
+    p = ph(conn)
+    h = spec_hash(spec, requested_by)
+    now = time.time()
+
+    cur.execute(f"""
+        INSERT INTO report_jobs (spec_hash, spec, requested_by, status, total_steps, created_at)
+        VALUES ({p}, {p}, {p}, 'queued', {p}, {p})
+        ON CONFLICT (spec_hash) DO NOTHING
+    """, (h, json.dumps(spec, sort_keys=True), int(requested_by), len(spec["user_ids"]), now))
+    created = cur.rowcount == 1
+
+    cur.execute(f"SELECT * FROM report_jobs WHERE spec_hash = {p}", (h,))
+    job = row_to_dict(cur.fetchone())
+
+    expired = job["status"] == "done" and now - float(job["finished_at"] or 0) > REPORT_TTL_S
+    if job["status"] == "failed" or expired:
+        cur.execute(f"""
+            UPDATE report_jobs
+            SET status = 'queued', done_steps = 0, result = NULL, error = NULL, worker = NULL,
+                created_at = {p}, started_at = NULL, heartbeat_at = NULL, finished_at = NULL
+            WHERE id = {p} AND status = {p}
+        """, (now, job["id"], job["status"]))
+        created = True
+        job = get_job(conn, cur, job["id"])
+
+    conn.commit()
+    return job, created
+
+def claim_job(conn, cur, worker):
+    """Move one queued (or abandoned) job to running for this worker; None if none."""
+    p = ph(conn)
+    now = time.time()
+    stale = now - REPORT_STALE_S
+    cur.execute(f"""
+        SELECT id FROM report_jobs
+        WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < {p})
+        ORDER BY id
+        LIMIT 5
+    """, (stale,))
+    candidates = [row_to_dict(r)["id"] for r in cur.fetchall()]
+
+    for job_id in candidates:
+        # the status guard makes the claim atomic across worker processes
+        cur.execute(f"""
+            UPDATE report_jobs
+            SET status = 'running', worker = {p}, done_steps = 0,
+                started_at = {p}, heartbeat_at = {p}
+            WHERE id = {p}
+              AND (status = 'queued' OR (status = 'running' AND heartbeat_at < {p}))
+        """, (worker, now, now, job_id, stale))
+        claimed = cur.rowcount == 1
+        conn.commit()
+        if claimed:
+            return get_job(conn, cur, job_id)
+    # nothing claimed: end the read before the worker sleeps, so a Postgres
+    # connection is not left idle in transaction
+    conn.commit()
+    return None
+
+def report_progress(conn, cur, job_id, worker, done_steps):
+    p = ph(conn)
+    cur.execute(f"""
+        UPDATE report_jobs SET done_steps = {p}, heartbeat_at = {p}
+        WHERE id = {p} AND worker = {p}
+    """, (done_steps, time.time(), job_id, worker))
+    conn.commit()
+
+def finish_job(conn, cur, job_id, worker, result=None, error=None):
+    p = ph(conn)
+    cur.execute(f"""
+        UPDATE report_jobs
+        SET status = {p}, result = {p}, error = {p}, finished_at = {p}
+        WHERE id = {p} AND worker = {p} AND status = 'running'
+    """, ("failed" if error else "done", result, error, time.time(), job_id, worker))
+    conn.commit()
+
+
+# -------------------------------
+# Report computation (worker side)
+# -------------------------------
+def user_crop_types(conn, cur, user_id, only_ids=None):
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT DISTINCT t.id, t.name
+        FROM crops c
+        JOIN crop_types t ON t.id = c.crop_type_id
+        WHERE c.user_id = {p}
+        ORDER BY t.name
+    """, (user_id,))
+    rows = rows_to_list(cur.fetchall())
+    return [(int(r["id"]), r["name"]) for r in rows if only_ids is None or int(r["id"]) in only_ids]
+
+def compute_report(conn, cur, spec, on_progress=None):
+    pg = is_postgres(conn)
+    years = list(range(spec["from"], spec["to"] + 1))
+    only_ids = None
+    if spec["crops"]:
+        only_ids = {t for t in (lookup_crop_type(cur, pg, name) for name in spec["crops"]) if t is not None}
+
+    users = {}
+    for i, user_id in enumerate(spec["user_ids"], start=1):
+        # SHARD_MODE: each user is read from their own shard file
+        shard = shard_connection(user_id) if sharding_enabled() else None
+        uconn = shard or conn
+        ucur = uconn.cursor()
+        try:
+            top_names, series = top_crops_by_year(uconn, ucur, user_id, spec["from"], spec["to"], spec["top"])
+            crop_year = {}
+            for type_id, name in user_crop_types(uconn, ucur, user_id, only_ids):
+                crop_year[name] = {str(y): crop_year_stats(uconn, ucur, user_id, type_id, y) for y in years}
+            users[str(user_id)] = {
+                "top_crops_yearly": {"top_names": top_names, "series": series},
+                "seasonality": seasonality_by_month(uconn, ucur, user_id, spec["from"], spec["to"]),
+                "crop_year": crop_year,
+            }
+        finally:
+            if shard is not None:
+                shard.close()
+        if on_progress:
+            on_progress(i)
+
+    return {"spec": spec, "generated_at": time.time(), "users": users}
+
+def run_job(conn, cur, job, worker):
+    # aggregates read from a replica when one is configured; the job row
+    # (progress, heartbeat, result) always lives on the primary
+    read_conn = get_db("read")
+    try:
+        spec = json.loads(job["spec"])
+        result = compute_report(read_conn, read_conn.cursor(), spec,
+                                lambda n: report_progress(conn, cur, job["id"], worker, n))
+        finish_job(conn, cur, job["id"], worker, result=json.dumps(result))
+    except Exception as e:
+        conn.rollback()
+        finish_job(conn, cur, job["id"], worker, error=str(e) or e.__class__.__name__)
+        print(f"report {job['id']} failed: {e}")
+    finally:
+        read_conn.close()
+
+def worker_loop(worker=None, once=False):
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    ensure_schema()
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        while True:
+            job = claim_job(conn, cur, worker)
+            if job is None:
+                if once:
+                    return
+                time.sleep(REPORT_POLL_S)
+                continue
+            run_job(conn, cur, job, worker)
+    finally:
+        conn.close()
+
+def run_pool(processes):
+    procs = [multiprocessing.Process(target=worker_loop, name=f"report-worker-{i}", daemon=True)
+             for i in range(processes)]
+    for proc in procs:
+        proc.start()
+    print(f"Report workers started: {[proc.pid for proc in procs]}")
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+
+
+# =====================================================
+# POST /api/reports
+# {"user_id": 1, "user_ids": [1, 2], "from": 2020, "to": 2025, "crops": ["Maize"], "top": 5}
+# =====================================================
+@report_routes.route("/reports", methods=["POST"])
+def create_report():
+    data = request.get_json() or {}
+    try:
+        requester = int(data.get("user_id") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid user_id"}), 400
+    if not requester:
+        return jsonify({"error": "User not logged in"}), 401
+
+    spec, error = normalize_spec(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    denied = unreadable_users(conn, cur, requester, spec["user_ids"])
+    if denied:
+        conn.close()
+        return jsonify({
+            "error": "Reports may only cover yourself and members of organizations you manage",
+            "user_ids": denied,
+        }), 403
+    job, created = enqueue_report(conn, cur, spec, requester)
+    conn.close()
+
+    resp = jsonify({
+        "id": job["id"],
+        "status": job["status"],
+        "deduplicated": not created,
+        "status_url": f"/api/reports/{job['id']}",
+    })
+    resp.status_code = 202
+    resp.headers["Location"] = f"/api/reports/{job['id']}"
+    return resp
+
+
+# =====================================================
+# GET /api/reports/<id>?user_id=1
+# =====================================================
+@report_routes.route("/reports/<int:report_id>", methods=["GET"])
+def report_status(report_id):
+    _, error = report_reader(report_id)
+    if error:
+        return error
+
+    conn = get_db()
+    cur = conn.cursor()
+    p = ph(conn)
+    cur.execute(f"""
+        SELECT id, status, done_steps, total_steps, error,
+               created_at, started_at, finished_at
+        FROM report_jobs WHERE id = {p}
+    """, (report_id,))
+    job = row_to_dict(cur.fetchone())
+
+    queue_position = None
+    if job and job["status"] == "queued":
+        cur.execute(f"SELECT COUNT(*) AS n FROM report_jobs WHERE status = 'queued' AND id < {p}", (report_id,))
+        queue_position = int(row_to_dict(cur.fetchone())["n"])
+    conn.close()
+
+    if not job:
+        return jsonify({"error": "Report not found"}), 404
+
+    total = int(job["total_steps"] or 0)
+    done = int(job["done_steps"] or 0)
+    out = dict(job, progress=round(done / total, 4) if total else 0.0, queue_position=queue_position)
+    if job["status"] == "done":
+        out["progress"] = 1.0
+        out["download_url"] = f"/api/reports/{report_id}/download"
+    return jsonify(out), 200
+
+
+# =====================================================
+# GET /api/reports/<id>/download?user_id=1
+# =====================================================
+@report_routes.route("/reports/<int:report_id>/download", methods=["GET"])
+def download_report(report_id):
+    job, error = report_reader(report_id)
+    if error:
+        return error
+    if job["status"] != "done":
+        return jsonify({"error": "Report not ready", "status": job["status"]}), 409
+
+    return Response(
+        job["result"],
+        status=200,
+        mimetype="application/json",
+        headers={"Content-Disposition": f"attachment; filename=report-{report_id}.json"},
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report worker pool")
+    parser.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--once", action="store_true", help="drain the queue in this process and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        worker_loop(once=True)
+        sys.exit(0)
+    run_pool(args.processes)
@@ -0,0 +1,269 @@
+# ridge.py — k-feature ridge regression with incremental row updates
+#
+# Model: y = b0 + b1*x1 + ... + bk*xk. The model keeps centered sufficient
+# statistics — row count, feature and target means, the scatter matrix
+# S = sum (x - mean)(x - mean)' and s = sum (x - mean)(y - mean_y) — so rows
+# can be added (rank-one update) or removed (downdate, Welford-style)
+# without refitting from every row. Raw X'X is never formed, so features
+# like year (~2024) do not lose precision to cancellation.
+#
+# Two penalties, both solved by Cholesky on the small centered system:
+#   default            lam added to every raw diagonal entry of [1, x]'[1, x],
+#                      intercept included: the original 2x2 month model
+#   standardize=True   features scaled to unit variance, lam on the scaled
+#                      coefficients only, intercept unpenalized
+import numpy as np
+
+# -------------------------------
+# Features: name -> value from a training/prediction sample dict
+# sample keys: month, area, year, lag_days (harvest date - planting date)
+# -------------------------------
+FEATURES = {
+    "month": lambda s: s.get("month"),
+    "area": lambda s: s.get("area"),
+    "year": lambda s: s.get("year"),
+    "lag": lambda s: (s["lag_days"] / 30.0) if s.get("lag_days") is not None else None,
+}
+
+
+def column_scaling(X):
+    """(means, scales) of the feature columns of X (intercept column excluded)."""
+    means = X[:, 1:].mean(axis=0)
+    scales = X[:, 1:].std(axis=0)
+    # a constant column is all zeros once centered: any scale works
+    scales[scales == 0] = 1.0
+    return means, scales
+
+def raw_coefficients(b0, b, means, scales):
+    """Standardized-scale (b0, b) -> raw-scale coefficients, intercept first."""
+    coef = b / scales
+    return np.concatenate([[b0 - coef @ means], coef])
+
+
+class RidgeModel:
+    """
+    Ridge on an intercept plus `features`. By default lam is added to every
+    raw diagonal entry (intercept included), which is what the original 2x2
+    month model did, so features=("month",) reproduces it. standardize=True
+    penalizes the unit-variance feature coefficients only.
+    """
+
+    def __init__(self, features=("month",), lam=0.5, standardize=False):
+        unknown = [f for f in features if f not in FEATURES]
+        if unknown:
+            raise ValueError(f"Unknown ridge features: {unknown}")
+        self.features = tuple(features)
+        self.k = len(self.features) + 1
+        self.lam = float(lam)
+        self.standardize = bool(standardize)
+        self.reset()
+
+    def reset(self):
+        p = self.k - 1
+        self.n = 0
+        self.means = np.zeros(p)
+        self.y_mean = 0.0
+        self.sxx = np.zeros((p, p))
+        self.sxy = np.zeros(p)
+        self._coef = None
+
+    # ---------- design rows ----------
+    def row(self, sample, fill=None):
+        """Feature vector (with intercept) for one sample; None if a value is missing."""
+        out = np.empty(self.k)
+        out[0] = 1.0
+        for i, name in enumerate(self.features, start=1):
+            v = FEATURES[name](sample)
+            if v is None:
+                if fill is None:
+                    return None
+                v = fill[i]
+            out[i] = float(v)
+        return out
+
+    def fit_arrays(self, X, y):
+        """X: (n, k) design matrix including the intercept column."""
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.reset()
+        self.n = X.shape[0]
+        if self.n == 0:
+            return self
+        self.means = X[:, 1:].mean(axis=0)
+        self.y_mean = float(y.mean())
+        Xc = X[:, 1:] - self.means
+        self.sxx = Xc.T @ Xc
+        self.sxy = Xc.T @ (y - self.y_mean)
+        return self
+
+    def design(self, samples, targets):
+        """
+        (X, y) built column-wise; samples missing a feature value are dropped.
+        """
+        n = len(samples)
+        X = np.ones((n, self.k))
+        ok = np.ones(n, dtype=bool)
+        for j, name in enumerate(self.features, start=1):
+            get = FEATURES[name]
+            col = np.array([np.nan if (v := get(s)) is None else v for s in samples], dtype=float)
+            ok &= ~np.isnan(col)
+            X[:, j] = col
+        return X[ok], np.asarray(targets, dtype=float)[ok]
+
+    def fit(self, samples, targets):
+        return self.fit_arrays(*self.design(samples, targets))
+
+    # ---------- incremental updates ----------
+    def add(self, x, y):
+        """Rank-one update with one design row x (intercept included)."""
+        f = np.asarray(x, dtype=float)[1:]
+        y = float(y)
+        self.n += 1
+        dx = f - self.means
+        dy = y - self.y_mean
+        w = (self.n - 1) / self.n
+        self.means = self.means + dx / self.n
+        self.y_mean += dy / self.n
+        self.sxx = self.sxx + w * np.outer(dx, dx)
+        self.sxy = self.sxy + w * dx * dy
+        self._coef = None
+
+    def remove(self, x, y):
+        """Rank-one downdate: undo a previous add(x, y)."""
+        if self.n <= 1:
+            self.reset()
+            return
+        f = np.asarray(x, dtype=float)[1:]
+        y = float(y)
+        rest = self.n - 1
+        means = (self.n * self.means - f) / rest
+        y_mean = (self.n * self.y_mean - y) / rest
+        dx = f - means
+        dy = y - y_mean
+        w = rest / self.n
+        self.sxx = self.sxx - w * np.outer(dx, dx)
+        self.sxy = self.sxy - w * dx * dy
+        self.means, self.y_mean, self.n = means, y_mean, rest
+        self._coef = None
+
+    def add_sample(self, sample, y):
+        x = self.row(sample)
+        if x is not None:
+            self.add(x, y)
+
+    def remove_sample(self, sample, y):
+        x = self.row(sample)
+        if x is not None:
+            self.remove(x, y)
+
+    # ---------- solve + predict ----------
+    def scales(self):
+        scales = np.sqrt(np.clip(np.diag(self.sxx), 0.0, None) / max(self.n, 1))
+        scales[scales == 0] = 1.0
+        return scales
+
+    def solve(self):
+        """
+        Raw-scale coefficients (intercept first), or None before any rows
+        were fitted or when the system is not positive definite (e.g. a
+        downdate that does not match an earlier add).
+        """
+        if self._coef is not None or self.n == 0:
+            return self._coef
+        n, m, eye = self.n, self.means, np.eye(self.k - 1)
+        if self.standardize:
+            scales = self.scales()
+            a = self.sxx / np.outer(scales, scales) + self.lam * eye
+            rhs = self.sxy / scales
+        else:
+            # intercept eliminated from [[n+lam, n m'], [n m, X'X + lam I]]:
+            # X'X - n^2 m m' / (n+lam) = S + w m m', with w = n lam / (n+lam)
+            w = n * self.lam / (n + self.lam)
+            a = self.sxx + self.lam * eye + w * np.outer(m, m)
+            rhs = self.sxy + w * self.y_mean * m
+        try:
+            L = np.linalg.cholesky(a)
+        except np.linalg.LinAlgError:
+            return None
+        b = np.linalg.solve(L.T, np.linalg.solve(L, rhs))
+        if self.standardize:
+            self._coef = raw_coefficients(self.y_mean, b, m, scales)
+        else:
+            self._coef = np.concatenate([[n * (self.y_mean - m @ b) / (n + self.lam)], b])
+        return self._coef
+
+    @property
+    def coef(self):
+        return self.solve()
+
+    def feature_means(self):
+        return np.concatenate([[1.0], self.means])
+
+    def predict_one(self, sample):
+        coef = self.solve()
+        if coef is None:
+            return None
+        x = self.row(sample, fill=self.feature_means())
+        return float(x @ coef)
+
+    def design_columns(self, columns, n):
+        """
+        (n, k) design matrix from feature columns {name: array}; features
+        without a column use their training mean.
+        """
+        X = np.ones((n, self.k))
+        means = self.feature_means()
+        for j, name in enumerate(self.features, start=1):
+            col = columns.get(name)
+            X[:, j] = means[j] if col is None else np.asarray(col, dtype=float)
+        return X
+
+    def predict_arrays(self, X):
+        coef = self.solve()
+        if coef is None:
+            return None
+        return np.asarray(X, dtype=float) @ coef
+
+
+# -------------------------------
+# Batched bootstrap: all resample refits as one set of array ops
+# -------------------------------
+def bootstrap_coefficients(X, y, lam=0.5, resamples=500, rng=None, max_cells=1_000_000, standardize=False):
+    """
+    Ridge coefficients for `resamples` bootstrap resamples of rows (X, y).
+    Each resample is a row-count vector W (multinomial draw), so its normal
+    equations are W @ (z_i z_i') and W @ (z_i y_i) over the rows z_i,
+    penalized as RidgeModel(standardize=...) is: standardized rows with an
+    unpenalized intercept, or raw rows with lam on every diagonal entry.
+    All k x k systems are solved in one batched call. Work is chunked to keep
+    W under max_cells entries. Returns raw-scale coefficients, (resamples, k).
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n, k = X.shape
+    rng = rng if rng is not None else np.random.default_rng()
+
+    if standardize:
+        means, scales = column_scaling(X)
+        reg = lam * np.diag([0.0] + [1.0] * (k - 1))
+    else:
+        means, scales = np.zeros(k - 1), np.ones(k - 1)
+        reg = lam * np.eye(k)
+    Z = np.column_stack([np.ones(n), (X[:, 1:] - means) / scales])
+    outer = (Z[:, :, None] * Z[:, None, :]).reshape(n, k * k)
+    zy = Z * y[:, None]
+
+    chunk = max(1, max_cells // max(n, 1))
+    out = np.empty((resamples, k))
+    for start in range(0, resamples, chunk):
+        b = min(chunk, resamples - start)
+        idx = rng.integers(0, n, size=(b, n))
+        # per-resample row counts via one bincount over offset indices
+        W = np.bincount((idx + (np.arange(b) * n)[:, None]).ravel(), minlength=b * n).reshape(b, n)
+        ztz = (W @ outer).reshape(b, k, k) + reg
+        zty = W @ zy
+        beta = np.linalg.solve(ztz, zty[:, :, None])[:, :, 0]
+        coef = beta[:, 1:] / scales
+        out[start:start + b, 0] = beta[:, 0] - coef @ means
+        out[start:start + b, 1:] = coef
+    return out
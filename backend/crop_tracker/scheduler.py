@@ -0,0 +1,370 @@
+# scheduler.py — In-process background jobs (interval + cron) with single-runner leases
+#
+# A daemon thread ("scheduler") started on the first request wakes every
+# SCHEDULER_TICK_S and runs the jobs that are due. Shared jobs keep their
+# schedule in scheduler_jobs: a process runs one only after moving its
+# lease forward with a guarded UPDATE (the report queue's claim pattern),
+# so with several workers or replicas each run happens once; a lease that
+# outlives a crashed runner expires after the job's lease_s. Per-process
+# jobs (warming this process's caches) skip the table.
+#
+# Cron expressions are the usual five fields (minute hour day month
+# weekday, with *, lists, ranges and */steps), evaluated in UTC.
+# Runs, errors and durations go to metrics (scheduler.<job>.*);
+# GET /api/admin/scheduler lists the jobs.
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+
+from crop_tracker import metrics
+from crop_tracker.model import get_db, ensure_schema
+from crop_tracker.shards import fan_out
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_TICK_S = float(os.environ.get("SCHEDULER_TICK_S", "30"))
+SCHEDULER_ANALYZE_CRON = os.environ.get("SCHEDULER_ANALYZE_CRON", "15 3 * * *")
+SCHEDULER_VACUUM_CRON = os.environ.get("SCHEDULER_VACUUM_CRON", "30 3 * * 0")
+# most recently written users whose analytics are warmed after startup
+WARM_USERS = int(os.environ.get("WARM_USERS", "50"))
+
+_jobs = {}
+_local = {}        # per-process job name -> {"next_run_at", "last_*"}
+_thread = None
+_lock = threading.Lock()
+_owner = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def rows_to_list(rows):
+    return [row_to_dict(r) for r in rows]
+
+
+# -------------------------------
+# Cron
+# -------------------------------
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]   # weekday 7 = Sunday
+
+def parse_cron_field(spec, lo, hi):
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-"))
+        else:
+            start = end = int(part)
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"cron field {spec!r} out of range {lo}-{hi}")
+        values.update(range(start, end + 1, step))
+    return values
+
+def parse_cron(expr):
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+    parsed = [parse_cron_field(f, lo, hi) for f, (lo, hi) in zip(fields, CRON_FIELDS)]
+    # 7 is Sunday too
+    if 7 in parsed[4]:
+        parsed[4] = (parsed[4] - {7}) | {0}
+    # day-of-month and weekday both restricted: either may match (as in cron)
+    parsed.append(fields[2] != "*" and fields[4] != "*")
+    return parsed
+
+def cron_matches_day(cron, dt):
+    minutes, hours, days, months, weekdays, either = cron
+    dom = dt.day in days
+    dow = (dt.weekday() + 1) % 7 in weekdays
+    return dt.month in months and ((dom or dow) if either else (dom and dow))
+
+def cron_next(cron, after):
+    """First minute strictly after `after` (UTC epoch seconds) matching cron."""
+    minutes, hours = cron[0], cron[1]
+    dt = datetime.fromtimestamp(after, timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = dt + timedelta(days=366 * 4)
+    while dt < limit:
+        if not cron_matches_day(cron, dt):
+            dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+        elif dt.hour not in hours:
+            dt = dt.replace(minute=0) + timedelta(hours=1)
+        elif dt.minute not in minutes:
+            dt += timedelta(minutes=1)
+        else:
+            return dt.timestamp()
+    raise ValueError("cron expression never matches")
+
+
+# -------------------------------
+# Jobs
+# -------------------------------
+class Job:
+    def __init__(self, name, fn, interval_s=None, cron=None, at_start=False,
+                 shared=True, lease_s=3600):
+        """
+        interval_s: every N seconds; cron: a five-field expression;
+        at_start: also due right after the process starts (per-process jobs
+        with neither run only then). shared: one runner across processes.
+        """
+        self.name = name
+        self.fn = fn
+        self.interval_s = interval_s
+        self.cron = parse_cron(cron) if cron else None
+        self.cron_expr = cron
+        self.at_start = at_start
+        self.shared = shared
+        self.lease_s = lease_s
+
+    def next_after(self, t):
+        if self.cron is not None:
+            return cron_next(self.cron, t)
+        if self.interval_s:
+            return t + self.interval_s
+        return None
+
+    def first_run(self, now):
+        return now if self.at_start else self.next_after(now)
+
+def register(job):
+    with _lock:
+        _jobs[job.name] = job
+    return job
+
+def seed_jobs(conn, cur, now):
+    """Insert missing scheduler_jobs rows (another process may do it first)."""
+    p = ph(conn)
+    for job in _jobs.values():
+        if job.shared:
+            cur.execute(f"""
+                INSERT INTO scheduler_jobs (name, next_run_at, locked_until)
+                VALUES ({p}, {p}, 0)
+                ON CONFLICT (name) DO NOTHING
+            """, (job.name, job.first_run(now)))
+        else:
+            _local.setdefault(job.name, {"next_run_at": job.first_run(now)})
+    conn.commit()
+
+def claim(conn, cur, job, now):
+    """Take the job's lease if it is due and nobody holds it; True if this process runs it."""
+    p = ph(conn)
+    cur.execute(f"""
+        UPDATE scheduler_jobs
+        SET locked_until = {p}, owner = {p}, last_started_at = {p}
+        WHERE name = {p} AND next_run_at <= {p} AND locked_until < {p}
+    """, (now + job.lease_s, _owner, now, job.name, now, now))
+    claimed = cur.rowcount == 1
+    conn.commit()
+    return claimed
+
+def release(conn, cur, job, started, status, error):
+    p = ph(conn)
+    finished = time.time()
+    cur.execute(f"""
+        UPDATE scheduler_jobs
+        SET next_run_at = {p}, locked_until = 0, last_duration_s = {p},
+            last_status = {p}, last_error = {p}
+        WHERE name = {p} AND owner = {p}
+    """, (job.next_after(finished) or float("inf"), finished - started, status, error, job.name, _owner))
+    conn.commit()
+
+def run_job(job):
+    """(status, error): runs fn, recording metrics."""
+    t0 = time.perf_counter()
+    try:
+        result = job.fn()
+        status, error = "ok", None
+        if result is not None:
+            print(f"scheduler: {job.name} -> {result}")
+    except Exception as e:
+        status, error = "error", str(e)
+        metrics.inc(f"scheduler.{job.name}.errors")
+        print(f"scheduler: {job.name} failed: {e}")
+    metrics.inc(f"scheduler.{job.name}.runs")
+    metrics.observe(f"scheduler.{job.name}.runtime_s", time.perf_counter() - t0)
+    metrics.set_gauge(f"scheduler.{job.name}.last_run_at", time.time())
+    return status, error
+
+def tick(conn, cur):
+    now = time.time()
+    cur.execute("SELECT name, next_run_at, locked_until FROM scheduler_jobs")
+    due = [r["name"] for r in rows_to_list(cur.fetchall())
+           if r["next_run_at"] <= now and r["locked_until"] < now]
+    # end the read: on Postgres this long-lived connection would otherwise
+    # sit idle in transaction between ticks when nothing is due
+    conn.commit()
+    for name in due:
+        job = _jobs.get(name)
+        if job is None or not claim(conn, cur, job, now):
+            continue
+        started = time.time()
+        status, error = run_job(job)
+        release(conn, cur, job, started, status, error)
+
+    for name, state in _local.items():
+        if state["next_run_at"] is not None and state["next_run_at"] <= now:
+            job = _jobs[name]
+            started = time.time()
+            state["last_status"], state["last_error"] = run_job(job)
+            state["last_started_at"] = started
+            state["last_duration_s"] = time.time() - started
+            state["next_run_at"] = job.next_after(time.time())
+
+def scheduler_loop():
+    ensure_schema()
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        seed_jobs(conn, cur, time.time())
+        while True:
+            try:
+                tick(conn, cur)
+            except Exception as e:
+                conn.rollback()
+                metrics.inc("scheduler.tick_errors")
+                print(f"scheduler tick failed: {e}")
+            time.sleep(SCHEDULER_TICK_S)
+    finally:
+        conn.close()
+
+def start_scheduler():
+    """Called on every request; starts the thread once per process."""
+    global _thread
+    if not SCHEDULER_ENABLED or _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=scheduler_loop, name="scheduler", daemon=True)
+            _thread.start()
+
+def scheduler_state():
+    """Jobs with their schedule and last run, for GET /api/admin/scheduler."""
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM scheduler_jobs ORDER BY name")
+    rows = {r["name"]: r for r in rows_to_list(cur.fetchall())}
+    conn.close()
+
+    out = []
+    for job in sorted(_jobs.values(), key=lambda j: j.name):
+        state = rows.get(job.name, {}) if job.shared else _local.get(job.name, {})
+        out.append({
+            "name": job.name,
+            "schedule": job.cron_expr or (f"every {job.interval_s:g}s" if job.interval_s else "at start"),
+            "shared": job.shared,
+            "next_run_at": state.get("next_run_at"),
+            "running_until": state.get("locked_until") or None,
+            "owner": state.get("owner"),
+            "last_started_at": state.get("last_started_at"),
+            "last_duration_s": state.get("last_duration_s"),
+            "last_status": state.get("last_status"),
+            "last_error": state.get("last_error"),
+        })
+    return {"enabled": SCHEDULER_ENABLED, "running": _thread is not None, "owner": _owner, "jobs": out}
+
+
+# -------------------------------
+# Built-in jobs
+# -------------------------------
+def purge_reset_tokens():
+    conn = get_db()
+    cur = conn.cursor()
+    # expiry is stored as naive UTC; SQLite keeps it as ISO text, which
+    # sorts like the timestamp
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    cur.execute(f"DELETE FROM reset_tokens WHERE expiry < {ph(conn)}",
+                (now if is_postgres(conn) else now.isoformat(),))
+    purged = cur.rowcount
+    conn.commit()
+    conn.close()
+    metrics.inc("scheduler.reset_tokens_purged", purged)
+    return {"purged": purged}
+
+def sqlite_maintenance(statement):
+    def run(conn, cur):
+        if is_postgres(conn):
+            return None   # autovacuum / autoanalyze
+        cur.execute(statement)
+        return statement
+    return lambda: {name: done for name, done in fan_out(run)}
+
+def hot_users(limit):
+    def recent(conn, cur):
+        cur.execute(f"""
+            SELECT user_id, updated_at FROM user_data_versions
+            ORDER BY updated_at DESC
+            LIMIT {int(limit)}
+        """)
+        return [(r["updated_at"] or 0, int(r["user_id"])) for r in rows_to_list(cur.fetchall())]
+    ranked = sorted((pair for _, pairs in fan_out(recent) for pair in pairs), reverse=True)
+    return [user_id for _, user_id in ranked[:limit]]
+
+def warm_hot_users():
+    """
+    After a deploy: touch the analytics of the most recently active users,
+    so their rows are in the page cache, their column-store snapshot (when
+    enabled) is in this process and their yield sketches are built.
+    """
+    from crop_tracker.harvest import yearly_totals
+    from crop_tracker.columnstore import harvest_snapshot
+    from crop_tracker.sketches import user_sketch
+
+    users = hot_users(WARM_USERS)
+    for user_id in users:
+        conn = get_db("read", user_id)
+        cur = conn.cursor()
+        try:
+            yearly_totals(conn, cur, user_id)
+            harvest_snapshot(conn, cur, user_id)
+            user_sketch(conn, cur, user_id, 0, 9999)
+        finally:
+            conn.close()
+    metrics.set_gauge("scheduler.warmed_users", len(users))
+    return {"warmed": len(users)}
+
+def ensure_pg_partitions():
+    from crop_tracker.partitions import pg_is_partitioned, pg_ensure_partition
+
+    conn = get_db(role="schema")
+    cur = conn.cursor()
+    try:
+        if not is_postgres(conn) or not pg_is_partitioned(cur):
+            return None
+        year = datetime.now(timezone.utc).year
+        for y in (year, year + 1):
+            pg_ensure_partition(conn, cur, y)
+        return {"ensured": [year, year + 1]}
+    finally:
+        conn.close()
+
+
+register(Job("purge_reset_tokens", purge_reset_tokens, interval_s=3600))
+register(Job("sqlite_analyze", sqlite_maintenance("ANALYZE"), cron=SCHEDULER_ANALYZE_CRON))
+register(Job("sqlite_vacuum", sqlite_maintenance("VACUUM"), cron=SCHEDULER_VACUUM_CRON))
+register(Job("ensure_partitions", ensure_pg_partitions, cron="0 2 * * *"))
+register(Job("warm_hot_users", warm_hot_users, at_start=True, shared=False))
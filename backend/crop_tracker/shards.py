@@ -0,0 +1,438 @@
+# shards.py — Per-tenant SQLite shard files for on-prem deployments
+#
+# With a single database.db every farmer's write queues on one file lock.
+# With SHARD_MODE set, the file at SQLITE_PATH becomes the directory
+# (users, reset tokens, report jobs, crop_types, and shard_map:
+# user_id -> shard). Each user's crops, harvests, data versions,
+# predictions, tombstones and prior counts live in one shard file under
+# SHARD_DIR:
+#
+#   SHARD_MODE=hash    SHARD_COUNT files; new users go to user_id % SHARD_COUNT
+#   SHARD_MODE=tenant  one file per user
+#
+# get_db(user_id=...) opens the user's shard with the directory attached as
+# `directory`. Calls without a user_id (auth, report queue) get the
+# directory. Users registered before sharding have no shard_map row. They
+# stay in the directory file until `rebalance` moves them.
+#
+# Shard files carry the full schema, plus a stub users row per user (no
+# password) for the foreign keys. They also keep copies of the crop_types
+# rows their crops use; ids are allocated in the directory, so they are the
+# same in every file. Crops and harvests created on a shard take ids from
+# the user's own range (user_id << 32 | data version). A moved user's ids
+# therefore never collide with rows already on the target.
+#
+# Only admin aggregates and the priors refresher fan out over all files
+# (fan_out). SQLite only: ignored when DATABASE_URL is set.
+#
+#   python -m crop_tracker.shards status
+#   python -m crop_tracker.shards rebalance [--dry-run]   # after changing SHARD_MODE / SHARD_COUNT
+#   python -m crop_tracker.shards move --user 12 --to shard_03
+#
+# A move locks the source file for the copy. A write that was routed before
+# the move and commits after it fails: the stub user is gone from the old
+# shard. Writes by users still in the directory are not fenced that way,
+# so run the first rebalance in a maintenance window.
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+from crop_tracker.querylog import TimedSqliteConnection
+from crop_tracker import metrics
+
+SHARD_MODE = os.environ.get("SHARD_MODE", "")   # "", "hash" or "tenant"
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "4"))
+SHARD_DIR = os.environ.get(
+    "SHARD_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shards"),
+)
+
+DIRECTORY = "main"   # shard name of the directory file itself
+SHARD_FILE = re.compile(r"(shard_\d+|user_\d+)\.db")
+ID_SHIFT = 32
+
+# A user's rows, in foreign-key order (parents first)
+USER_ROWS = [
+    ("crop_types", "id IN (SELECT crop_type_id FROM crops WHERE user_id = ?)"),
+    ("crops", "user_id = ?"),
+    ("harvests", "crop_id IN (SELECT id FROM crops WHERE user_id = ?)"),
+    ("harvest_rollups", "crop_id IN (SELECT id FROM crops WHERE user_id = ?)"),
+    ("predictions", "user_id = ?"),
+    ("user_data_versions", "user_id = ?"),
+    ("sync_tombstones", "user_id = ?"),
+    ("yield_sketches", "user_id = ?"),
+]
+
+_map = {}         # user_id -> shard name (re-checked against shard_map on connect)
+_migrated = set() # shard names whose schema is current in this process
+_lock = threading.Lock()
+
+
+class ShardConnection(TimedSqliteConnection):
+    shard = None   # set once the file is migrated and the directory attached
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def sharding_enabled():
+    return SHARD_MODE in ("hash", "tenant") and not os.environ.get("DATABASE_URL")
+
+def is_shard(conn):
+    return getattr(conn, "shard", None) is not None
+
+def directory_path():
+    from crop_tracker.model import SQLITE_PATH
+    return SQLITE_PATH
+
+def shard_path(name):
+    return directory_path() if name == DIRECTORY else os.path.join(SHARD_DIR, f"{name}.db")
+
+def shard_names():
+    """Shard files on disk (the directory not included)."""
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted(m.group(1) for m in (SHARD_FILE.fullmatch(n) for n in os.listdir(SHARD_DIR)) if m)
+
+def placement(user_id):
+    """Where a user belongs under the current SHARD_MODE / SHARD_COUNT."""
+    if SHARD_MODE == "tenant":
+        return f"user_{int(user_id)}"
+    return f"shard_{int(user_id) % SHARD_COUNT:02d}"
+
+def directory_table(conn, table):
+    """A directory-owned table as named from conn (attached on shard connections)."""
+    return f"directory.{table}" if is_shard(conn) else table
+
+def shard_row_id(conn, user_id, version):
+    """Explicit id for a crop/harvest written to a shard; None (AUTOINCREMENT) elsewhere."""
+    if not is_shard(conn):
+        return None
+    return (int(user_id) << ID_SHIFT) | int(version)
+
+
+# -------------------------------
+# Routing
+# -------------------------------
+def open_shard(name, attach_directory=True):
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    conn = sqlite3.connect(shard_path(name), factory=ShardConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    if name not in _migrated:
+        from crop_tracker.model import migrate_connection
+        migrate_connection(conn)
+        with _lock:
+            _migrated.add(name)
+    if attach_directory:
+        conn.execute("ATTACH DATABASE ? AS directory", (directory_path(),))
+    conn.shard = name
+    return conn
+
+def lookup_shard(user_id):
+    conn = sqlite3.connect(directory_path())
+    try:
+        row = conn.execute("SELECT shard FROM shard_map WHERE user_id = ?", (int(user_id),)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else DIRECTORY
+
+def shard_connection(user_id):
+    """The user's shard file, or None when their data is in the directory."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    with _lock:
+        name = _map.get(user_id)
+    if name is None:
+        name = lookup_shard(user_id)
+        if name == DIRECTORY:
+            # not cached: rebalance may place this user at any time
+            return None
+        with _lock:
+            _map[user_id] = name
+
+    conn = open_shard(name)
+    # a rebalance in another process may have moved the user since we cached
+    row = conn.execute("SELECT shard FROM directory.shard_map WHERE user_id = ?", (user_id,)).fetchone()
+    current = row[0] if row else DIRECTORY
+    if current != name:
+        conn.close()
+        metrics.inc("shards.remapped")
+        with _lock:
+            _map.pop(user_id, None)
+        return shard_connection(user_id)
+    metrics.inc("shards.connections")
+    return conn
+
+def place_user(user_id):
+    """After registration commits: create the user's stub on their shard and map it."""
+    if not sharding_enabled():
+        return None
+    name = placement(user_id)
+    conn = open_shard(name)
+    try:
+        # one transaction over both files: never mapped without a stub
+        conn.execute("""
+            INSERT OR IGNORE INTO main.users (id, email, username, password)
+            SELECT id, email, username, '' FROM directory.users WHERE id = ?
+        """, (int(user_id),))
+        conn.execute("""
+            INSERT INTO directory.shard_map (user_id, shard, placed_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard, placed_at = excluded.placed_at
+        """, (int(user_id), name, time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+    with _lock:
+        _map[int(user_id)] = name
+    return name
+
+
+# -------------------------------
+# Fan-out (admin aggregates, priors refresh)
+# -------------------------------
+def fan_out(fn):
+    """[(shard name, fn(conn, cur))] over the directory and, when sharded, every shard file."""
+    from crop_tracker.model import get_db
+    out = []
+    conn = get_db()
+    try:
+        out.append((DIRECTORY, fn(conn, conn.cursor())))
+    finally:
+        conn.close()
+    if not sharding_enabled():
+        return out
+
+    metrics.inc("shards.fan_out")
+    for name in shard_names():
+        conn = open_shard(name, attach_directory=False)
+        try:
+            out.append((name, fn(conn, conn.cursor())))
+        finally:
+            conn.close()
+    return out
+
+def database_stats(conn, cur):
+    cur.execute("SELECT COUNT(*) AS n FROM crops")
+    crops = int(row_to_dict(cur.fetchone())["n"] or 0)
+    cur.execute("""
+        SELECT c.crop_type_id, COUNT(*) AS events, COALESCE(SUM(h.yield_amount), 0) AS total_yield
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        GROUP BY c.crop_type_id
+    """)
+    by_type = {}
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        by_type[r["crop_type_id"]] = (int(r["events"]), float(r["total_yield"]))
+    return {"crops": crops, "by_type": by_type}
+
+def shard_report():
+    """Per-file row counts and cluster-wide totals per crop type (one query per file)."""
+    from crop_tracker.model import get_db, is_postgres
+    from crop_tracker.croptypes import crop_type_names
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) AS n FROM users")
+    users_total = int(row_to_dict(cur.fetchone())["n"] or 0)
+    placed = {}
+    if sharding_enabled():
+        cur.execute("SELECT shard, COUNT(*) AS n FROM shard_map GROUP BY shard")
+        placed = {r["shard"]: int(r["n"]) for r in (row_to_dict(x) for x in cur.fetchall())}
+    pg = is_postgres(conn)
+
+    shards, totals = [], {}
+    for name, stats in fan_out(database_stats):
+        events = sum(e for e, _ in stats["by_type"].values())
+        total_yield = sum(t for _, t in stats["by_type"].values())
+        users = users_total - sum(placed.values()) if name == DIRECTORY else placed.get(name, 0)
+        shards.append({
+            "shard": name,
+            "users": users,
+            "crops": stats["crops"],
+            "harvests": events,
+            "total_yield": round(total_yield, 2),
+            "bytes": None if pg else os.path.getsize(shard_path(name)),
+        })
+        for type_id, (e, t) in stats["by_type"].items():
+            prev = totals.get(type_id, (0, 0.0))
+            totals[type_id] = (prev[0] + e, prev[1] + t)
+
+    names = crop_type_names(cur, pg, totals.keys())
+    conn.close()
+    crop_types = sorted(
+        ({"crop": names.get(t, "Unknown"), "harvests": e, "total_yield": round(y, 2)} for t, (e, y) in totals.items()),
+        key=lambda r: -r["total_yield"],
+    )
+    return {
+        "mode": SHARD_MODE if sharding_enabled() else None,
+        "shards": shards,
+        "totals": {
+            "users": users_total,
+            "crops": sum(s["crops"] for s in shards),
+            "harvests": sum(s["harvests"] for s in shards),
+            "total_yield": round(sum(y for _, y in totals.values()), 2),
+        },
+        "crop_types": crop_types,
+    }
+
+
+# -------------------------------
+# Rebalancing
+# -------------------------------
+def user_prior_deltas(cur, user_id):
+    from crop_tracker.priors import harvest_deltas
+    cur.execute("SELECT id, name, area, planting_date FROM crops WHERE user_id = ?", (user_id,))
+    crops = [row_to_dict(r) for r in cur.fetchall()]
+    deltas = {}
+    for crop in crops:
+        cur.execute("SELECT yield_amount FROM harvests WHERE crop_id = ?", (crop["id"],))
+        yields = [float(r[0]) for r in cur.fetchall()]
+        for key, d in harvest_deltas(crop, yields, +1).items():
+            deltas[key] = deltas.get(key, 0) + d
+    return deltas
+
+def move_user(user_id, target):
+    """Copy a user's rows to `target`, flip shard_map, delete them at the source."""
+    from crop_tracker.model import get_db
+    from crop_tracker.partitions import partition_files
+    from crop_tracker.priors import apply_prior_deltas
+
+    user_id = int(user_id)
+    source = lookup_shard(user_id)
+    if source == target:
+        return None
+    if not SHARD_FILE.fullmatch(f"{target}.db"):
+        raise ValueError(f"{target!r} is not a shard name (shard_NN or user_N)")
+    if source == DIRECTORY and partition_files():
+        raise ValueError("the directory has year partition files: move users before partitioning")
+
+    src = get_db(role="schema") if source == DIRECTORY else open_shard(source)
+    dst = open_shard(target, attach_directory=False)
+    s, d = src.cursor(), dst.cursor()
+    try:
+        # the user's writers on the source wait until the move commits
+        s.execute("BEGIN IMMEDIATE")
+        s.execute(f"SELECT id, email, username FROM {directory_table(src, 'users')} WHERE id = ?", (user_id,))
+        user = s.fetchone()
+        if user is None:
+            raise ValueError(f"no user {user_id}")
+
+        # idempotent: a move interrupted after the target commit is re-run from scratch
+        # (its prior counts too, before the rows they were counted from go)
+        leftover = user_prior_deltas(d, user_id)
+        apply_prior_deltas(dst, d, {key: -n for key, n in leftover.items()})
+        for table in ("sync_tombstones", "user_data_versions", "crops"):
+            d.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        d.execute("INSERT OR IGNORE INTO users (id, email, username, password) VALUES (?, ?, ?, '')", tuple(user))
+
+        copied = {}
+        for table, where in USER_ROWS:
+            s.execute(f"SELECT * FROM {table} WHERE {where}", (user_id,))
+            rows = s.fetchall()
+            copied[table] = len(rows)
+            if not rows:
+                continue
+            cols = rows[0].keys()
+            verb = "INSERT OR IGNORE" if table == "crop_types" else "INSERT"
+            d.executemany(
+                f"{verb} INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                [tuple(r) for r in rows],
+            )
+
+        deltas = user_prior_deltas(s, user_id)
+        apply_prior_deltas(dst, d, deltas)
+        dst.commit()
+
+        s.execute(f"""
+            INSERT INTO {directory_table(src, 'shard_map')} (user_id, shard, placed_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard, placed_at = excluded.placed_at
+        """, (user_id, target, time.time()))
+        apply_prior_deltas(src, s, {key: -n for key, n in deltas.items()})
+        s.execute("DELETE FROM sync_tombstones WHERE user_id = ?", (user_id,))
+        s.execute("DELETE FROM yield_sketches WHERE user_id = ?", (user_id,))
+        s.execute("DELETE FROM user_data_versions WHERE user_id = ?", (user_id,))
+        # harvests, rollups and predictions cascade
+        s.execute("DELETE FROM crops WHERE user_id = ?", (user_id,))
+        if source != DIRECTORY:
+            # the stub: a write still routed here now fails instead of landing here
+            s.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        src.commit()
+    except Exception:
+        src.rollback()
+        dst.rollback()
+        raise
+    finally:
+        src.close()
+        dst.close()
+
+    with _lock:
+        _map[user_id] = target
+    metrics.inc("shards.moves")
+    return {"user_id": user_id, "from": source, "to": target, "rows": copied}
+
+def rebalance_plan():
+    """[(user_id, current shard, target shard)] for users not where placement() puts them."""
+    conn = sqlite3.connect(directory_path())
+    try:
+        rows = conn.execute("""
+            SELECT u.id, COALESCE(m.shard, ?) AS shard
+            FROM users u
+            LEFT JOIN shard_map m ON m.user_id = u.id
+            ORDER BY u.id
+        """, (DIRECTORY,)).fetchall()
+    finally:
+        conn.close()
+    return [(uid, shard, placement(uid)) for uid, shard in rows if shard != placement(uid)]
+
+
+if __name__ == "__main__":
+    from crop_tracker.model import init_db
+
+    parser = argparse.ArgumentParser(description="Per-tenant SQLite shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="rows per shard file and totals (fan-out)")
+    reb = sub.add_parser("rebalance", help="move every user to placement() under the current settings")
+    reb.add_argument("--dry-run", action="store_true")
+    mv = sub.add_parser("move", help="move one user (e.g. a busy cooperative) to a given shard")
+    mv.add_argument("--user", type=int, required=True)
+    mv.add_argument("--to", required=True, help="shard_NN or user_N")
+    args = parser.parse_args()
+
+    if not sharding_enabled():
+        raise SystemExit("set SHARD_MODE=hash or SHARD_MODE=tenant (SQLite only)")
+    init_db()
+
+    if args.command == "status":
+        print(json.dumps(shard_report(), indent=2))
+    elif args.command == "move":
+        print(json.dumps(move_user(args.user, args.to)))
+    else:
+        plan = rebalance_plan()
+        print(f"{len(plan)} users to move")
+        for user_id, source, target in plan:
+            if args.dry_run:
+                print(f"user {user_id}: {source} -> {target}")
+                continue
+            t0 = time.perf_counter()
+            moved = move_user(user_id, target)
+            rows = sum(moved["rows"].values()) if moved else 0
+            print(f"user {user_id}: {source} -> {target} ({rows} rows, {time.perf_counter() - t0:.2f}s)")
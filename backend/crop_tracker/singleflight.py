@@ -0,0 +1,124 @@
+# singleflight.py — Coalesce identical concurrent GET requests
+#
+# While one request for (route, normalized args) is running, identical
+# requests wait for it and reuse its response instead of running the same
+# queries again. Nothing is cached: once the leader finishes, the next
+# request runs fresh.
+#
+# Waiting uses threading.Lock/Event, which gevent's monkey patching (as
+# under `gunicorn -k gevent`) turns into cooperative primitives, so waiters
+# park their greenlet rather than the whole worker.
+import os
+import threading
+from functools import wraps
+from flask import request, current_app
+
+from crop_tracker import metrics
+
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT_ENABLED", "1") == "1"
+# a waiter gives up on a stuck leader after this long and runs the request itself
+SINGLEFLIGHT_WAIT_S = float(os.environ.get("SINGLEFLIGHT_WAIT_S", "30"))
+
+_calls = {}     # key -> InFlight
+_stats = {}     # route -> {"executed": n, "shared": n}
+_lock = threading.Lock()
+
+
+class InFlight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# -------------------------------
+# Core
+# -------------------------------
+def record(route, shared):
+    with _lock:
+        s = _stats.setdefault(route, {"executed": 0, "shared": 0})
+        s["shared" if shared else "executed"] += 1
+        total = s["executed"] + s["shared"]
+        ratio = s["shared"] / total
+        inflight = len(_calls)
+    metrics.inc(f"singleflight.{route}.{'shared' if shared else 'executed'}")
+    metrics.set_gauge(f"singleflight.{route}.coalescing_ratio", round(ratio, 4))
+    metrics.set_gauge("singleflight.inflight", inflight)
+
+def do(key, fn):
+    """
+    Run fn() once per key at a time. Returns (result, shared); concurrent
+    callers with the same key get the leader's result (or its exception).
+    """
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = InFlight()
+            _calls[key] = call
+
+    if not leader:
+        if not call.done.wait(SINGLEFLIGHT_WAIT_S):
+            metrics.inc("singleflight.wait_timeouts")
+            return fn(), False
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    try:
+        call.result = fn()
+        return call.result, False
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+# -------------------------------
+# Flask views
+# -------------------------------
+def normalize_arg(value):
+    value = str(value).strip()
+    try:
+        return str(int(value))
+    except ValueError:
+        return value.lower()
+
+def request_key(route, view_args, arg_names):
+    parts = [(name, normalize_arg(v)) for name, v in sorted(view_args.items())]
+    for name in arg_names:
+        v = request.args.get(name)
+        if v is not None:
+            parts.append((name, normalize_arg(v)))
+    return (route, tuple(parts))
+
+def freeze_response(rv):
+    # Response objects are per request: share the bytes, status and headers
+    resp = current_app.make_response(rv)
+    headers = [(k, v) for k, v in resp.headers.items() if k.lower() != "content-length"]
+    return resp.get_data(), resp.status_code, headers
+
+def coalesced(route, args=()):
+    """
+    Decorator for GET views whose response depends only on the URL's view
+    args plus the query args named in `args`.
+    """
+    def wrap(view):
+        @wraps(view)
+        def inner(**view_args):
+            if not SINGLEFLIGHT_ENABLED:
+                return view(**view_args)
+            key = request_key(route, view_args, args)
+            (body, status, headers), shared = do(key, lambda: freeze_response(view(**view_args)))
+            record(route, shared)
+            resp = current_app.response_class(body, status=status, headers=headers)
+            if shared:
+                resp.headers["X-Coalesced"] = "1"
+            return resp
+        return inner
+    return wrap
@@ -0,0 +1,423 @@
+# sketches.py — Mergeable yield quantile sketches per (user, crop type, year)
+#
+# Each row of yield_sketches holds a KLL sketch (Karnin, Lang & Liberty) of
+# the kg per harvest for one user, crop type and harvest year. add_harvest
+# updates it inside its own transaction; year-range / per-crop distribution,
+# histogram and percentile reads merge the few sketches in range instead of
+# scanning harvests. A sketch keeps every value until it outgrows its
+# capacity (~3 * SKETCH_K values), so most farmers' answers are exact; past
+# that, compactions add a rank error that is tracked as a variance and
+# reported as a 99% bound.
+#
+# Sketches can't subtract: a crop update/delete rebuilds the user's sketches
+# for the crop types involved. A user's sketches are built from their rows
+# on the first read (rows written before this existed, moved users); while a
+# user has no sketch rows add_harvest leaves them to that build. Archived
+# years (partitions.py) rebuild from rollups, each event at its rollup's
+# mean yield.
+import os
+import math
+import random
+import struct
+from array import array
+from bisect import bisect_left
+
+from crop_tracker import metrics
+from crop_tracker.model import get_db
+from crop_tracker.dataversion import get_data_version, lock_data_version
+
+SKETCH_K = int(os.environ.get("SKETCH_K", "200"))
+
+CONFIDENCE = 0.99
+CONFIDENCE_Z = 2.576    # two-sided normal quantile for CONFIDENCE
+
+# the buckets /api/harvests/distribution has always returned (see bucket_expr in partitions.py)
+DEFAULT_EDGES = [10.0, 50.0, 100.0, 200.0]
+DEFAULT_LABELS = ["0-9", "10-49", "50-99", "100-199", "200+"]
+
+# format version, k, levels, n, rank variance, min, max
+HEADER = struct.Struct("<BHBQddd")
+FORMAT = 1
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def year_of(day):
+    return int(str(day)[:4])
+
+
+# -------------------------------
+# KLL sketch
+# -------------------------------
+class KllSketch:
+    """
+    levels[h] holds values of weight 2**h. Compacting a full level sorts it
+    and promotes every other value (random offset) one level up; a rank
+    query moves by at most 2**h, so each compaction adds at most 4**h to the
+    rank variance. Merging concatenates levels and adds variances.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self.var = 0.0
+        self.min = None
+        self.max = None
+
+    def capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+    def max_size(self):
+        return sum(self.capacity(h) for h in range(len(self.levels)))
+
+    def update(self, value):
+        self.update_many([value])
+
+    def update_many(self, values):
+        values = [float(v) for v in values]
+        if not values:
+            return
+        lo, hi = min(values), max(values)
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+        self.n += len(values)
+        i = 0
+        while i < len(values):
+            room = max(1, self.max_size() - self.size())
+            self.levels[0].extend(values[i:i + room])
+            i += room
+            self.compress()
+
+    def compress(self):
+        while self.size() > self.max_size():
+            for h, items in enumerate(self.levels):
+                if len(items) < self.capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # an odd one out stays at this level
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[h + 1].extend(items[random.getrandbits(1)::2])
+                self.levels[h] = keep
+                self.var += 4.0 ** h
+                break
+
+    def merge(self, other, compact=True):
+        """Add other's values; compact=False keeps everything (query-time unions)."""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self.var += other.var
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if compact:
+            self.compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches):
+        out = cls()
+        for s in sketches:
+            out.merge(s, compact=False)
+        return out
+
+    # ---------- queries ----------
+    def exact(self):
+        return self.var == 0.0
+
+    def rank_error(self):
+        """Absolute rank error bound at CONFIDENCE (0 while no value was compacted)."""
+        return CONFIDENCE_Z * math.sqrt(self.var)
+
+    def weighted(self):
+        """(sorted values, cumulative weights)"""
+        pairs = sorted((x, 1 << h) for h, items in enumerate(self.levels) for x in items)
+        values, cum, total = [], [], 0
+        for x, w in pairs:
+            total += w
+            values.append(x)
+            cum.append(total)
+        return values, cum
+
+    def rank_below(self, x, weighted=None):
+        """Estimated number of values < x."""
+        values, cum = weighted or self.weighted()
+        i = bisect_left(values, x)
+        return cum[i - 1] if i else 0
+
+    def quantile(self, q, weighted=None):
+        """Smallest value whose cumulative weight reaches q * n (nearest rank)."""
+        values, cum = weighted or self.weighted()
+        if not values:
+            return None
+        target = max(1.0, min(1.0, q) * self.n)
+        return values[min(bisect_left(cum, target), len(values) - 1)]
+
+    # ---------- storage ----------
+    def to_bytes(self):
+        nan = float("nan")
+        head = HEADER.pack(FORMAT, self.k, len(self.levels), self.n, self.var,
+                           nan if self.min is None else self.min,
+                           nan if self.max is None else self.max)
+        sizes = array("I", [len(items) for items in self.levels])
+        values = array("d", [x for items in self.levels for x in items])
+        return head + sizes.tobytes() + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)   # Postgres returns a memoryview
+        fmt, k, n_levels, n, var, lo, hi = HEADER.unpack_from(data)
+        if fmt != FORMAT:
+            raise ValueError(f"unknown sketch format {fmt}")
+        s = cls(k)
+        s.n, s.var = n, var
+        s.min = None if math.isnan(lo) else lo
+        s.max = None if math.isnan(hi) else hi
+        offset = HEADER.size
+        sizes = array("I")
+        sizes.frombytes(data[offset:offset + 4 * n_levels])
+        offset += 4 * n_levels
+        values = array("d")
+        values.frombytes(data[offset:])
+        s.levels, i = [], 0
+        for size in sizes:
+            s.levels.append(values[i:i + size].tolist())
+            i += size
+        return s
+
+
+# -------------------------------
+# Histograms / percentiles over a (merged) sketch
+# -------------------------------
+def nice_step(raw):
+    if raw <= 0:
+        return 1.0
+    # the round step nearest to raw on a log scale
+    scale = 10.0 ** math.floor(math.log10(raw))
+    return min((m * scale for m in (1.0, 2.0, 2.5, 5.0, 10.0)), key=lambda step: abs(math.log(step / raw)))
+
+def auto_edges(sketch, bins):
+    """
+    Inner edges of about `bins` equal-width buckets on round numbers,
+    spanning this selection's own min..max; (lower bound, edges).
+    """
+    if sketch.n == 0 or sketch.max == sketch.min:
+        return 0.0, []
+    step = nice_step((sketch.max - sketch.min) / bins)
+    start = math.floor(sketch.min / step) * step
+    edges = []
+    edge = start + step
+    while edge <= sketch.max:
+        edges.append(round(edge, 10))
+        edge += step
+    return start, edges
+
+def histogram(sketch, edges, lower=0.0, labels=None):
+    """
+    Buckets [lower, e0), [e0, e1), ..., [e_last, inf) with estimated counts
+    and an error bound each (one per inner edge they depend on).
+    """
+    weighted = sketch.weighted()
+    err = sketch.rank_error()
+    bounds = [lower] + list(edges) + [None]
+    below = [0] + [sketch.rank_below(e, weighted) for e in edges] + [sketch.n]
+    out = []
+    for i in range(len(bounds) - 1):
+        lo, hi = bounds[i], bounds[i + 1]
+        inner = (i > 0) + (hi is not None)
+        out.append({
+            "label": labels[i] if labels else (f"{lo:g}-{hi:g}" if hi is not None else f"{lo:g}+"),
+            "lower": lo,
+            "upper": hi,
+            "count": int(below[i + 1] - below[i]),
+            "error": int(math.ceil(inner * err)),
+        })
+    return out
+
+def percentiles(sketch, qs):
+    """
+    Value at each percentile, with the values at the percentile -/+ the
+    rank error bound: the true percentile lies between them at CONFIDENCE.
+    """
+    weighted = sketch.weighted()
+    eps = sketch.rank_error() / sketch.n if sketch.n else 0.0
+    out = []
+    for q in qs:
+        f = q / 100.0
+        out.append({
+            "p": q,
+            "value": sketch.quantile(f, weighted),
+            "low": sketch.quantile(max(0.0, f - eps), weighted),
+            "high": sketch.quantile(min(1.0, f + eps), weighted),
+        })
+    return out
+
+def error_summary(sketch):
+    return {
+        "n": sketch.n,
+        "exact": sketch.exact(),
+        "rank_error": round(sketch.rank_error() / sketch.n, 6) if sketch.n else 0.0,
+        "confidence": CONFIDENCE,
+    }
+
+
+# -------------------------------
+# Storage
+# -------------------------------
+def has_sketches(conn, cur, user_id):
+    cur.execute(f"SELECT 1 FROM yield_sketches WHERE user_id = {ph(conn)} LIMIT 1", (int(user_id),))
+    return cur.fetchone() is not None
+
+def store_sketch(conn, cur, user_id, crop_type_id, year, sketch):
+    p = ph(conn)
+    cur.execute(f"""
+        INSERT INTO yield_sketches (user_id, crop_type_id, year, n, sketch)
+        VALUES ({p}, {p}, {p}, {p}, {p})
+        ON CONFLICT (user_id, crop_type_id, year) DO UPDATE
+        SET n = excluded.n, sketch = excluded.sketch
+    """, (int(user_id), int(crop_type_id), int(year), sketch.n, sketch.to_bytes()))
+
+def record_yield(conn, cur, user_id, crop_type_id, day, yield_kg):
+    """add_harvest: add one harvest, inside its transaction (after bump_data_version)."""
+    p = ph(conn)
+    key = (int(user_id), crop_type_id or 0, year_of(day))
+    cur.execute(f"""
+        SELECT sketch FROM yield_sketches
+        WHERE user_id = {p} AND crop_type_id = {p} AND year = {p}
+    """, key)
+    row = row_to_dict(cur.fetchone())
+    if row is None:
+        if not has_sketches(conn, cur, user_id):
+            return   # not built yet: the first read builds from rows, this one included
+        sketch = KllSketch()
+    else:
+        sketch = KllSketch.from_bytes(row["sketch"])
+    sketch.update(yield_kg)
+    store_sketch(conn, cur, *key, sketch)
+    metrics.inc("sketches.updates")
+
+def build_sketches(conn, cur, user_id, crop_type_ids=None):
+    """{(crop_type_id, year): sketch} from the user's harvests and archived rollups."""
+    p = ph(conn)
+    type_filter, params = "", [int(user_id)]
+    if crop_type_ids is not None:
+        type_filter = f" AND COALESCE(c.crop_type_id, 0) IN ({', '.join([p] * len(crop_type_ids))})"
+        params += [int(t) for t in crop_type_ids]
+
+    values = {}
+    cur.execute(f"""
+        SELECT COALESCE(c.crop_type_id, 0) AS crop_type_id, h.date, h.yield_amount
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p}{type_filter}
+    """, tuple(params))
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        values.setdefault((int(r["crop_type_id"]), year_of(r["date"])), []).append(r["yield_amount"])
+
+    cur.execute(f"""
+        SELECT COALESCE(c.crop_type_id, 0) AS crop_type_id, r.year, r.events, r.total_yield
+        FROM harvest_rollups r
+        JOIN crops c ON r.crop_id = c.id
+        WHERE c.user_id = {p}{type_filter}
+    """, tuple(params))
+    for r in cur.fetchall():
+        r = row_to_dict(r)
+        events = int(r["events"])
+        mean = float(r["total_yield"]) / events
+        values.setdefault((int(r["crop_type_id"]), int(r["year"])), []).extend([mean] * events)
+
+    sketches = {}
+    for key, ys in values.items():
+        sketches[key] = KllSketch()
+        sketches[key].update_many(ys)
+    return sketches
+
+def rebuild_crop_types(conn, cur, user_id, crop_type_ids):
+    """
+    Crop update/delete, inside its transaction after the crops write: the
+    user's sketches for these crop types are rebuilt from what is left.
+    """
+    if not has_sketches(conn, cur, user_id):
+        return
+    p = ph(conn)
+    ids = sorted({int(t or 0) for t in crop_type_ids})
+    cur.execute(
+        f"DELETE FROM yield_sketches WHERE user_id = {p} AND crop_type_id IN ({', '.join([p] * len(ids))})",
+        (int(user_id), *ids),
+    )
+    for (crop_type_id, year), sketch in build_sketches(conn, cur, user_id, ids).items():
+        store_sketch(conn, cur, user_id, crop_type_id, year, sketch)
+    metrics.inc("sketches.rebuilds")
+
+def save_built(user_id, version, sketches):
+    """Store a first build on the primary unless a write landed since `version` was read."""
+    conn = get_db(user_id=user_id)
+    cur = conn.cursor()
+    try:
+        if lock_data_version(conn, cur, user_id) != version or has_sketches(conn, cur, user_id):
+            conn.rollback()
+            metrics.inc("sketches.build_races")
+            return
+        for (crop_type_id, year), sketch in sketches.items():
+            store_sketch(conn, cur, user_id, crop_type_id, year, sketch)
+        conn.commit()
+    finally:
+        conn.close()
+
+def user_sketch(conn, cur, user_id, year_from, year_to, crop_type_ids=None):
+    """The user's yields in [year_from, year_to] (optionally some crop types) as one merged sketch."""
+    p = ph(conn)
+    type_filter, params = "", [int(user_id), int(year_from), int(year_to)]
+    if crop_type_ids is not None:
+        type_filter = f" AND crop_type_id IN ({', '.join([p] * len(crop_type_ids))})"
+        params += [int(t) for t in crop_type_ids]
+    cur.execute(f"""
+        SELECT sketch FROM yield_sketches
+        WHERE user_id = {p} AND year >= {p} AND year <= {p}{type_filter}
+    """, tuple(params))
+    parts = [KllSketch.from_bytes(row_to_dict(r)["sketch"]) for r in cur.fetchall()]
+
+    if not parts and not has_sketches(conn, cur, user_id):
+        metrics.inc("sketches.builds")
+        version = get_data_version(conn, cur, user_id)
+        built = build_sketches(conn, cur, user_id)
+        if built:
+            save_built(user_id, version, built)
+        wanted = None if crop_type_ids is None else {int(t) for t in crop_type_ids}
+        parts = [s for (t, year), s in built.items()
+                 if year_from <= year <= year_to and (wanted is None or t in wanted)]
+
+    metrics.observe("sketches.merged", len(parts))
+    return KllSketch.merged(parts)
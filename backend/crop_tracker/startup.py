@@ -0,0 +1,38 @@
+# startup.py — Cold-start timing: import -> app ready -> first response
+import time
+import threading
+
+_t0 = None
+_marks = {}
+_lock = threading.Lock()
+
+
+def start(t0):
+    global _t0
+    _t0 = t0
+
+def mark(phase):
+    # first mark wins: phases are recorded once per process
+    if _t0 is None:
+        return
+    with _lock:
+        _marks.setdefault(phase, round((time.perf_counter() - _t0) * 1000.0, 3))
+
+def report():
+    with _lock:
+        marks = dict(_marks)
+    return {
+        "phases_ms": marks,
+        "import_to_first_response_ms": marks.get("first_response"),
+    }
+
+def init_startup_report(app):
+    done = []
+
+    @app.after_request
+    def first_response(response):
+        if not done:
+            done.append(True)
+            mark("first_response")
+            print(f"Startup: {report()['phases_ms']}")
+        return response
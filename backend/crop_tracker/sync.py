@@ -0,0 +1,123 @@
+# sync.py — Delta sync for offline clients
+#
+# Crop and harvest rows carry the user's data version from the write that
+# last touched them (see dataversion.py); deletes leave tombstones stamped
+# the same way. The cursor is simply that version: GET /api/sync?since=N
+# returns what changed after N plus the new cursor.
+import time
+from flask import Blueprint, request, jsonify
+
+from crop_tracker.model import get_db
+from crop_tracker.dataversion import get_data_version
+
+sync_routes = Blueprint("sync_routes", __name__, url_prefix="/api")
+
+
+# -------------------------------
+# Helpers (SQLite + Postgres compatible)
+# -------------------------------
+def is_postgres(conn) -> bool:
+    try:
+        import sqlite3
+        return not isinstance(conn, sqlite3.Connection)
+    except Exception:
+        return True
+
+def ph(conn) -> str:
+    return "%s" if is_postgres(conn) else "?"
+
+def row_to_dict(row):
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return row
+
+def rows_to_list(rows):
+    return [row_to_dict(r) for r in rows]
+
+
+# -------------------------------
+# Tombstones (call inside the delete's transaction, before the DELETE)
+# -------------------------------
+def record_crop_tombstones(conn, cur, user_id, crop_id, version):
+    p = ph(conn)
+    now = time.time()
+    cur.execute(f"""
+        INSERT INTO sync_tombstones (user_id, entity, entity_id, version, deleted_at)
+        VALUES ({p}, 'crop', {p}, {p}, {p})
+    """, (user_id, crop_id, version, now))
+    cur.execute(f"""
+        INSERT INTO sync_tombstones (user_id, entity, entity_id, version, deleted_at)
+        SELECT {p}, 'harvest', id, {p}, {p}
+        FROM harvests
+        WHERE crop_id = {p}
+    """, (user_id, version, now, crop_id))
+
+
+# =====================================================
+# GET /api/sync?user_id=1&since=42
+# =====================================================
+@sync_routes.route("/sync", methods=["GET"])
+def sync_changes():
+    user_id = request.args.get("user_id", type=int)
+    since = request.args.get("since", default=0, type=int)
+
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+    if since is None or since < 0:
+        return jsonify({"error": "since must be a non-negative cursor"}), 400
+
+    conn = get_db(user_id=user_id)
+    cur = conn.cursor()
+    p = ph(conn)
+
+    # Read the cursor first: a user's writes commit in version order, so
+    # every row stamped <= cursor is already visible.
+    cursor = get_data_version(conn, cur, user_id)
+
+    # since=0 or a cursor from the future (e.g. a restored server): full resync
+    full = since == 0 or since > cursor
+    lower = -1 if full else since
+
+    cur.execute(f"""
+        SELECT *
+        FROM crops
+        WHERE user_id = {p} AND version > {p} AND version <= {p}
+        ORDER BY id
+    """, (user_id, lower, cursor))
+    crops = rows_to_list(cur.fetchall())
+
+    cur.execute(f"""
+        SELECT h.id, h.crop_id, h.date, h.yield_amount, h.version, h.updated_at
+        FROM harvests h
+        JOIN crops c ON h.crop_id = c.id
+        WHERE c.user_id = {p} AND h.version > {p} AND h.version <= {p}
+        ORDER BY h.id
+    """, (user_id, lower, cursor))
+    harvests = rows_to_list(cur.fetchall())
+
+    deleted = {"crops": [], "harvests": []}
+    if not full:
+        cur.execute(f"""
+            SELECT entity, entity_id
+            FROM sync_tombstones
+            WHERE user_id = {p} AND version > {p} AND version <= {p}
+            ORDER BY id
+        """, (user_id, since, cursor))
+        for r in rows_to_list(cur.fetchall()):
+            deleted[r["entity"] + "s"].append(r["entity_id"])
+
+    conn.close()
+
+    return jsonify({
+        "since": since,
+        "cursor": cursor,
+        "full": full,
+        "crops": crops,
+        "harvests": harvests,
+        "deleted": deleted,
+    }), 200
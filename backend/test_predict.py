@@ -7,6 +7,7 @@ sys.path.insert(0, HERE)
 
 from app import app
 from crop_tracker.model import get_db, init_db
+from crop_tracker.croptypes import resolve_crop_type
 
 def is_postgres(conn) -> bool:
     try:
@@ -35,6 +36,7 @@ init_db()
 conn = get_db()
 cur = conn.cursor()
 p = ph(conn)
+maize_type_id = resolve_crop_type(cur, is_postgres(conn), "Maize")
 
 # Clean tables (order matters because of FK)
 cur.execute("DELETE FROM harvests")
@@ -53,13 +55,13 @@ user_id = last_insert_id(conn, cur, "users")
 
 # Training crops: area in acres
 crops = [
-    (user_id, "Maize", 2.0, "2024-03-10"),
-    (user_id, "Maize", 3.0, "2024-04-15"),
-    (user_id, "Maize", 4.0, "2024-11-20"),
+    (user_id, "Maize", 2.0, "2024-03-10", maize_type_id),
+    (user_id, "Maize", 3.0, "2024-04-15", maize_type_id),
+    (user_id, "Maize", 4.0, "2024-11-20", maize_type_id),
 ]
 for c in crops:
     cur.execute(
-        f"INSERT INTO crops (user_id, name, area, planting_date) VALUES ({p}, {p}, {p}, {p})",
+        f"INSERT INTO crops (user_id, name, area, planting_date, crop_type_id) VALUES ({p}, {p}, {p}, {p}, {p})",
         c
     )
 conn.commit()
@@ -94,8 +96,8 @@ conn.commit()
 
 # New crop to predict
 cur.execute(
-    f"INSERT INTO crops (user_id, name, area, planting_date) VALUES ({p}, {p}, {p}, {p})",
-    (user_id, "Maize", 2.5, "2025-03-15")
+    f"INSERT INTO crops (user_id, name, area, planting_date, crop_type_id) VALUES ({p}, {p}, {p}, {p}, {p})",
+    (user_id, "Maize", 2.5, "2025-03-15", maize_type_id)
 )
 conn.commit()
 new_crop_id = last_insert_id(conn, cur, "crops")
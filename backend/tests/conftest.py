@@ -0,0 +1,120 @@
+# conftest.py — Every test runs against a scratch SQLite database
+import os
+import sys
+import sqlite3
+import itertools
+import tempfile
+
+import pytest
+
+SCRATCH = tempfile.mkdtemp(prefix="crop_tracker_tests_")
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ.update({
+    "SQLITE_PATH": os.path.join(SCRATCH, "database.db"),
+    "SHARD_DIR": os.path.join(SCRATCH, "shards"),
+    "HARVEST_PARTITION_DIR": os.path.join(SCRATCH, "partitions"),
+    "HARVEST_ARCHIVE_DIR": os.path.join(SCRATCH, "archive"),
+    "PREDICTION_WORKER": "0",
+    "SCHEDULER_ENABLED": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def db():
+    """A primary connection to the (migrated) scratch database."""
+    from crop_tracker.model import ensure_schema, get_db
+    ensure_schema()
+    conn = get_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_user(client):
+    """Registers a fresh farmer and returns their id."""
+    def make():
+        n = next(_ids)
+        resp = client.post("/api/register", json={
+            "email": f"farmer{n}@example.com", "username": f"farmer{n}", "password": "secret123",
+        })
+        assert resp.status_code == 201, resp.get_json()
+        return resp.get_json()["userId"]
+    return make
+
+
+@pytest.fixture
+def add_crop(client):
+    """Creates a crop for user_id and returns its id."""
+    def add(user_id, name="Maize", area=2.0, planting_date="2024-03-01"):
+        resp = client.post(f"/api/crop/{user_id}", json={"name": name, "area": area, "planting_date": planting_date})
+        assert resp.status_code == 201, resp.get_json()
+        crops = client.get(f"/api/crop/{user_id}?limit=100").get_json()["data"]
+        return max(c["id"] for c in crops)
+    return add
+
+
+@pytest.fixture
+def add_harvest(client):
+    def add(crop_id, user_id, date, yield_amount):
+        resp = client.post(f"/api/harvest/{crop_id}/{user_id}", json={"date": date, "yield_amount": yield_amount})
+        assert resp.status_code == 201, resp.get_json()
+    return add
+
+
+@pytest.fixture
+def isolated_db(monkeypatch, tmp_path):
+    """
+    A fresh, migrated SQLite database with its own partition and archive
+    directories, for tests that rewrite storage. Per-user caches are
+    cleared around it (user ids restart at 1).
+    """
+    from crop_tracker import model, partitions, prediction, columnstore
+
+    def clear():
+        for cache in (prediction._training, prediction._bootstrap_cache, prediction._forecast_cache,
+                      columnstore._snapshots, partitions._archived):
+            cache.clear()
+
+    # migrate the shared database first: ensure_schema() runs once per
+    # process and would otherwise skip it for the tests that follow
+    model.init_db()
+    monkeypatch.setattr(model, "SQLITE_PATH", str(tmp_path / "database.db"))
+    monkeypatch.setattr(partitions, "HARVEST_PARTITION_DIR", str(tmp_path / "partitions"))
+    monkeypatch.setattr(partitions, "HARVEST_ARCHIVE_DIR", str(tmp_path / "archive"))
+    clear()
+    model.init_db()
+    yield tmp_path
+    clear()
+
+
+class RecordingConnection(sqlite3.Connection):
+    """Logs each statement (first two words) and each commit() call, in order."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = []
+        self.set_trace_callback(lambda sql: self.log.append(" ".join(sql.split()[:2])))
+
+    def commit(self):
+        self.log.append("commit()")
+        super().commit()
+
+
+@pytest.fixture
+def recording_db(isolated_db):
+    """A connection to the isolated database that records its statements and commits."""
+    from crop_tracker import model
+    conn = sqlite3.connect(model.SQLITE_PATH, factory=RecordingConnection)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
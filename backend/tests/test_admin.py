@@ -0,0 +1,9 @@
+# test_admin.py — ADMIN_TOKEN guard on the operator endpoints
+def test_admin_api_needs_the_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.get("/api/admin/slow-queries").status_code == 403
+
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret-tøken")
+    assert client.get("/api/admin/slow-queries").status_code == 401
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "s3cret"}).status_code == 401
+    assert client.get("/api/admin/slow-queries", headers={"X-Admin-Token": "s3cret-tøken"}).status_code == 200
@@ -0,0 +1,82 @@
+# test_admission.py — Shedding with 429/503 + Retry-After, and per-class isolation
+import pytest
+
+from crop_tracker import admission
+from crop_tracker.admission import RouteClass, parse_limits
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """Replaces the analytics class with one whose single slot is taken."""
+    def make(queue):
+        rc = RouteClass("analytics", 1, queue)
+        rc.active = 1
+        monkeypatch.setitem(admission._classes, "analytics", rc)
+        monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT_S", 0.05)
+        return rc
+    return make
+
+
+def test_full_queue_sheds_with_429(client, make_user, saturated):
+    user = make_user()
+    rc = saturated(queue=0)
+    resp = client.get(f"/api/harvests/stats?user_id={user}")
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert rc.state()["rejected"] == {"queue_full": 1, "queue_timeout": 0}
+
+
+def test_queue_timeout_sheds_with_503(client, make_user, saturated):
+    user = make_user()
+    rc = saturated(queue=4)
+    resp = client.get(f"/api/harvests/stats?user_id={user}")
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert rc.state()["rejected"]["queue_timeout"] == 1
+    assert rc.state()["queued"] == 0
+
+
+def test_other_classes_keep_their_slots(client, make_user, saturated):
+    user = make_user()
+    saturated(queue=0)
+    # auth and writes are not behind the analytics backlog
+    resp = client.post(f"/api/crop/{user}", json={"name": "Maize", "area": 1.0, "planting_date": "2024-03-01"})
+    assert resp.status_code == 201
+    resp = client.post("/api/login", json={"email": f"farmer{user}@example.com", "password": "nope"})
+    assert resp.status_code not in (429, 503)
+
+
+def test_slots_are_released_after_each_request(client, make_user, monkeypatch):
+    user = make_user()
+    rc = RouteClass("analytics", 1, 0)
+    monkeypatch.setitem(admission._classes, "analytics", rc)
+    for _ in range(3):
+        assert client.get(f"/api/harvests/stats?user_id={user}").status_code == 200
+    assert rc.state()["active"] == 0
+
+
+def test_parse_limits():
+    assert parse_limits("analytics=16:64, writes=0, ,auth=4:-1") == {
+        "analytics": (16, 64), "writes": (1, 0), "auth": (4, 0),
+    }
+
+
+def test_every_blueprint_is_classified_or_exempt():
+    from app import app
+    known = {"auth_routes"} | set(admission.READ_BLUEPRINTS) | set(admission.WRITE_BLUEPRINTS) | set(admission.EXEMPT_BLUEPRINTS)
+    assert set(app.blueprints) <= known
+
+
+def test_org_routes_are_admission_controlled(client, make_user, saturated, monkeypatch):
+    manager = make_user()
+    org_id = client.post("/api/orgs", json={"user_id": manager, "name": "Queue Coop"}).get_json()["org_id"]
+    saturated(queue=0)
+    resp = client.get(f"/api/orgs/{org_id}/stats?user_id={manager}")
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+
+    writes = RouteClass("writes", 1, 0)
+    writes.active = 1
+    monkeypatch.setitem(admission._classes, "writes", writes)
+    resp = client.post(f"/api/orgs/{org_id}/members", json={"user_id": manager, "member_id": make_user()})
+    assert resp.status_code == 429
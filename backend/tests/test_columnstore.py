@@ -0,0 +1,46 @@
+# test_columnstore.py — In-memory harvest columns must agree with the SQL path
+import pytest
+
+from crop_tracker import columnstore
+from crop_tracker.croptypes import lookup_crop_type
+from crop_tracker.harvest import yearly_totals, seasonality_by_month, crop_year_stats
+
+
+@pytest.fixture(autouse=True)
+def store_enabled(monkeypatch):
+    monkeypatch.setattr(columnstore, "HARVEST_STORE_ENABLED", True)
+
+
+def test_snapshot_matches_sql(make_user, add_crop, add_harvest, db):
+    user = make_user()
+    maize = add_crop(user, name="Maize", planting_date="2023-02-10")
+    beans = add_crop(user, name="Beans", planting_date="2024-03-05")
+    for crop, day, kg in [(maize, "2023-06-01", 400), (maize, "2023-07-15", 120.5),
+                          (maize, "2024-06-20", 380), (beans, "2024-06-02", 90),
+                          (beans, "2024-11-30", 60.25)]:
+        add_harvest(crop, user, day, kg)
+
+    cur = db.cursor()
+    snap = columnstore.harvest_snapshot(db, cur, user)
+    assert snap is not None
+    assert columnstore.same_result(snap.yearly_totals(), yearly_totals(db, cur, user))
+    assert columnstore.same_result(snap.monthly_totals(2023, 2024), seasonality_by_month(db, cur, user, 2023, 2024))
+    for name in ("Maize", "Beans", "Unknown crop"):
+        type_id = lookup_crop_type(cur, False, name)
+        for year in (2023, 2024):
+            assert columnstore.same_result(
+                snap.crop_year(type_id, year), crop_year_stats(db, cur, user, type_id, year)
+            ), (name, year)
+
+
+def test_appended_harvest_keeps_the_snapshot_current(make_user, add_crop, add_harvest, db):
+    user = make_user()
+    crop = add_crop(user)
+    add_harvest(crop, user, "2024-05-01", 100)
+    cur = db.cursor()
+    before = columnstore.harvest_snapshot(db, cur, user)
+
+    add_harvest(crop, user, "2025-01-10", 50)
+    after = columnstore.harvest_snapshot(db, cur, user)
+    assert after is before   # extended in place, not reloaded
+    assert columnstore.same_result(after.yearly_totals(), yearly_totals(db, cur, user))
@@ -0,0 +1,62 @@
+# test_compare.py — GET /api/harvests/compare
+import pytest
+
+
+def test_years_are_compared_against_the_previous_requested_year(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    crop = add_crop(user, area=2.0, planting_date="2022-03-01")
+    add_harvest(crop, user, "2022-07-01", 100)
+    add_harvest(crop, user, "2024-07-01", 150)
+    add_harvest(crop, user, "2024-08-01", 50)
+
+    body = client.get(f"/api/harvests/compare?user_id={user}&years=2024,2022,2023").get_json()
+    by_year = {r["year"]: r for r in body["years"]}
+    assert list(by_year) == [2022, 2023, 2024]
+    assert by_year[2022]["prev_year"] is None
+    assert by_year[2023]["total_yield"] == 0 and by_year[2023]["avg_yield"] is None
+    assert by_year[2024]["harvests"] == 2
+    assert by_year[2024]["avg_yield"] == 100
+    assert by_year[2024]["yield_per_acre"] == 100
+    assert by_year[2024]["total_yield_delta"] == 200
+    assert by_year[2024]["total_yield_growth_pct"] is None   # 2023 had nothing
+
+
+@pytest.mark.parametrize("years", ["inf", "2024,-inf", "nan", "2024.5", "abc", "", "0", "2024,99999"])
+def test_invalid_years_are_rejected(client, make_user, years):
+    resp = client.get(f"/api/harvests/compare?user_id={make_user()}&years={years}")
+    assert resp.status_code == 400
+
+
+def test_too_many_years_are_rejected(client, make_user):
+    years = ",".join(str(y) for y in range(1900, 2000))
+    assert client.get(f"/api/harvests/compare?user_id={make_user()}&years={years}").status_code == 400
+
+
+def test_only_the_requested_years_are_read(isolated_db, make_user, add_crop, add_harvest):
+    from crop_tracker.model import get_db
+    from crop_tracker.partitions import sqlite_partition, compact
+    from crop_tracker.harvest import compare_years
+
+    user = make_user()
+    crop = add_crop(user, area=1.0, planting_date="2015-03-01")
+    for year in range(2015, 2025):
+        add_harvest(crop, user, f"{year}-07-01", year - 2000)
+    conn = get_db(role="schema")
+    cur = conn.cursor()
+    compact(conn, cur, 2017)               # 2015, 2016 archived into rollups
+    sqlite_partition(conn, cur, 2024)      # 2017..2023 in year files
+    conn.close()
+
+    statements = []
+    conn = get_db("read", user)
+    conn.set_trace_callback(statements.append)
+    rows = compare_years(conn, conn.cursor(), user, [2016, 2018, 2019, 2024])
+    conn.close()
+
+    assert [(r["year"], r["total_yield"], r["prev_year"]) for r in rows] == [
+        (2016, 16, None), (2018, 18, 2016), (2019, 19, 2018), (2024, 24, 2019)]
+    sql = statements[-1]
+    assert "p2018.harvests" in sql and "p2019.harvests" in sql
+    assert not any(f"p{y}.harvests" in sql for y in (2017, 2020, 2021, 2022, 2023))
+    # date ranges 2016, 2018-2019 and 2024 in each of main, p2018 and p2019
+    assert sql.count("h.date >= ") == 3 * 3
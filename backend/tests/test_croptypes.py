@@ -0,0 +1,48 @@
+# test_croptypes.py — crop type ids, their cache, and untyped crops in analytics
+import sqlite3
+
+from crop_tracker import croptypes
+from crop_tracker.model import get_db
+from crop_tracker.querylog import TimedSqliteConnection
+
+
+def test_rolled_back_insert_is_not_cached(db):
+    cur = db.cursor()
+    type_id = croptypes.resolve_crop_type(cur, False, "Teff")
+    assert type_id is not None
+    db.rollback()
+
+    assert croptypes.lookup_crop_type(cur, False, "teff") is None
+
+
+def test_cache_is_per_database(db, tmp_path):
+    cur = db.cursor()
+    croptypes.resolve_crop_type(cur, False, "Millet")
+    db.commit()
+    assert croptypes.lookup_crop_type(cur, False, "Millet") is not None
+
+    other = sqlite3.connect(tmp_path / "other.db", factory=TimedSqliteConnection)
+    other.database_path = str(tmp_path / "other.db")
+    other.execute("CREATE TABLE crop_types (id INTEGER PRIMARY KEY, name_key TEXT UNIQUE, name TEXT)")
+    assert croptypes.lookup_crop_type(other.cursor(), False, "Millet") is None
+    other.close()
+
+
+def test_crops_without_a_type_count_as_unknown(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    typed = add_crop(user, name="Maize")
+    untyped = add_crop(user, name="Mystery")
+    add_harvest(typed, user, "2024-08-01", 100)
+    add_harvest(untyped, user, "2024-08-02", 300)
+
+    conn = get_db()
+    conn.execute("UPDATE crops SET crop_type_id = NULL WHERE id = ?", (untyped,))
+    conn.commit()
+    conn.close()
+
+    stats = client.get(f"/api/harvests/stats?user_id={user}").get_json()
+    assert {s["crop_name"]: s["total_yield"] for s in stats["stats"]} == {"Unknown": 300.0, "Maize": 100.0}
+    assert stats["overall_total_yield"] == 400.0
+
+    top = client.get(f"/api/harvests/summary/top-crops-yearly?user_id={user}&from=2024&to=2024&top=5").get_json()
+    assert "Unknown" in str(top)
@@ -0,0 +1,62 @@
+# test_downsample.py — LTTB / min-max output sizes and the timeseries route
+import math
+
+import pytest
+
+from crop_tracker.downsample import lttb, minmax
+
+
+def series(n):
+    return [(float(x), math.sin(x / 7.0) * 100 + x, f"p{x}") for x in range(n)]
+
+
+@pytest.mark.parametrize("n, max_points", [(1000, 50), (1000, 3), (101, 100), (10, 4), (7, 5), (5000, 4999)])
+def test_lttb_keeps_exactly_max_points_in_order(n, max_points):
+    points = series(n)
+    out = list(lttb(iter(points), n, max_points))
+    assert len(out) == max_points
+    assert out[0] == points[0] and out[-1] == points[-1]
+    xs = [p[0] for p in out]
+    assert xs == sorted(set(xs))
+    # points are kept whole, extra items included
+    assert set(out) <= set(points)
+
+
+@pytest.mark.parametrize("n, max_points", [(0, 10), (2, 3), (10, 10), (10, 50)])
+def test_short_series_pass_through(n, max_points):
+    points = series(n)
+    assert list(lttb(iter(points), n, max_points)) == points
+    assert list(minmax(iter(points), n, max_points)) == points
+
+
+def test_lttb_keeps_a_lone_spike():
+    points = [(float(x), 0.0) for x in range(1000)]
+    points[613] = (613.0, 5000.0)
+    assert (613.0, 5000.0) in list(lttb(iter(points), len(points), 20))
+
+
+@pytest.mark.parametrize("n, max_points", [(1000, 50), (1000, 51), (99, 10)])
+def test_minmax_keeps_every_bucket_extreme(n, max_points):
+    points = series(n)
+    out = list(minmax(iter(points), n, max_points))
+    assert len(out) <= max_points
+    assert [p[0] for p in out] == sorted(p[0] for p in out)
+    assert max(points, key=lambda p: p[1]) in out
+    assert min(points, key=lambda p: p[1]) in out
+
+
+def test_timeseries_route_caps_points(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    crop = add_crop(user, "Maize", 2.0, "2023-01-01")
+    for day in range(1, 29):
+        for month in (3, 4):
+            add_harvest(crop, user, f"2023-{month:02d}-{day:02d}", 10 * day + month)
+
+    resp = client.get(f"/api/harvests/timeseries?user_id={user}&interval=day&max_points=10")
+    assert resp.status_code == 200, resp.get_json()
+    (points,) = [s["points"] for s in resp.get_json()["series"]]
+    assert len(points) == 10
+
+    full = client.get(f"/api/harvests/timeseries?user_id={user}&interval=day&max_points=5000").get_json()
+    assert len(full["series"][0]["points"]) == 56
+    assert client.get(f"/api/harvests/timeseries?user_id={user}&interval=hour").status_code == 400
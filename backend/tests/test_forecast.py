@@ -0,0 +1,115 @@
+# test_forecast.py — Harvest calendar buckets and the forecast cache
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from crop_tracker import prediction
+from crop_tracker.prediction import MAX_CALENDAR_MONTHS, harvest_calendar, month_index
+
+BEANS_DAYS = prediction.GROWING_DAYS["Beans"]
+
+
+def month_start(offset):
+    """First day of the month `offset` months from the current UTC month."""
+    today = datetime.now(timezone.utc).date()
+    idx = today.year * 12 + today.month - 1 + offset
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def planted_for(harvest_day):
+    return (harvest_day - timedelta(days=BEANS_DAYS)).isoformat()
+
+
+def test_harvest_calendar_buckets():
+    crops = [
+        {"crop_id": 1, "expected_harvest_date": "2025-12-31", "predicted_yield": 10.0},
+        {"crop_id": 2, "expected_harvest_date": "2026-01-01", "predicted_yield": 100.0},
+        {"crop_id": 3, "expected_harvest_date": "2026-01-20", "predicted_yield": 50.5},
+        {"crop_id": 4, "expected_harvest_date": "2026-03-15", "predicted_yield": 7.0},
+        {"crop_id": 5, "expected_harvest_date": "2026-04-01", "predicted_yield": 900.0},
+    ]
+    calendar, overdue, later = harvest_calendar(crops, month_index("2026-01-01"), 3)
+
+    assert [m["month"] for m in calendar] == ["2026-01", "2026-02", "2026-03"]
+    assert [m["predicted_yield"] for m in calendar] == [150.5, 0.0, 7.0]
+    assert [m["crop_count"] for m in calendar] == [2, 0, 1]
+    assert [c["crop_id"] for c in calendar[0]["crops"]] == [2, 3]
+    assert overdue == {"crop_count": 1, "predicted_yield": 10.0}
+    assert later == {"crop_count": 1, "predicted_yield": 900.0}
+
+
+def test_calendar_route_places_growing_crops(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    due_now = add_crop(user, "Beans", 1.0, planted_for(month_start(0)))
+    due_soon = add_crop(user, "Beans", 2.0, planted_for(month_start(2) + timedelta(days=10)))
+    add_crop(user, "Beans", 1.0, planted_for(month_start(-2)))      # overdue
+    add_crop(user, "Beans", 1.0, planted_for(month_start(6)))       # beyond the window
+    harvested = add_crop(user, "Beans", 1.0, planted_for(month_start(1)))
+    add_harvest(harvested, user, month_start(-1).isoformat(), 300)  # not growing any more
+
+    resp = client.get(f"/api/forecast/calendar?user_id={user}&months=3")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["from"] == month_start(0).isoformat()[:7]
+    assert [m["month"] for m in body["calendar"]] == [month_start(i).isoformat()[:7] for i in range(3)]
+    assert [[c["crop_id"] for c in m["crops"]] for m in body["calendar"]] == [[due_now], [], [due_soon]]
+    assert body["overdue"]["crop_count"] == 1
+    assert body["later"]["crop_count"] == 1
+    assert body["total_predicted_yield"] == round(sum(m["predicted_yield"] for m in body["calendar"]), 1)
+    assert body["crop_types"][0]["crop_name"] == "Beans"
+    assert body["crop_types"][0]["crops"] == 4
+    assert body["crop_types"][0]["growing_days"] == BEANS_DAYS
+
+
+@pytest.mark.parametrize("months, status", [
+    ("1", 200), (str(MAX_CALENDAR_MONTHS), 200),
+    ("0", 400), (str(MAX_CALENDAR_MONTHS + 1), 400), ("-3", 400), ("soon", 400),
+])
+def test_calendar_months_bounds(client, make_user, months, status):
+    user = make_user()
+    resp = client.get(f"/api/forecast/calendar?user_id={user}&months={months}")
+    assert resp.status_code == status, resp.get_json()
+    if status == 200:
+        assert len(resp.get_json()["calendar"]) == int(months)
+
+
+def test_calendar_requires_a_user(client):
+    assert client.get("/api/forecast/calendar").status_code == 401
+    assert client.get("/api/forecast/calendar?user_id=abc").status_code == 400
+
+
+def test_forecast_cache_keyed_by_user_version_and_generation(client, make_user, add_crop, monkeypatch):
+    user = make_user()
+    add_crop(user, "Beans", 1.0, planted_for(month_start(1)))
+    calls = []
+    real = prediction.forecast_crops
+    monkeypatch.setattr(prediction, "forecast_crops", lambda *a: calls.append(a[2]) or real(*a))
+
+    def calendar(months=12):
+        resp = client.get(f"/api/forecast/calendar?user_id={user}&months={months}")
+        assert resp.status_code == 200
+        return resp.get_json()
+
+    first = calendar()
+    calendar(months=6)                     # the window is cut per request
+    assert calls == [user]
+
+    add_crop(user, "Beans", 1.0, planted_for(month_start(2)))   # new data version
+    second = calendar()
+    assert len(calls) == 2
+    assert second["data_version"] > first["data_version"]
+
+    generation = prediction.priors_generation()
+    monkeypatch.setattr(prediction, "priors_generation", lambda: generation + 1)
+    calendar()
+    assert len(calls) == 3
+
+    other = make_user()
+    client.get(f"/api/forecast/calendar?user_id={other}")
+    assert calls[-1] == other
+    keys = [k for k in prediction._forecast_cache if k[0] == user]
+    assert {(k[1], k[2]) for k in keys} == {
+        (first["data_version"], generation),
+        (second["data_version"], generation),
+        (second["data_version"], generation + 1),
+    }
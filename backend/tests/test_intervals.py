@@ -0,0 +1,85 @@
+# test_intervals.py — GET /api/predict/<crop_id>?intervals=1 bootstrap bands
+import pytest
+
+from crop_tracker import singleflight
+
+HISTORY = [("2021-03-01", "2021-07-01", 1500), ("2022-04-01", "2022-08-01", 1700),
+           ("2023-03-01", "2023-07-10", 1400), ("2024-05-01", "2024-09-01", 2100)]
+
+
+@pytest.fixture
+def farm(make_user, add_crop, add_harvest):
+    """A user with four harvested Maize crops and one still growing."""
+    user = make_user()
+    for planted, harvested, kg in HISTORY:
+        add_harvest(add_crop(user, "Maize", 2.0, planted), user, harvested, kg)
+    return user, add_crop(user, "Maize", 3.0, "2025-04-01")
+
+
+def predict(client, user, crop, query=""):
+    return client.get(f"/api/predict/{crop}?user_id={user}{query}")
+
+
+@pytest.mark.parametrize("query", ["&intervals=1", "&intervals=true"])
+def test_intervals_default_to_90_percent(client, farm, query):
+    user, crop = farm
+    body = predict(client, user, crop, query).get_json()
+    bands = body["intervals"]
+    assert bands["level"] == 90 and bands["method"] == "bootstrap"
+    assert bands["yield_per_acre"]["low"] <= bands["yield_per_acre"]["median"] <= bands["yield_per_acre"]["high"]
+    assert bands["yield"]["median"] == pytest.approx(bands["yield_per_acre"]["median"] * 3.0, abs=0.2)
+
+
+@pytest.mark.parametrize("query", ["", "&intervals=0", "&intervals=yes", "&level=80"])
+def test_intervals_are_opt_in(client, farm, query):
+    user, crop = farm
+    resp = predict(client, user, crop, query)
+    assert resp.status_code == 200
+    assert "intervals" not in resp.get_json()
+
+
+def test_level_sets_the_band_width(client, farm):
+    user, crop = farm
+    narrow = predict(client, user, crop, "&intervals=1&level=50").get_json()["intervals"]
+    wide = predict(client, user, crop, "&intervals=1&level=99").get_json()["intervals"]
+    assert (narrow["level"], wide["level"]) == (50, 99)
+    assert narrow["resamples"] == wide["resamples"]
+    assert wide["yield_per_acre"]["low"] <= narrow["yield_per_acre"]["low"]
+    assert wide["yield_per_acre"]["high"] >= narrow["yield_per_acre"]["high"]
+
+
+@pytest.mark.parametrize("level", ["49", "100", "-90", "ninety", "90.5", ""])
+def test_level_is_validated(client, farm, level):
+    user, crop = farm
+    resp = predict(client, user, crop, f"&intervals=1&level={level}")
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "level must be between 50 and 99"}
+
+
+def test_no_intervals_without_enough_samples(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    for planted, harvested, kg in HISTORY[:2]:
+        add_harvest(add_crop(user, "Maize", 2.0, planted), user, harvested, kg)
+    crop = add_crop(user, "Maize", 1.0, "2025-04-01")
+    resp = predict(client, user, crop, "&intervals=1")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["intervals"] is None
+    assert body["used_regression_model"] is False
+
+
+def test_coalescing_key_includes_intervals_and_level(client, farm, monkeypatch):
+    user, crop = farm
+    keys = []
+    real = singleflight.do
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(singleflight, "do", lambda key, fn: keys.append(key) or real(key, fn))
+
+    for query in ("", "&intervals=1", "&intervals=1&level=80", "&intervals=1&level=80&unrelated=x"):
+        assert predict(client, user, crop, query).status_code == 200
+
+    assert len(set(keys[:3])) == 3
+    assert keys[3] == keys[2]
+    route, parts = keys[2]
+    assert route == "predict_yield"
+    assert dict(parts) == {"crop_id": str(crop), "user_id": str(user), "intervals": "1", "level": "80"}
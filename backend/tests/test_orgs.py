@@ -0,0 +1,83 @@
+# test_orgs.py — Org invitations and the org_rollups kept by members' writes
+from crop_tracker.orgs import rebuild_org_rollups
+
+
+def create_org(client, manager, name):
+    resp = client.post("/api/orgs", json={"user_id": manager, "name": name})
+    assert resp.status_code == 201
+    return resp.get_json()["org_id"]
+
+
+def invite_and_accept(client, org_id, manager, member):
+    assert client.post(f"/api/orgs/{org_id}/members", json={"user_id": manager, "member_id": member}).status_code == 201
+    assert client.post(f"/api/orgs/{org_id}/invites/accept", json={"user_id": member}).status_code == 201
+
+
+def org_stats(client, org_id, user_id):
+    body = client.get(f"/api/orgs/{org_id}/stats?user_id={user_id}").get_json()
+    return {s["crop_name"]: (s["harvest_count"], s["total_yield"]) for s in body["stats"]}
+
+
+def test_invited_farmer_joins_only_after_accepting(client, make_user, add_crop, add_harvest):
+    manager, farmer = make_user(), make_user()
+    add_harvest(add_crop(farmer), farmer, "2024-06-01", 500)
+    org_id = create_org(client, manager, "Invite Coop")
+
+    resp = client.post(f"/api/orgs/{org_id}/members", json={"user_id": manager, "member_id": farmer})
+    assert resp.status_code == 201
+    assert org_stats(client, org_id, manager) == {}
+    assert client.get(f"/api/orgs/{org_id}/stats?user_id={farmer}").status_code == 403
+    invites = client.get(f"/api/orgs/invites?user_id={farmer}").get_json()["invites"]
+    assert [i["org_id"] for i in invites] == [org_id]
+
+    assert client.post(f"/api/orgs/{org_id}/invites/accept", json={"user_id": farmer}).status_code == 201
+    assert org_stats(client, org_id, manager) == {"Maize": (1, 500.0)}
+    assert client.get(f"/api/orgs/invites?user_id={farmer}").get_json()["invites"] == []
+    assert client.post(f"/api/orgs/{org_id}/invites/accept", json={"user_id": farmer}).status_code == 404
+
+
+def test_invitations_are_managers_only_and_can_be_declined(client, make_user):
+    manager, member, farmer = make_user(), make_user(), make_user()
+    org_id = create_org(client, manager, "Decline Coop")
+    invite_and_accept(client, org_id, manager, member)
+
+    resp = client.post(f"/api/orgs/{org_id}/members", json={"user_id": member, "member_id": farmer})
+    assert resp.status_code == 403
+    resp = client.post(f"/api/orgs/{org_id}/members", json={"user_id": manager, "member_id": member})
+    assert resp.status_code == 409
+
+    client.post(f"/api/orgs/{org_id}/members", json={"user_id": manager, "member_id": farmer})
+    assert client.delete(f"/api/orgs/{org_id}/invites/{farmer}?user_id={member}").status_code == 403
+    assert client.delete(f"/api/orgs/{org_id}/invites/{farmer}?user_id={farmer}").status_code == 200
+    assert client.post(f"/api/orgs/{org_id}/invites/accept", json={"user_id": farmer}).status_code == 404
+
+
+def test_rollups_follow_add_move_forget_and_leave(client, make_user, add_crop, add_harvest, db):
+    manager, farmer = make_user(), make_user()
+    org_id = create_org(client, manager, "Rollup Coop")
+    invite_and_accept(client, org_id, manager, farmer)
+
+    crop = add_crop(farmer, name="Maize")
+    add_harvest(crop, farmer, "2024-06-01", 300)
+    add_harvest(crop, farmer, "2024-07-01", 200)
+    other = add_crop(manager, name="Beans")
+    add_harvest(other, manager, "2024-05-01", 40)
+    assert org_stats(client, org_id, manager) == {"Maize": (2, 500.0), "Beans": (1, 40.0)}
+
+    # rename -> the crop's harvests move to the other crop type
+    client.put(f"/api/crop/{crop}/{farmer}", json={"name": "Beans", "area": 2.0, "planting_date": "2024-03-01"})
+    assert org_stats(client, org_id, manager) == {"Beans": (3, 540.0)}
+
+    # a crop without a type stays in the totals as "Unknown"
+    db.execute("UPDATE org_rollups SET crop_type_id = 0 WHERE org_id = ? AND month IN (6, 7)", (org_id,))
+    db.commit()
+    assert org_stats(client, org_id, manager) == {"Beans": (1, 40.0), "Unknown": (2, 500.0)}
+    rebuild_org_rollups()
+    assert org_stats(client, org_id, manager) == {"Beans": (3, 540.0)}
+
+    client.delete(f"/api/crop/{crop}/{farmer}")
+    assert org_stats(client, org_id, manager) == {"Beans": (1, 40.0)}
+
+    add_harvest(add_crop(farmer, name="Rice"), farmer, "2024-09-01", 70)
+    assert client.delete(f"/api/orgs/{org_id}/members/{farmer}?user_id={farmer}").status_code == 200
+    assert org_stats(client, org_id, manager) == {"Beans": (1, 40.0)}
@@ -0,0 +1,173 @@
+# test_partitions.py — SQLite year files, compaction into rollups, the cold archive
+import os
+import sqlite3
+
+import pytest
+
+from crop_tracker import partitions, columnstore
+from crop_tracker.model import get_db
+from crop_tracker.partitions import (
+    sqlite_partition, compact, archived_years, record_archive, partition_files,
+)
+
+HARVESTS = [
+    ("2019-06-01", 800), ("2019-11-15", 950),
+    ("2020-07-01", 1200), ("2020-07-20", 40),
+    ("2023-05-01", 700), ("2024-08-01", 1500),
+]
+
+
+@pytest.fixture
+def farm(isolated_db, make_user, add_crop, add_harvest):
+    user = make_user()
+    maize = add_crop(user, "Maize", 2.0, "2019-03-01")
+    beans = add_crop(user, "Beans", 1.0, "2020-04-01")
+    for i, (day, kg) in enumerate(HARVESTS):
+        add_harvest(beans if i % 3 == 2 else maize, user, day, kg)
+    return user
+
+
+def schema_conn():
+    conn = get_db(role="schema")
+    return conn, conn.cursor()
+
+
+def snapshot(client, user, paths):
+    columnstore._snapshots.clear()   # answers must come from the tables
+    out = {}
+    for path in paths:
+        resp = client.get(path.format(user=user))
+        assert resp.status_code == 200, (path, resp.get_json())
+        out[path] = resp.get_json()
+    return out
+
+
+PER_HARVEST = [
+    "/api/harvests?user_id={user}",
+    "/api/harvests/stats?user_id={user}",
+    "/api/sync?user_id={user}&since=0",
+]
+YEAR_RANGE = [
+    "/api/harvests/summary/yearly?user_id={user}",
+    "/api/harvests/summary/top-crops-yearly?user_id={user}&from=2019&to=2024&top=5",
+    "/api/harvests/seasonality?user_id={user}&from=2019&to=2024",
+    "/api/harvests/filter/crop-year?user_id={user}&crop=Maize&year=2020",
+    "/api/harvests/compare?user_id={user}&crop=Maize&years=2019,2020,2024",
+]
+
+
+def test_partitioned_reads_match_unpartitioned(client, farm):
+    before = snapshot(client, farm, PER_HARVEST + YEAR_RANGE)
+
+    conn, cur = schema_conn()
+    sqlite_partition(conn, cur, 2023)
+    assert conn.execute("SELECT COUNT(*) FROM main.harvests").fetchone()[0] == 2
+    conn.close()
+    assert [y for y, _ in partition_files()] == [2019, 2020]
+
+    assert snapshot(client, farm, PER_HARVEST + YEAR_RANGE) == before
+
+    # new writes land in main and show up next to the year files
+    cursor = before["/api/sync?user_id={user}&since=0"]["cursor"]
+    crop_id = before["/api/sync?user_id={user}&since=0"]["crops"][0]["id"]
+    assert client.post(f"/api/harvest/{crop_id}/{farm}", json={"date": "2025-01-10", "yield_amount": 300}).status_code == 201
+    delta = client.get(f"/api/sync?user_id={farm}&since={cursor}").get_json()
+    assert [h["date"] for h in delta["harvests"]] == ["2025-01-10"]
+
+
+def test_compaction_keeps_year_range_totals(client, farm):
+    conn, cur = schema_conn()
+    sqlite_partition(conn, cur, 2023)
+    conn.close()
+    before = snapshot(client, farm, YEAR_RANGE)
+
+    conn, cur = schema_conn()
+    compact(conn, cur, 2021)
+    rollups = conn.execute("SELECT SUM(events), SUM(total_yield) FROM harvest_rollups").fetchone()
+    assert tuple(rollups) == (4, 800 + 950 + 1200 + 40)
+    assert conn.execute("SELECT COUNT(*) FROM main.harvests WHERE date < '2021-01-01'").fetchone()[0] == 0
+    conn.close()
+
+    assert partition_files() == []
+    assert snapshot(client, farm, YEAR_RANGE) == before
+    # per-harvest reads no longer see archived rows
+    listed = client.get(f"/api/harvests?user_id={farm}").get_json()
+    assert sorted(h["date"] for h in listed) == ["2023-05-01", "2024-08-01"]
+
+
+def test_archive_round_trips(client, farm, add_harvest):
+    conn, cur = schema_conn()
+    originals = [tuple(r) for r in conn.execute(
+        "SELECT id, crop_id, date, yield_amount, version FROM harvests WHERE date < '2020-01-01' ORDER BY id")]
+    compact(conn, cur, 2020)
+    conn.close()
+
+    path = os.path.join(partitions.HARVEST_ARCHIVE_DIR, "harvests_2019.db")
+    assert os.stat(path).st_mode & 0o222 == 0
+    cold = sqlite3.connect(path)
+    try:
+        archived = [tuple(r) for r in cold.execute(
+            "SELECT id, crop_id, date, yield_amount, version FROM harvests ORDER BY id")]
+    finally:
+        cold.close()
+    assert archived == originals
+
+    # a late 2019 harvest is compacted into the same archive and rollups
+    crop_id = originals[0][1]
+    add_harvest(crop_id, farm, "2019-12-01", 100)
+    conn, cur = schema_conn()
+    compact(conn, cur, 2020)
+    row = conn.execute("SELECT row_count FROM harvest_archive WHERE year = 2019").fetchone()
+    assert row[0] == 3
+    assert conn.execute("SELECT SUM(total_yield) FROM harvest_rollups WHERE year = 2019").fetchone()[0] == 800 + 950 + 100
+    conn.close()
+    cold = sqlite3.connect(path)
+    try:
+        assert cold.execute("SELECT COUNT(*) FROM harvests").fetchone()[0] == 3
+    finally:
+        cold.close()
+
+
+def test_archived_years_are_cached_until_recorded(isolated_db, monkeypatch):
+    conn, cur = schema_conn()
+    other = get_db(role="schema")
+    try:
+        assert archived_years(conn) == []
+        # another process compacting: not seen until the cache expires...
+        other.execute("INSERT INTO harvest_archive (year, row_count, location, archived_at) VALUES (2001, 1, 'x', 0)")
+        other.commit()
+        assert archived_years(conn) == []
+        monkeypatch.setattr(partitions, "ARCHIVE_CACHE_S", 0.0)
+        assert archived_years(conn) == [2001]
+        monkeypatch.setattr(partitions, "ARCHIVE_CACHE_S", 60.0)
+
+        # ...while record_archive in this process invalidates at once
+        record_archive(conn, cur, 2002, 5, "y")
+        conn.commit()
+        assert archived_years(conn) == [2001, 2002]
+        assert archived_years(conn, 2002, 2010) == [2002]
+    finally:
+        conn.close()
+        other.close()
+
+
+def test_training_sets_reload_after_compaction(farm, isolated_db):
+    from crop_tracker.dataversion import get_data_version
+    from crop_tracker.prediction import incremental_training, resolve_profile
+
+    def training():
+        conn = get_db(user_id=farm)
+        try:
+            cur = conn.cursor()
+            type_id = conn.execute("SELECT crop_type_id FROM crops WHERE name = 'Maize'").fetchone()[0]
+            samples, _ = incremental_training(cur, False, farm, type_id, resolve_profile("Maize"),
+                                              get_data_version(conn, cur, farm))
+            return len(samples)
+        finally:
+            conn.close()
+
+    assert training() == 4
+    conn, cur = schema_conn()
+    compact(conn, cur, 2021)
+    conn.close()
+    assert training() == 1
@@ -0,0 +1,35 @@
+# test_prediction_store.py — Freshness of materialized predictions
+from crop_tracker import prediction
+from crop_tracker.priors import snapshot_generation, refresh_priors
+
+
+def test_stored_prediction_served_until_priors_change(client, make_user, add_crop, add_harvest, monkeypatch):
+    user = make_user()
+    crop = add_crop(user)
+    add_harvest(crop, user, "2024-08-01", 1500)
+    # load the snapshot now rather than racing the refresher's first load
+    refresh_priors()
+    prediction.refresh_user_predictions(user)
+
+    resp = client.get(f"/api/predict/{crop}?user_id={user}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Prediction-Source"] == "stored"
+
+    current = prediction.priors_generation()
+    monkeypatch.setattr(prediction, "priors_generation", lambda: current + 1)
+    resp = client.get(f"/api/predict/{crop}?user_id={user}")
+    assert resp.headers["X-Prediction-Source"] == "inline"
+
+    prediction.refresh_user_predictions(user)
+    resp = client.get(f"/api/predict/{crop}?user_id={user}")
+    assert resp.headers["X-Prediction-Source"] == "stored"
+
+
+def test_generation_ignores_profiles_below_min_samples():
+    served = {("maize", 0): {"n": 500, "baseline": 900.0, "min": 400.0, "max": 1500.0}}
+    thin = {("beans", 3): {"n": 2, "baseline": 300.0, "min": 200.0, "max": 400.0}}
+    assert snapshot_generation({}) == 0
+    assert snapshot_generation(thin) == 0
+    assert snapshot_generation({**served, **thin}) == snapshot_generation(served) != 0
+    moved = {("maize", 0): dict(served[("maize", 0)], baseline=950.0)}
+    assert snapshot_generation(moved) != snapshot_generation(served)
@@ -0,0 +1,33 @@
+# test_priors.py — crop_prior_hist maintenance
+from crop_tracker import priors
+from crop_tracker.model import get_db
+
+
+def prior_counts():
+    conn = get_db()
+    try:
+        rows = priors.read_prior_hist(conn, conn.cursor())
+        return {(r["crop_name"], r["month"], r["bucket"]): r["count"] for r in rows}
+    finally:
+        conn.close()
+
+
+def test_rebuild_replaces_counts_and_matches_incremental(make_user, add_crop, add_harvest):
+    user = make_user()
+    crop = add_crop(user, name="Sorghum", area=1.5, planting_date="2024-04-10")
+    for amount in (800, 950, 1100):
+        add_harvest(crop, user, "2024-08-01", amount)
+    incremental = prior_counts()
+
+    priors.rebuild_crop_priors()
+    priors.rebuild_crop_priors()
+    assert prior_counts() == incremental
+    assert sum(n for (name, month, _), n in incremental.items() if name == "sorghum" and month == 4) == 3
+
+
+def test_backfill_leaves_a_filled_table_alone(make_user, add_crop, add_harvest):
+    user = make_user()
+    add_harvest(add_crop(user, name="Rice"), user, "2024-07-01", 700)
+    before = prior_counts()
+    assert priors.rebuild_crop_priors(backfill=True) == 0
+    assert prior_counts() == before
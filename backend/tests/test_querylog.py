@@ -0,0 +1,27 @@
+from crop_tracker import querylog
+from crop_tracker.querylog import normalize_sql
+
+
+def test_normalize_sql_collapses_literals_and_lists():
+    assert normalize_sql("SELECT *  FROM crops\n LIMIT 20 OFFSET 40") == normalize_sql("SELECT * FROM crops LIMIT 5 OFFSET 0")
+    assert normalize_sql("PRAGMA user_version = 9") == "PRAGMA user_version = N"
+    assert normalize_sql("SELECT 1 FROM t WHERE id IN (?, ?, ?)") == normalize_sql("SELECT 1 FROM t WHERE id IN (?, ?)")
+    assert normalize_sql("WITH y (year) AS (VALUES (?), (?)) SELECT 1") == normalize_sql("WITH y (year) AS (VALUES (?), (?), (?)) SELECT 1")
+
+
+def test_normalize_sql_keeps_strings_and_identifiers():
+    sql = "SELECT strftime('%Y', date), printf('%02d', 3) FROM harvests_y2024"
+    assert normalize_sql(sql) == "SELECT strftime('%Y', date), printf('%02d', N) FROM harvests_y2024"
+
+
+def test_statement_table_is_bounded(monkeypatch):
+    monkeypatch.setattr(querylog, "QUERY_STATS_MAX", 3)
+    querylog.reset_stats()
+    for table in ("a", "b", "c", "d"):
+        querylog.record_statement(None, f"SELECT * FROM {table}", None, 1.0)
+    querylog.record_statement(None, "SELECT * FROM b", None, 1.0)
+    querylog.record_statement(None, "SELECT * FROM e", None, 1.0)
+
+    kept = {s["sql"]: s["calls"] for s in querylog.top_statements(10)}
+    assert kept == {"SELECT * FROM b": 2, "SELECT * FROM d": 1, "SELECT * FROM e": 1}
+    querylog.reset_stats()
@@ -0,0 +1,120 @@
+# test_replicas.py — Read routing over sqlite:/// replicas
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from crop_tracker import replicas
+from crop_tracker.model import get_db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+
+def replica_file(path, name):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE whoami (name TEXT)")
+    conn.execute("INSERT INTO whoami VALUES (?)", (name,))
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(replicas, "time", SimpleNamespace(time=clock.time, monotonic=clock.monotonic))
+    monkeypatch.setattr(replicas, "_last_write", {})
+    monkeypatch.setattr(replicas, "_next", 0)
+    return clock
+
+
+@pytest.fixture
+def use_replicas(monkeypatch, tmp_path, clock):
+    """use_replicas("a", "b", ...) routes reads over replica files named so; None is an unreachable one."""
+    def use(*names):
+        urls = [replica_file(tmp_path / f"{n}.db", n) if n else f"sqlite:///{tmp_path}/missing/down.db"
+                for n in names]
+        monkeypatch.setattr(replicas, "_replicas", [replicas.Replica(u) for u in urls])
+        return replicas._replicas
+    return use
+
+
+def served_by(user_id=None):
+    conn = get_db("read", user_id)
+    try:
+        return conn.execute("SELECT name FROM whoami").fetchone()[0]
+    except sqlite3.OperationalError:
+        return "primary"     # the primary has no whoami table
+    finally:
+        conn.close()
+
+
+def test_reads_rotate_round_robin(use_replicas):
+    pool = use_replicas("a", "b", "c")
+    assert [served_by() for _ in range(6)] == ["a", "b", "c", "a", "b", "c"]
+    assert [r.reads for r in pool] == [2, 2, 2]
+
+
+def test_replica_connections_are_read_only(use_replicas):
+    use_replicas("a")
+    conn = get_db("read")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO whoami VALUES ('x')")
+    finally:
+        conn.close()
+
+
+def test_failed_replica_is_skipped_until_retry(use_replicas, clock, monkeypatch):
+    monkeypatch.setattr(replicas, "REPLICA_RETRY_S", 30.0)
+    pool = use_replicas("a", None, "b")
+    assert [served_by() for _ in range(4)] == ["a", "b", "a", "b"]
+    down = pool[1]
+    assert down.failures == 1 and down.down_until == clock.now + 30.0
+    assert not down.state()["healthy"]
+
+    clock.now += 29.0
+    assert [served_by() for _ in range(2)] == ["a", "b"]
+    assert down.failures == 1                    # not retried inside the window
+
+    clock.now += 2.0
+    assert [served_by() for _ in range(2)] == ["a", "b"]
+    assert down.failures == 2                    # retried once the window passed
+
+
+def test_writers_read_from_the_primary_while_sticky(use_replicas, clock, monkeypatch, make_user, add_crop):
+    monkeypatch.setattr(replicas, "READ_STICKY_S", 10.0)
+    writer, reader = make_user(), make_user()
+    use_replicas("a")
+    add_crop(writer)
+
+    assert served_by(writer) == "primary"
+    assert served_by(reader) == "a"
+    assert served_by() == "a"
+    clock.now += 9.0
+    assert served_by(writer) == "primary"
+    clock.now += 2.0
+    assert served_by(writer) == "a"
+
+
+def test_falls_back_to_the_primary_without_a_healthy_replica(use_replicas):
+    pool = use_replicas(None, None)
+    assert served_by() == "primary"
+    assert [r.failures for r in pool] == [1, 1]
+    # both are now marked down: no connection attempts until they retry
+    assert served_by() == "primary"
+    assert [r.failures for r in pool] == [1, 1]
+
+
+def test_no_replicas_means_the_primary(use_replicas):
+    use_replicas()
+    assert replicas.read_connection() is None
+    assert served_by() == "primary"
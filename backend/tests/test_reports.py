@@ -0,0 +1,84 @@
+# test_reports.py — Report queue (claim, dedupe) and access
+import json
+
+from crop_tracker import reports
+from crop_tracker.orgs import join_org
+
+
+def post_report(client, requester, user_ids, **extra):
+    body = {"user_id": requester, "user_ids": user_ids, "from": 2023, "to": 2024, **extra}
+    return client.post("/api/reports", json=body)
+
+
+def manage(client, manager, *members):
+    org_id = client.post("/api/orgs", json={"user_id": manager, "name": f"Coop {manager}"}).get_json()["org_id"]
+    for member in members:
+        join_org(org_id, member, "member")
+    return org_id
+
+
+def test_same_spec_from_same_requester_is_deduplicated(client, make_user):
+    user = make_user()
+    first = post_report(client, user, [user])
+    again = post_report(client, user, [user])
+    assert first.status_code == again.status_code == 202
+    assert again.get_json()["id"] == first.get_json()["id"]
+    assert again.get_json()["deduplicated"] is True
+    assert post_report(client, user, [user], top=3).get_json()["id"] != first.get_json()["id"]
+
+
+def test_a_job_is_claimed_by_one_worker_and_downloadable(client, make_user, add_crop, add_harvest, db):
+    user = make_user()
+    add_harvest(add_crop(user), user, "2024-05-01", 250)
+    report_id = post_report(client, user, [user]).get_json()["id"]
+
+    cur = db.cursor()
+    job = None
+    while job is None or job["id"] != report_id:   # earlier tests' jobs are queued too
+        job = reports.claim_job(db, cur, "worker-a")
+        assert job is not None
+    while (other := reports.claim_job(db, cur, "worker-b")) is not None:
+        assert other["id"] != report_id
+    cur.execute("SELECT status, worker FROM report_jobs WHERE id = ?", (report_id,))
+    assert tuple(cur.fetchone()) == ("running", "worker-a")
+
+    assert client.get(f"/api/reports/{report_id}/download?user_id={user}").status_code == 409
+    reports.run_job(db, cur, job, "worker-a")
+    status = client.get(f"/api/reports/{report_id}?user_id={user}").get_json()
+    assert status["status"] == "done" and status["progress"] == 1.0
+
+    body = json.loads(client.get(f"/api/reports/{report_id}/download?user_id={user}").data)
+    assert body["users"][str(user)]["top_crops_yearly"]["top_names"] == ["Maize"]
+
+
+def test_reports_cover_only_self_and_managed_members(client, make_user):
+    manager, member, stranger = make_user(), make_user(), make_user()
+    manage(client, manager, member)
+
+    resp = post_report(client, manager, [manager, member, stranger])
+    assert resp.status_code == 403
+    assert resp.get_json()["user_ids"] == [stranger]
+    assert post_report(client, member, [manager]).status_code == 403
+    assert post_report(client, manager, [manager, member]).status_code == 202
+    assert post_report(client, None, [manager]).status_code == 401
+
+
+def test_only_the_requester_can_read_a_report(client, make_user):
+    manager, member = make_user(), make_user()
+    org_id = manage(client, manager, member)
+    report_id = post_report(client, manager, [member]).get_json()["id"]
+
+    assert client.get(f"/api/reports/{report_id}?user_id={manager}").status_code == 200
+    assert client.get(f"/api/reports/{report_id}?user_id={member}").status_code == 404
+    assert client.get(f"/api/reports/{report_id}/download?user_id={member}").status_code == 404
+    assert client.get(f"/api/reports/{report_id}").status_code == 401
+
+    client.delete(f"/api/orgs/{org_id}/members/{member}?user_id={member}")
+    assert client.get(f"/api/reports/{report_id}?user_id={manager}").status_code == 404
+
+
+def test_an_empty_claim_ends_its_read(recording_db):
+    cur = recording_db.cursor()
+    assert reports.claim_job(recording_db, cur, "worker-a") is None
+    assert recording_db.log == ["SELECT id", "commit()"]
+    assert not recording_db.in_transaction
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from crop_tracker.ridge import RidgeModel, bootstrap_coefficients
+
+# planting month, kg/acre
+MONTH_SAMPLES = [(3, 420.0), (3, 510.0), (4, 640.0), (6, 700.0), (9, 880.0), (11, 960.0), (11, 905.0)]
+
+
+def samples(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    out, targets = [], []
+    for _ in range(n):
+        s = {"month": int(rng.integers(1, 13)), "area": float(rng.uniform(0.5, 6)), "year": int(rng.integers(2015, 2026))}
+        out.append(s)
+        targets.append(600 + 20 * s["month"] + 5 * (s["year"] - 2020) + rng.normal(0, 30))
+    return out, targets
+
+
+def month_model(**kwargs):
+    return RidgeModel(("month",), lam=0.5, **kwargs).fit([{"month": m} for m, _ in MONTH_SAMPLES],
+                                                         [y for _, y in MONTH_SAMPLES])
+
+
+def test_default_reproduces_the_original_month_model():
+    # train_ridge_month_model (lam on both raw diagonal entries) on MONTH_SAMPLES
+    assert np.allclose(month_model().coef, [253.42876389356687, 66.26136746379252], rtol=1e-12)
+
+
+def test_tiny_penalty_matches_least_squares_with_year_feature():
+    s, t = samples()
+    model = RidgeModel(("month", "area", "year"), lam=1e-9, standardize=True).fit(s, t)
+    X, y = model.design(s, t)
+    assert np.allclose(model.coef, np.linalg.lstsq(X, y, rcond=None)[0], rtol=1e-6)
+
+
+def test_raw_penalty_matches_the_augmented_system_with_year_feature():
+    s, t = samples()
+    model = RidgeModel(("month", "area", "year"), lam=0.5).fit(s, t)
+    X, y = model.design(s, t)
+    A = np.vstack([X, np.sqrt(0.5) * np.eye(4)])
+    expected = np.linalg.lstsq(A, np.concatenate([y, np.zeros(4)]), rcond=None)[0]
+    assert np.allclose(model.coef, expected, rtol=1e-7)
+
+
+def test_standardized_intercept_is_not_penalized():
+    model = RidgeModel(("month",), lam=50.0, standardize=True).fit([{"month": m} for m in range(1, 13)], [700.0] * 12)
+    assert abs(model.predict_one({"month": 6}) - 700.0) < 1e-9
+    # the original penalty shrinks the intercept too
+    assert RidgeModel(("month",), lam=50.0).fit([{"month": m} for m in range(1, 13)], [700.0] * 12).coef[0] < 700.0
+
+
+@pytest.mark.parametrize("standardize", [False, True])
+def test_rank_one_updates_match_a_full_refit(standardize):
+    s, t = samples(300, seed=4)
+    features = ("month", "area", "year")
+    inc = RidgeModel(features, standardize=standardize)
+    for sample, y in zip(s, t):
+        inc.add_sample(sample, y)
+    # drop every third row again, interleaved with re-solves
+    for i in range(0, 300, 3):
+        inc.remove_sample(s[i], t[i])
+        if i % 30 == 0:
+            inc.solve()
+    kept = [i for i in range(300) if i % 3]
+    full = RidgeModel(features, standardize=standardize).fit([s[i] for i in kept], [t[i] for i in kept])
+
+    assert inc.n == full.n == 200
+    assert np.allclose(inc.coef, full.coef, rtol=1e-8, atol=1e-8)
+    assert np.allclose(inc.feature_means(), full.feature_means())
+
+
+def test_removing_every_row_empties_the_model():
+    model = month_model()
+    for m, y in MONTH_SAMPLES:
+        model.remove_sample({"month": m}, y)
+    assert model.n == 0 and model.coef is None
+    model.add_sample({"month": 5}, 600.0)
+    assert model.n == 1 and np.allclose(model.feature_means(), [1.0, 5.0])
+
+
+@pytest.mark.parametrize("standardize", [False, True])
+def test_bootstrap_centers_on_the_fit(standardize):
+    s, t = samples()
+    model = RidgeModel(("month", "area", "year"), lam=0.5, standardize=standardize).fit(s, t)
+    X, y = model.design(s, t)
+    boot = bootstrap_coefficients(X, y, 0.5, 300, np.random.default_rng(1), standardize=standardize)
+    assert boot.shape == (300, 4)
+    x = model.row({"month": 5, "area": 2.0, "year": 2024})
+    assert abs(np.median(boot @ x) - model.predict_one({"month": 5, "area": 2.0, "year": 2024})) < 15
+
+
+def test_predictions_default_to_the_original_model():
+    from crop_tracker.prediction import train_ridge_model
+    model = train_ridge_model([({"month": m}, y) for m, y in MONTH_SAMPLES])
+    assert not model.standardize
+    assert np.allclose(model.coef, [253.42876389356687, 66.26136746379252], rtol=1e-12)
@@ -0,0 +1,62 @@
+# test_scenarios.py — POST /api/predict/scenarios input validation
+import pytest
+
+from crop_tracker import prediction
+
+
+def scenarios(client, user, **body):
+    body.setdefault("crop_name", "Maize")
+    body.setdefault("areas", [1, 2])
+    body.setdefault("planting_dates", ["2025-03-01"])
+    return client.post(f"/api/predict/scenarios?user_id={user}", json=body)
+
+
+def test_grid_is_ranked_and_cut_to_top(client, make_user):
+    user = make_user()
+    resp = scenarios(client, user, areas={"min": 1, "max": 3, "step": 0.5}, top=3, rank_by="total")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["scenario_count"] == 5
+    assert len(body["scenarios"]) == 3
+    totals = [s["predicted_yield"] for s in body["scenarios"]]
+    assert totals == sorted(totals, reverse=True)
+
+
+@pytest.mark.parametrize("top", ["abc", 0, -2, [3]])
+def test_invalid_top_is_rejected(client, make_user, top):
+    resp = scenarios(client, make_user(), top=top)
+    assert resp.status_code == 400
+    assert "top" in resp.get_json()["error"]
+
+
+@pytest.mark.parametrize("areas", [
+    {"min": 1, "max": 5, "step": 0},
+    {"min": 1, "max": "inf", "step": 1},
+    {"min": "nan", "max": 5},
+    [1, "nan"],
+    [1, -2],
+])
+def test_invalid_areas_are_rejected(client, make_user, areas):
+    assert scenarios(client, make_user(), areas=areas).status_code == 400
+
+
+def test_oversized_grid_is_rejected_before_it_is_built(client, make_user, monkeypatch):
+    def build(spec):
+        raise AssertionError("grid materialized")
+    monkeypatch.setattr(prediction, "parse_area_values", build)
+    monkeypatch.setattr(prediction, "parse_planting_dates", build)
+
+    resp = scenarios(
+        client, make_user(),
+        areas={"min": 0.001, "max": 1e12, "step": 0.001},
+        planting_dates={"from": "2000-01-01", "to": "2099-12-31", "step_days": 1},
+    )
+    assert resp.status_code == 400
+    assert "Too many scenarios" in resp.get_json()["error"]
+
+
+def test_range_counts_match_the_built_grid():
+    spec = {"min": 0.5, "max": 5, "step": 0.5}
+    assert prediction.area_count(spec) == len(prediction.parse_area_values(spec)) == 10
+    dates = {"from": "2025-01-01", "to": "2025-12-31", "step_days": 14}
+    assert prediction.planting_date_count(dates) == len(prediction.parse_planting_dates(dates)) == 27
@@ -0,0 +1,103 @@
+# test_scheduler.py — Cron parsing, next-run computation and the tick loop
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from crop_tracker import scheduler
+from crop_tracker.scheduler import Job, parse_cron, cron_next
+
+
+def epoch(*args):
+    return (datetime(*args) - datetime(1970, 1, 1)).total_seconds()
+
+
+def test_fields_expand_lists_ranges_and_steps():
+    minutes, hours, days, months, weekdays, either = parse_cron("*/15 1-3,22 1 */6 *")
+    assert minutes == {0, 15, 30, 45}
+    assert hours == {1, 2, 3, 22}
+    assert (days, months) == ({1}, {1, 7})
+    assert weekdays == set(range(7)) and not either
+
+
+@pytest.mark.parametrize("expr", ["0 0 * * 7", "0 0 * * 0", "0 0 * * 0,7"])
+def test_sunday_is_0_or_7(expr):
+    assert parse_cron(expr)[4] == {0}
+
+
+@pytest.mark.parametrize("expr", ["* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *",
+                                  "* * * * 8", "5-1 * * * *", "*/0 * * * *", "x * * * *"])
+def test_invalid_expressions_are_rejected(expr):
+    with pytest.raises(ValueError):
+        parse_cron(expr)
+
+
+@pytest.mark.parametrize("expr, after, expected", [
+    ("30 2 * * *", epoch(2026, 3, 10, 1, 0), epoch(2026, 3, 10, 2, 30)),
+    ("30 2 * * *", epoch(2026, 3, 10, 2, 30), epoch(2026, 3, 11, 2, 30)),    # strictly after
+    ("*/15 * * * *", epoch(2026, 3, 10, 23, 50, 20), epoch(2026, 3, 11, 0, 0)),
+    ("0 4 * * 7", epoch(2026, 10, 19, 12, 0), epoch(2026, 10, 25, 4, 0)),     # next Sunday
+    ("0 0 1 * *", epoch(2026, 12, 15), epoch(2027, 1, 1)),
+    ("0 0 29 2 *", epoch(2026, 3, 1), epoch(2028, 2, 29)),
+    # day-of-month OR weekday when both are restricted: the 13th, or a Friday
+    ("0 9 13 * 5", epoch(2026, 10, 14), epoch(2026, 10, 16, 9, 0)),
+])
+def test_cron_next(expr, after, expected):
+    assert cron_next(parse_cron(expr), after) == expected
+
+
+def test_impossible_dates_never_match():
+    with pytest.raises(ValueError):
+        cron_next(parse_cron("0 0 31 2 *"), epoch(2026, 1, 1))
+
+
+@pytest.fixture
+def scheduler_db(recording_db, monkeypatch):
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    monkeypatch.setattr(scheduler, "_local", {})
+    return recording_db
+
+
+def test_tick_ends_its_read_when_nothing_is_due(scheduler_db):
+    runs = []
+    scheduler.register(Job("nightly", lambda: runs.append(1), interval_s=3600))
+    cur = scheduler_db.cursor()
+    scheduler.seed_jobs(scheduler_db, cur, time.time())
+    scheduler_db.log.clear()
+
+    scheduler.tick(scheduler_db, cur)
+    assert runs == []
+    assert scheduler_db.log == ["SELECT name,", "commit()"]
+    assert not scheduler_db.in_transaction
+
+
+def test_tick_claims_runs_and_releases_a_due_job(scheduler_db):
+    runs = []
+    scheduler.register(Job("startup", lambda: runs.append(1), interval_s=60, at_start=True))
+    cur = scheduler_db.cursor()
+    scheduler.seed_jobs(scheduler_db, cur, time.time())
+    scheduler_db.log.clear()
+
+    scheduler.tick(scheduler_db, cur)
+    assert runs == [1]
+    assert scheduler_db.log[:2] == ["SELECT name,", "commit()"]
+    assert scheduler_db.log[-2:] == ["commit()", "COMMIT"] and not scheduler_db.in_transaction
+    row = scheduler_db.execute("SELECT locked_until, last_status, next_run_at FROM scheduler_jobs").fetchone()
+    assert row["locked_until"] == 0 and row["last_status"] == "ok"
+    assert row["next_run_at"] > time.time() + 50
+
+
+def test_purge_reset_tokens_drops_expired_ones(isolated_db):
+    from crop_tracker.model import get_db
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    conn = get_db()
+    conn.execute("INSERT INTO users (email, username, password) VALUES ('a@b.c', 'a', 'x')")
+    for token, expiry in (("old", now - timedelta(minutes=1)), ("new", now + timedelta(hours=1))):
+        conn.execute("INSERT INTO reset_tokens (user_id, token, expiry) VALUES (1, ?, ?)", (token, expiry.isoformat()))
+    conn.commit()
+    conn.close()
+
+    assert scheduler.purge_reset_tokens() == {"purged": 1}
+    conn = get_db()
+    assert [r[0] for r in conn.execute("SELECT token FROM reset_tokens")] == ["new"]
+    conn.close()
@@ -0,0 +1,88 @@
+# test_shards.py — Moving a user between SQLite shards, including a re-run after a crash
+import pytest
+
+from crop_tracker import shards, priors
+from crop_tracker.shards import open_shard, move_user, lookup_shard, DIRECTORY
+
+
+@pytest.fixture
+def tenant_mode(monkeypatch, db):
+    """Call after seeding: rows written before it stay in the directory."""
+    yield lambda: monkeypatch.setattr(shards, "SHARD_MODE", "tenant")
+    shards._map.clear()
+
+
+def user_rows(conn, user_id):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM crops WHERE user_id = ?", (user_id,))
+    crops = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM harvests h JOIN crops c ON h.crop_id = c.id WHERE c.user_id = ?", (user_id,))
+    return crops, cur.fetchone()[0]
+
+
+def prior_total(conn):
+    return conn.execute("SELECT COALESCE(SUM(count), 0) FROM crop_prior_hist").fetchone()[0]
+
+
+def seeded_user(make_user, add_crop, add_harvest):
+    user = make_user()
+    crop = add_crop(user, "Sorghum", 3.0, "2024-02-01")
+    add_harvest(crop, user, "2024-06-01", 400)
+    add_harvest(crop, user, "2024-07-01", 500)
+    return user
+
+
+def test_move_copies_rows_and_routes_requests(client, make_user, add_crop, add_harvest, db, tenant_mode):
+    user = seeded_user(make_user, add_crop, add_harvest)
+    before = client.get(f"/api/harvests?user_id={user}").get_json()
+    tenant_mode()
+
+    target = f"user_{user}"
+    result = move_user(user, target)
+    assert result["rows"]["crops"] == 1 and result["rows"]["harvests"] == 2
+    assert lookup_shard(user) == target
+    assert user_rows(db, user) == (0, 0)
+
+    shard = open_shard(target, attach_directory=False)
+    try:
+        assert user_rows(shard, user) == (1, 2)
+    finally:
+        shard.close()
+    assert client.get(f"/api/harvests?user_id={user}").get_json() == before
+    # already there: a no-op
+    assert move_user(user, target) is None
+
+
+def test_move_rerun_after_a_crash_is_idempotent(monkeypatch, make_user, add_crop, add_harvest, db, tenant_mode):
+    user = seeded_user(make_user, add_crop, add_harvest)
+    tenant_mode()
+    target = f"user_{user}"
+    directory_priors = prior_total(db)
+
+    # crash between the target's commit and the source's
+    real = priors.apply_prior_deltas
+    calls = []
+
+    def crash_on_source(conn, cur, deltas):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("killed")
+        return real(conn, cur, deltas)
+    monkeypatch.setattr(priors, "apply_prior_deltas", crash_on_source)
+    with pytest.raises(RuntimeError):
+        move_user(user, target)
+    monkeypatch.setattr(priors, "apply_prior_deltas", real)
+
+    assert lookup_shard(user) == DIRECTORY
+    assert user_rows(db, user) == (1, 2)
+
+    move_user(user, target)
+    moved = directory_priors - prior_total(db)
+    assert moved > 0
+    shard = open_shard(target, attach_directory=False)
+    try:
+        assert user_rows(shard, user) == (1, 2)
+        # the first attempt's prior counts on the target are not counted twice
+        assert prior_total(shard) == moved
+    finally:
+        shard.close()
@@ -0,0 +1,104 @@
+# test_singleflight.py — Concurrent identical calls share one execution
+import threading
+
+import pytest
+
+from crop_tracker import singleflight
+
+
+def run_concurrently(n, key, fn):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = singleflight.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def gated(result=None, error=None):
+    """fn that blocks until released and counts its executions."""
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+    return fn, started, release, calls
+
+
+class CountingEvent(threading.Event):
+    waiting = 0
+
+    def wait(self, timeout=None):
+        CountingEvent.waiting += 1
+        return super().wait(timeout)
+
+
+@pytest.fixture(autouse=True)
+def counted_waits(monkeypatch):
+    class CountedInFlight(singleflight.InFlight):
+        def __init__(self):
+            super().__init__()
+            self.done = CountingEvent()
+    CountingEvent.waiting = 0
+    monkeypatch.setattr(singleflight, "InFlight", CountedInFlight)
+
+
+def until_waiting(n):
+    # release the leader only once every follower is parked on its InFlight
+    for _ in range(1000):
+        if CountingEvent.waiting >= n:
+            return
+        threading.Event().wait(0.005)
+    raise AssertionError(f"only {CountingEvent.waiting} of {n} followers waiting")
+
+
+def test_followers_share_the_leaders_result():
+    fn, started, release, calls = gated(result={"x": 1})
+    threads, results, errors = run_concurrently(1, "k1", fn)
+    assert started.wait(5)
+    followers, f_results, _ = run_concurrently(4, "k1", fn)
+    until_waiting(4)
+    release.set()
+    for t in threads + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results[0] == ({"x": 1}, False)
+    assert f_results == [({"x": 1}, True)] * 4
+    assert "k1" not in singleflight._calls
+
+
+def test_followers_get_the_leaders_exception():
+    fn, started, release, calls = gated(error=ValueError("boom"))
+    threads, _, errors = run_concurrently(1, "k2", fn)
+    assert started.wait(5)
+    followers, _, f_errors = run_concurrently(3, "k2", fn)
+    until_waiting(3)
+    release.set()
+    for t in threads + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) for e in errors + f_errors)
+
+
+def test_sequential_calls_run_fresh():
+    calls = []
+    for _ in range(3):
+        assert singleflight.do("k3", lambda: calls.append(1) or len(calls)) == (len(calls), False)
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("a, b", [("7", " 7 "), ("Maize", "maize"), ("007", "7")])
+def test_request_keys_normalize_arguments(a, b):
+    assert singleflight.normalize_arg(a) == singleflight.normalize_arg(b)
@@ -0,0 +1,76 @@
+# test_sketches.py — KLL rank error bounds and the percentile/distribution routes
+import random
+from bisect import bisect_left
+
+import pytest
+
+from crop_tracker.sketches import KllSketch
+
+
+def rank_of(sorted_values, x):
+    return bisect_left(sorted_values, x)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_quantiles_stay_within_the_reported_rank_error(seed):
+    rng = random.Random(seed)
+    random.seed(seed)   # compaction offsets
+    values = [rng.lognormvariate(6, 1) for _ in range(50_000)]
+    sketch = KllSketch(k=200)
+    sketch.update_many(values)
+    truth = sorted(values)
+
+    assert not sketch.exact()
+    bound = sketch.rank_error()
+    assert 0 < bound < 0.02 * len(values)
+    weighted = sketch.weighted()
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        estimate = sketch.quantile(q, weighted)
+        assert abs(rank_of(truth, estimate) - q * len(values)) <= bound + 1, q
+
+
+def test_merged_sketches_keep_their_bound():
+    random.seed(7)
+    rng = random.Random(7)
+    parts = [[rng.uniform(0, 1000) for _ in range(5_000)] for _ in range(8)]
+    merged = KllSketch.merged(KllSketch.from_bytes(_sketch(p).to_bytes()) for p in parts)
+    truth = sorted(v for p in parts for v in p)
+
+    assert merged.n == len(truth)
+    assert (merged.min, merged.max) == (truth[0], truth[-1])
+    median = merged.quantile(0.5)
+    assert abs(rank_of(truth, median) - len(truth) / 2) <= merged.rank_error() + 1
+
+
+def test_small_inputs_are_exact():
+    sketch = _sketch([5.0, 1.0, 3.0])
+    assert sketch.exact() and sketch.rank_error() == 0
+    assert [sketch.quantile(q) for q in (0.0, 0.5, 1.0)] == [1.0, 3.0, 5.0]
+
+
+def _sketch(values):
+    s = KllSketch()
+    s.update_many(values)
+    return s
+
+
+@pytest.mark.parametrize("p", ["nan", "50,inf", "-1", "101", "abc"])
+def test_percentiles_reject_bad_p(client, make_user, p):
+    resp = client.get(f"/api/harvests/percentiles?user_id={make_user()}&from=2020&to=2025&p={p}")
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize("edges", ["nan", "10,inf", "50,10", "0,10"])
+def test_distribution_rejects_bad_edges(client, make_user, edges):
+    resp = client.get(f"/api/harvests/distribution?user_id={make_user()}&from=2020&to=2025&edges={edges}")
+    assert resp.status_code == 400
+
+
+def test_percentiles_route(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    crop = add_crop(user)
+    for kg in (10, 20, 30, 40, 50):
+        add_harvest(crop, user, "2024-06-01", kg)
+    body = client.get(f"/api/harvests/percentiles?user_id={user}&from=2024&to=2024&p=50").get_json()
+    assert body["n"] == 5 and body["exact"] is True
+    assert body["percentiles"] == [{"p": 50.0, "value": 30.0, "low": 30.0, "high": 30.0}]
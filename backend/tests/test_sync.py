@@ -0,0 +1,48 @@
+# test_sync.py — Delta cursors and tombstones on GET /api/sync
+def sync(client, user_id, since):
+    resp = client.get(f"/api/sync?user_id={user_id}&since={since}")
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def test_full_sync_then_deltas_and_tombstones(client, make_user, add_crop, add_harvest):
+    user = make_user()
+    kept = add_crop(user, "Maize")
+    gone = add_crop(user, "Beans")
+    add_harvest(gone, user, "2024-07-01", 100)
+
+    first = sync(client, user, 0)
+    assert first["full"]
+    assert {c["id"] for c in first["crops"]} == {kept, gone}
+    assert len(first["harvests"]) == 1
+    harvest_id = first["harvests"][0]["id"]
+
+    # nothing changed: an empty delta at the same cursor
+    idle = sync(client, user, first["cursor"])
+    assert not idle["full"]
+    assert (idle["crops"], idle["harvests"], idle["cursor"]) == ([], [], first["cursor"])
+
+    add_harvest(kept, user, "2024-08-01", 200)
+    assert client.delete(f"/api/crop/{gone}/{user}").status_code == 200
+
+    delta = sync(client, user, first["cursor"])
+    assert delta["cursor"] > first["cursor"]
+    assert [h["crop_id"] for h in delta["harvests"]] == [kept]
+    assert delta["crops"] == []
+    assert delta["deleted"] == {"crops": [gone], "harvests": [harvest_id]}
+
+    # the tombstones are not replayed past their version
+    assert sync(client, user, delta["cursor"])["deleted"] == {"crops": [], "harvests": []}
+
+
+def test_cursor_from_the_future_forces_a_full_resync(client, make_user, add_crop):
+    user = make_user()
+    crop = add_crop(user)
+    data = sync(client, user, 10_000)
+    assert data["full"]
+    assert [c["id"] for c in data["crops"]] == [crop]
+
+
+def test_sync_validates_its_arguments(client, make_user):
+    assert client.get("/api/sync?since=0").status_code == 401
+    assert client.get(f"/api/sync?user_id={make_user()}&since=-1").status_code == 400
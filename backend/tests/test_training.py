@@ -0,0 +1,81 @@
+# test_training.py — Incrementally maintained training sets match a full reload
+import numpy as np
+
+from crop_tracker.model import get_db
+from crop_tracker.dataversion import get_data_version
+from crop_tracker import prediction
+from crop_tracker.prediction import incremental_training, load_training_samples, train_ridge_model, resolve_profile
+
+
+def crop_type_of(conn, crop_id):
+    return conn.execute("SELECT crop_type_id FROM crops WHERE id = ?", (crop_id,)).fetchone()[0]
+
+
+def both(user, crop_type_id, name="Maize"):
+    """(incremental, full) (samples, model) at the user's current version."""
+    conn = get_db(user_id=user)
+    try:
+        cur = conn.cursor()
+        version = get_data_version(conn, cur, user)
+        profile = resolve_profile(name)
+        inc = incremental_training(cur, False, user, crop_type_id, profile, version)
+        samples = load_training_samples(cur, False, user, crop_type_id, profile)
+        return inc, (samples, train_ridge_model(samples))
+    finally:
+        conn.close()
+
+
+def assert_same(inc, full):
+    (inc_samples, inc_model), (full_samples, full_model) = inc, full
+    key = lambda sy: (sorted(sy[0].items()), sy[1])
+    assert sorted(inc_samples, key=key) == sorted(full_samples, key=key)
+    if full_model is None:
+        assert inc_model is None
+    else:
+        assert np.allclose(inc_model.coef, full_model.coef, rtol=1e-9)
+
+
+def test_deltas_match_a_full_reload(client, db, make_user, add_crop, add_harvest):
+    user = make_user()
+    a = add_crop(user, "Maize", 2.0, "2023-03-01")
+    b = add_crop(user, "Maize", 4.0, "2023-10-01")
+    type_id = crop_type_of(db, a)
+    for i, kg in enumerate((900, 1100, 1000)):
+        add_harvest(a, user, f"2023-07-{i + 1:02d}", kg)
+    add_harvest(b, user, "2024-02-01", 2600)
+
+    assert_same(*both(user, type_id))
+    full_loads = prediction.metrics.snapshot()["counters"].get("predictions.training_full", 0)
+
+    # new harvest, crop edit (area and month), a second crop's harvests, a delete
+    add_harvest(b, user, "2024-02-15", 3000)
+    assert client.put(f"/api/crop/{b}/{user}",
+                      json={"name": "Maize", "area": 5.0, "planting_date": "2023-04-01"}).status_code == 200
+    c = add_crop(user, "maize", 1.0, "2024-03-01")
+    add_harvest(c, user, "2024-08-01", 500)
+    add_harvest(c, user, "2024-08-02", 520)
+    assert client.delete(f"/api/crop/{a}/{user}").status_code == 200
+
+    inc, full = both(user, type_id)
+    assert_same(inc, full)
+    assert len(full[0]) == 4
+    counters = prediction.metrics.snapshot()["counters"]
+    assert counters.get("predictions.training_full", 0) == full_loads
+    assert counters.get("predictions.training_incremental", 0) >= 1
+
+
+def test_crop_changing_type_leaves_the_old_set(client, db, make_user, add_crop, add_harvest):
+    user = make_user()
+    a = add_crop(user, "Beans", 1.0, "2023-03-01")
+    keep = add_crop(user, "Beans", 1.0, "2023-05-01")
+    beans = crop_type_of(db, a)
+    for crop in (a, keep):
+        for day in (1, 2):
+            add_harvest(crop, user, f"2023-08-{day:02d}", 300 + day)
+    assert_same(*both(user, beans, "Beans"))
+
+    assert client.put(f"/api/crop/{a}/{user}",
+                      json={"name": "Sorghum", "area": 1.0, "planting_date": "2023-03-01"}).status_code == 200
+    inc, full = both(user, beans, "Beans")
+    assert_same(inc, full)
+    assert len(inc[0]) == 2 and inc[1] is None